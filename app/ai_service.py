@@ -5,18 +5,123 @@ import base64
 import random
 import time
 import concurrent.futures
+import functools
+import logging
 import re
-from typing import List, Dict, Any, Union
+import threading
+from typing import List, Dict, Any, Union, Callable, Optional
 
-from PIL import Image
 from django.core.files.uploadedfile import UploadedFile
-import google.generativeai as genai
 from django.conf import settings
+from .models import Style
 from .product_data import PRODUCT_DATABASE 
+from .catalog_snapshot import SOURCE_CATALOG, SOURCE_NAMES, CatalogSnapshot, get_catalog_snapshot
+from .instrumentation import stage, EVENT_COUNTERS
+from .stream_parser import IncrementalJSONObjectParser, StreamFormatError
+from .rate_limit import INTERACTIVE, get_gemini_limiter
+from .token_budget import RequestUsage, count_input_tokens, estimate_image_tokens, plan_image_budget, scaled_size
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_genai():
+    """延遲載入 google.generativeai（含 grpc/protobuf），並在首次使用前設定 SSL 憑證"""
+    import ssl
+    import certifi
+    os.environ["GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"] = certifi.where()
+    ssl._create_default_https_context = ssl._create_unverified_context
+    import google.generativeai as genai
+    return genai
+
+
+_JSON_SCAN_TOKENS = re.compile(r'[{}"\\]')
+_TRAILING_COMMA_TOKENS = re.compile(r'[,}\]"\\]')
+# JSON 物件必以 {"key" 或 {} 開頭，用來略過說明文字中的 {x} 等片段
+_JSON_OBJECT_START = re.compile(r'\{\s*["}]')
+
+
+def _scan_json_object_spans(text: str):
+    """
+    單次掃描找出大括號平衡的 JSON 物件範圍 (start, end)，正確處理字串與跳脫字元。
+    依序產生頂層物件；若最外層直到結尾都未閉合，再產生其內最外層的完整物件。
+    只以 finditer 跳到特殊字元，沒有回溯，時間與輸入長度成線性。
+    """
+    stack = []
+    inner = []
+    in_string = False
+    skip_until = -1
+    for match in _JSON_SCAN_TOKENS.finditer(text):
+        i = match.start()
+        if i < skip_until:
+            continue
+        ch = text[i]
+        if in_string:
+            if ch == '\\':
+                skip_until = i + 2
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            # 物件外的引號屬於說明文字，不視為 JSON 字串
+            in_string = bool(stack)
+        elif ch == '{':
+            stack.append(i)
+        elif ch == '}' and stack:
+            start = stack.pop()
+            if stack:
+                inner.append((len(stack), start, i + 1))
+            else:
+                inner.clear()
+                yield start, i + 1
+    if stack and inner:
+        min_depth = min(depth for depth, _, _ in inner)
+        for depth, start, end in inner:
+            if depth == min_depth:
+                yield start, end
+
+
+def _strip_trailing_commas(candidate: str) -> str:
+    """移除字串以外、緊接在 } 或 ] 之前的逗號（線性時間）"""
+    removals = []
+    last_comma = -1
+    in_string = False
+    skip_until = -1
+    for match in _TRAILING_COMMA_TOKENS.finditer(candidate):
+        i = match.start()
+        if i < skip_until:
+            continue
+        ch = candidate[i]
+        if in_string:
+            if ch == '\\':
+                skip_until = i + 2
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+            last_comma = -1
+        elif ch == ',':
+            last_comma = i
+        else:
+            if last_comma >= 0 and not candidate[last_comma + 1:i].strip():
+                removals.append(last_comma)
+            last_comma = -1
+    if not removals:
+        return candidate
+    parts = []
+    prev = 0
+    for pos in removals:
+        parts.append(candidate[prev:pos])
+        prev = pos + 1
+    parts.append(candidate[prev:])
+    return ''.join(parts)
 
 
 def _uploaded_file_to_image_payload(uploaded_file: UploadedFile) -> Dict[str, Any]:
     """將 Django UploadedFile 轉為圖片 payload，並進行壓縮與縮放"""
+    from PIL import Image
+
     MAX_SIZE = (1280, 1280)
     QUALITY = 85
     try:
@@ -45,30 +150,181 @@ def _uploaded_file_to_image_payload(uploaded_file: UploadedFile) -> Dict[str, An
         raise RuntimeError(f"處理圖片檔案 {getattr(uploaded_file,'name','unknown')} 錯誤: {e}")
 
 
+@functools.lru_cache(maxsize=None)
+def _available_model_names(api_key: str) -> tuple:
+    """列出支援 generateContent 的模型（去除 "models/" 前綴），同一行程只查詢一次"""
+    genai = _load_genai()
+    genai.configure(api_key=api_key)
+    return tuple(
+        m.name.split('/', 1)[-1] for m in genai.list_models()
+        if "generateContent" in getattr(m, 'supported_generation_methods', [])
+    )
+
+
+# 限流時預估的輸出 token 數（實際用量在回應後才知道）
+EXPECTED_OUTPUT_TOKENS = 1024
+# on_partial 收到此 key 時，先前推送的部分結果作廢（見 analyze_user_requirements）
+PARTIAL_RESET = '__reset__'
+# 1 坪 = 3.305785 平方公尺
+SQUARE_METERS_PER_PING = 3.305785
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+# 「4x3x2.8」「4 × 3 × 2.8 m」「4*3」等長寬(高)寫法
+_DIMENSIONS = re.compile(
+    r'^\s*(\d+(?:\.\d+)?)\s*(?:m|公尺|米)?\s*[xX×*]\s*(\d+(?:\.\d+)?)\s*(?:m|公尺|米)?'
+    r'(?:\s*[xX×*]\s*(\d+(?:\.\d+)?)\s*(?:m|公尺|米)?)?\s*$'
+)
+
+
+def _parse_dimensions(text: str) -> Optional[tuple]:
+    """解析「4x3x2.8」形式的長寬高（公尺），高度可省略；無法解析時回傳 None"""
+    match = _DIMENSIONS.match(str(text or ''))
+    if not match:
+        return None
+    length, width, height = match.groups()
+    return float(length), float(width), float(height) if height else None
+
+
+def _parse_area(text: str) -> Optional[float]:
+    """取出坪數字串中的數字（例如「8.5 坪」），無法解析時回傳 None"""
+    match = _NUMBER.search(str(text or ''))
+    return float(match.group()) if match else None
+
+
+def _downscale_image_payload(payload: Dict[str, Any], max_side: int) -> Dict[str, Any]:
+    """將圖片 payload 縮小到最長邊不超過 max_side，已夠小時原樣回傳"""
+    if max(payload['width'], payload['height']) <= max_side:
+        return payload
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(base64.b64decode(payload['data_uri'].split(',', 1)[1])))
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    output_stream = io.BytesIO()
+    if img.format == 'JPEG' or img.mode != 'RGBA':
+        img.convert('RGB').save(output_stream, format='JPEG', quality=85)
+        mime_type = 'image/jpeg'
+    else:
+        img.save(output_stream, format='PNG')
+        mime_type = 'image/png'
+    width, height = img.size
+    return {
+        **payload,
+        "mime_type": mime_type,
+        "width": width,
+        "height": height,
+        "data_uri": f"data:{mime_type};base64,{base64.b64encode(output_stream.getvalue()).decode('utf-8')}",
+    }
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    """Gemini 配額用盡（google.api_core ResourceExhausted / HTTP 429）"""
+    return type(error).__name__ == 'ResourceExhausted' or '429' in str(error)
+
+
+def _sdk_supports_response_schema(genai) -> bool:
+    """舊版 SDK 的 GenerationConfig 只有 response_mime_type，沒有 response_schema"""
+    fields = getattr(genai.types.GenerationConfig, '__dataclass_fields__', {})
+    return 'response_schema' in fields
+
+
+class AnalysisFormatError(ValueError):
+    """模型輸出無法解析成 JSON 或不符合分析結構"""
+
+
+def _validate_analysis(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """以 AnalysisResult 驗證模型輸出，回傳正規化後的字典（保留額外欄位）"""
+    from pydantic import ValidationError
+    from .schemas import AnalysisResult
+
+    try:
+        return AnalysisResult.model_validate(parsed).model_dump()
+    except ValidationError as e:
+        raise AnalysisFormatError(f"AI 回傳內容不符合分析結構: {e.error_count()} 個錯誤") from e
+
+
+def _validate_partial(key: str, value: Any) -> Any:
+    """驗證串流中閉合的單一頂層欄位，回傳正規化後的值；不在 AnalysisResult 結構內或不符合時回傳 None"""
+    from pydantic import ValidationError
+    from .schemas import analysis_member_adapter
+
+    adapter = analysis_member_adapter(key)
+    if adapter is None:
+        return None
+    try:
+        return adapter.dump_python(adapter.validate_python(value))
+    except ValidationError:
+        return None
+
+
+def _plan_products(catalog: List[Dict[str, Any]], style_name: str, category: str):
+    """由商品清單回傳 (便宜, 中等, 奢華) 三個商品；該風格沒有此分類時改用全目錄同分類商品，都沒有時回傳 None"""
+    filtered = ([p for p in catalog if p['style'] == style_name and p['category'] == category]
+                or [p for p in catalog if p['category'] == category])
+    if not filtered:
+        return None
+    filtered_sorted = sorted(filtered, key=lambda x: x['price_per_unit'])
+    return filtered_sorted[0], filtered_sorted[1] if len(filtered_sorted) > 1 else filtered_sorted[0], filtered_sorted[-1]
+
+
+def _chunk_text(chunk) -> str:
+    """取出串流 chunk 的文字；被安全過濾等沒有文字的 chunk 回傳空字串"""
+    try:
+        return getattr(chunk, 'text', '') or ''
+    except ValueError:
+        return ''
+
+
 class AIRecommendationService:
     """AI推薦服務，支援圖片分析、文字分析與產品推薦"""
 
-    def __init__(self):
+    def __init__(self, model=None, fast_model=None, priority: str = INTERACTIVE, rate_limiter=None):
+        """
+        model / fast_model 可注入任何提供 generate_content() 的物件（測試或壓力測試用），
+        model 為 pro 層級，fast_model 未指定時與 model 相同。
+        priority 為限流優先權（interactive / batch），rate_limiter 預設為 settings 設定的共用限流器
+        """
+        self.core_categories = ["flooring", "ceiling", "wallpaper_塗料"]
+        self.priority = priority
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_gemini_limiter()
+        self.retry_delay_sec = float(getattr(settings, "GEMINI_RETRY_DELAY_SEC", 10))
+        self.input_token_budget = int(getattr(settings, "GEMINI_INPUT_TOKEN_BUDGET", 4000))
+        # SDK 不支援 response_schema 時，改把 schema 寫進提示詞
+        self.response_schema_supported = False
+        if model is not None:
+            self.model = model
+            self.fast_model = fast_model or model
+            return
+        if getattr(settings, "GEMINI_BACKEND", "google") == "fake":
+            from .fake_gemini import get_shared_fake_model
+            self.model = self.fast_model = get_shared_fake_model()
+            return
+
         api_key = os.environ.get("GEMINI_API_KEY") or getattr(settings, "GEMINI_API_KEY", None)
         if not api_key:
             raise ValueError("⚠️ GEMINI_API_KEY 未設定")
-        genai.configure(api_key=api_key)
-        available_models = [
-            m.name for m in genai.list_models()
-            if "generateContent" in getattr(m, 'supported_generation_methods', [])
-        ]
-        preferred_models = [
-            "gemini-2.5-pro-preview-03-25",
-            "gemini-2.5-pro",
-            "gemini-flash-latest"
-        ]
-        selected_model_name = next((m for m in preferred_models if m in available_models), None)
-        if not selected_model_name and available_models:
-            selected_model_name = available_models[0]
-        elif not selected_model_name:
+        available_models = _available_model_names(api_key)
+        genai = _load_genai()
+        self.response_schema_supported = _sdk_supports_response_schema(genai)
+        pro_model_name = next((m for m in settings.GEMINI_PRO_MODELS if m in available_models), None)
+        fast_model_name = next((m for m in settings.GEMINI_FAST_MODELS if m in available_models), None)
+        if not pro_model_name:
+            pro_model_name = fast_model_name or (available_models[0] if available_models else None)
+        if not pro_model_name:
             raise RuntimeError("⚠️ 找不到可用 Gemini 模型")
-        self.model = genai.GenerativeModel(selected_model_name)
-        self.core_categories = ["flooring", "ceiling", "wallpaper_塗料"]
+        self.model = genai.GenerativeModel(pro_model_name)
+        self.fast_model = genai.GenerativeModel(fast_model_name) if fast_model_name and fast_model_name != pro_model_name else self.model
+
+    def _route_tier(self, request_data: Dict[str, Any], image_payloads: List[Dict[str, Any]]):
+        """
+        模型分級路由，回傳 (tier, reason)：
+        有圖片且坪數或尺寸未填時需要以圖片估算，使用 pro；其餘（純文字、表單完整）使用 fast
+        """
+        if self.fast_model is self.model:
+            return 'pro', 'single_model'
+        if not image_payloads:
+            return 'fast', 'text_only'
+        if str(request_data.get('room_area', '')).strip() and str(request_data.get('dimensions', '')).strip():
+            return 'fast', 'complete_fields'
+        return 'pro', 'image_estimation'
 
     def _get_default_analysis(self, request_data):
         return {
@@ -86,51 +342,169 @@ class AIRecommendationService:
             "style_suggestions": "依空間與預算選擇合適風格",
         }
 
+    def _is_form_complete(self, request_data: Dict[str, Any], image_payloads: List[Dict[str, Any]]) -> bool:
+        """沒有照片且坪數、尺寸、預算、風格皆已填寫（坪數與尺寸可解析）時不需要模型分析"""
+        if image_payloads:
+            return False
+        if not all(str(request_data.get(key, '')).strip() for key in ('total_budget', 'style_name')):
+            return False
+        return (_parse_area(request_data.get('room_area')) is not None
+                and _parse_dimensions(request_data.get('dimensions')) is not None)
+
+    def _local_style_suggestions(self, selected_style: str) -> List[Dict[str, str]]:
+        """由 Style 資料表產生風格建議，使用者選擇的風格排在最前面"""
+        suggestions = [
+            {"style_name": style.name, "description": style.description}
+            for style in Style.objects.only('name', 'description').order_by('id')
+        ]
+        suggestions.sort(key=lambda item: item["style_name"] != selected_style)
+        if not any(item["style_name"] == selected_style for item in suggestions):
+            suggestions.insert(0, {"style_name": selected_style, "description": f"依您選擇的{selected_style}規劃。"})
+        return suggestions[:6]
+
+    def _local_analysis(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """表單完整時的本地分析：坪數與尺寸取自表單，風格建議取自 Style 資料表，不呼叫模型"""
+        area_ping = _parse_area(request_data.get('room_area'))
+        length, width, height = _parse_dimensions(request_data.get('dimensions'))
+        lxwxh = f"{length:g}x{width:g}" + (f"x{height:g}" if height else "")
+        floor_ping = length * width / SQUARE_METERS_PER_PING
+        return {
+            "ai_status": "local",
+            "estimated_dimensions": {
+                "area_ping": int(area_ping) if area_ping.is_integer() else area_ping,
+                "LxWxH": lxwxh,
+                "analysis_basis": f"依表單填寫的坪數與尺寸（長 {length:g} m × 寬 {width:g} m，地板面積約 {floor_ping:.1f} 坪）。",
+            },
+            "style_suggestions": self._local_style_suggestions(str(request_data.get('style_name', '')).strip()),
+        }
+
+    def _analysis_generation_config(self) -> Dict[str, Any]:
+        """structured output 設定：固定輸出 JSON，SDK 支援時附上 response schema"""
+        from .schemas import ANALYSIS_RESPONSE_SCHEMA
+
+        config = {"response_mime_type": "application/json"}
+        if self.response_schema_supported:
+            config["response_schema"] = ANALYSIS_RESPONSE_SCHEMA
+        return config
+
+    def _fit_images_to_budget(self, model, prompt_text: str, image_payloads: List[Dict[str, Any]],
+                              usage: RequestUsage) -> List[Dict[str, Any]]:
+        """
+        以 count_tokens 計算提示文字，圖片依尺寸估算，超出 input_token_budget 時
+        縮小圖片或捨棄多餘圖片，回傳實際要送出的圖片 payload
+        """
+        captions = [f"這是第 {idx+1} 張圖片，用於分析。" for idx in range(len(image_payloads))]
+        text_tokens = count_input_tokens(model, captions + [prompt_text])
+        sizes = [(p['width'], p['height']) for p in image_payloads]
+        max_side, keep = plan_image_budget(sizes, text_tokens, self.input_token_budget)
+
+        fitted = [_downscale_image_payload(p, max_side) for p in image_payloads[:keep]]
+        image_tokens = sum(estimate_image_tokens(*scaled_size(w, h, max_side)) for w, h in sizes[:keep])
+        usage.images_received = len(image_payloads)
+        usage.images_sent = keep
+        usage.image_max_side = max_side if keep else 0
+        usage.counted_input_tokens = text_tokens + image_tokens
+        if keep < len(image_payloads) or any(f is not p for f, p in zip(fitted, image_payloads)):
+            logger.info("輸入超出 token 預算，已調整圖片", extra={'fields': {
+                'budget': self.input_token_budget, 'input_tokens': usage.counted_input_tokens,
+                'images_received': len(image_payloads), 'images_sent': keep, 'image_max_side': max_side,
+            }})
+        if usage.counted_input_tokens > self.input_token_budget:
+            logger.warning("提示文字與最少圖片仍超出 token 預算: %d > %d",
+                           usage.counted_input_tokens, self.input_token_budget)
+        return fitted
+
     def _extract_json_from_text(self, text: str):
+        """從模型輸出中取出第一個完整的 JSON 物件（線性時間，容忍 code fence 與尾逗號）"""
         if not text:
             return None
-        cleaned = re.sub(r'```(?:json)?', '', text, flags=re.IGNORECASE).strip()
-        try:
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
-            pass
-        match = re.search(r'(\{(?:.|\s)*\})', cleaned, re.DOTALL)
-        if match:
-            candidate = match.group(1).strip().strip('` \n\t')
-            try:
-                return json.loads(candidate)
-            except json.JSONDecodeError:
-                candidate_fixed = re.sub(r',\s*([}\]])', r'\1', candidate)
+        for start, end in _scan_json_object_spans(text):
+            if not _JSON_OBJECT_START.match(text, start):
+                continue
+            candidate = text[start:end]
+            for attempt in (candidate, None):
+                if attempt is None:
+                    attempt = _strip_trailing_commas(candidate)
+                    if attempt == candidate:
+                        break
                 try:
-                    return json.loads(candidate_fixed)
-                except json.JSONDecodeError:
-                    return None
+                    parsed = json.loads(attempt)
+                except (ValueError, RecursionError):
+                    continue
+                if isinstance(parsed, dict):
+                    return parsed
         return None
 
-    def analyze_user_requirements(self, request_data: Dict[str, Any], image_payloads: List[Dict[str, Any]], retries=2, timeout_sec=150):
-        """分析房間坪數與尺寸"""
-        def call_generate_content(contents):
-            return self.model.generate_content(contents=contents)
+    def analyze_user_requirements(self, request_data: Dict[str, Any], image_payloads: List[Dict[str, Any]], retries=2, timeout_sec=150,
+                                  on_partial: Optional[Callable[[str, Any], None]] = None,
+                                  usage: Optional[RequestUsage] = None):
+        """
+        分析房間坪數與尺寸。以串流方式呼叫 Gemini，邊收邊解析：
+        每個頂層欄位（如 estimated_dimensions）一閉合並通過 AnalysisResult 該欄位的驗證，就透過 on_partial(key, value) 通知，
+        輸出明顯不是 JSON 時提前中止並重試。
+        已推送部分結果的呼叫失敗而重試、改用 pro 或改用預設分析時，先呼叫 on_partial(PARTIAL_RESET, {'attempt': n})，
+        表示先前的部分結果作廢，之後的部分結果屬於第 n 次呼叫；部分結果只供預覽，以最後回傳的分析為準。
+        以 structured output（application/json + schema）要求回應，並以 AnalysisResult 驗證；
+        格式錯誤立即重試，不等待 retry_delay_sec。
+        呼叫前依 input_token_budget 調整圖片，每次呼叫的 token 用量累計到 usage。
+        """
+        generation_config = self._analysis_generation_config()
+        tier, reason = self._route_tier(request_data, image_payloads)
+        model = self.fast_model if tier == 'fast' else self.model
+        if usage is None:
+            usage = RequestUsage(getattr(model, 'model_name', 'unknown'), self.input_token_budget)
+        usage.route_tier, usage.route_reason = tier, reason
+        EVENT_COUNTERS.increment(f'route_{tier}_{reason}')
+        logger.info("Gemini 模型路由", extra={'fields': {
+            'tier': tier, 'reason': reason, 'model': getattr(model, 'model_name', 'unknown'),
+        }})
 
-        for attempt in range(1, retries + 2):
+        partials_sent = threading.Event()
+        calls = 0
+
+        def reset_partials():
+            if on_partial and partials_sent.is_set():
+                partials_sent.clear()
+                on_partial(PARTIAL_RESET, {'attempt': calls + 1})
+
+        def consume_stream(model, contents, cancelled: threading.Event):
+            parser = IncrementalJSONObjectParser()
+            chunks = []
+            usage_metadata = None
             try:
-                room_area = str(request_data.get('room_area', '')).strip()
-                dimensions = str(request_data.get('dimensions', '')).strip()
-                is_area_missing = not room_area
-                is_dimensions_missing = not dimensions
-
-                instruction = (
-                    "請分析提供的圖片，估算房間長寬高與坪數，回傳 JSON。"
-                    if image_payloads and (is_area_missing or is_dimensions_missing)
-                    else "根據提供資訊分析。"
-                )
-                contents = []
-                for idx, p in enumerate(image_payloads):
-                    image_data = base64.b64decode(p['data_uri'].split(',')[1])
-                    contents.append({'mime_type': p['mime_type'], 'data': image_data})
-                    contents.append(f"這是第 {idx+1} 張圖片，用於分析。")
-
-                prompt_text = f"""
+                for chunk in model.generate_content(contents=contents, stream=True,
+                                                    generation_config=generation_config):
+                    if cancelled.is_set():
+                        break
+                    # usage_metadata 隨最後一個 chunk 回傳
+                    usage_metadata = getattr(chunk, 'usage_metadata', None) or usage_metadata
+                    text = _chunk_text(chunk)
+                    chunks.append(text)
+                    for key, value in parser.feed(text):
+                        # 逾時被放棄的呼叫不再推送
+                        if on_partial and not cancelled.is_set():
+                            value = _validate_partial(key, value)
+                            if value is not None:
+                                partials_sent.set()
+                                on_partial(key, value)
+                    if parser.done:
+                        break
+            finally:
+                # 失敗的呼叫同樣計費；提前結束串流時沒有 usage_metadata，改以估算值記錄
+                usage.add_response(usage_metadata, ''.join(chunks), getattr(model, 'model_name', None))
+            return parser, ''.join(chunks)
+
+        room_area = str(request_data.get('room_area', '')).strip()
+        dimensions = str(request_data.get('dimensions', '')).strip()
+        is_area_missing = not room_area
+        is_dimensions_missing = not dimensions
+
+        instruction = (
+            "請分析提供的圖片，估算房間長寬高與坪數，回傳 JSON。"
+            if image_payloads and (is_area_missing or is_dimensions_missing)
+            else "根據提供資訊分析。"
+        )
+        prompt_text = f"""
 你是一位專業室內設計師，提供精準設計分析。
 {instruction}
 
@@ -145,53 +519,117 @@ class AIRecommendationService:
 - estimated_dimensions: area_ping, LxWxH, analysis_basis
 - style_suggestions: 四至六種風格建議，每個風格給一段簡介
 """
-                contents.append(prompt_text)
-                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                    future = executor.submit(call_generate_content, contents)
-                    response = future.result(timeout=timeout_sec)
-
-                raw_text = response.text if hasattr(response, 'text') else str(response)
-                parsed = self._extract_json_from_text(raw_text)
-                if not parsed:
-                    raise ValueError("AI 回傳內容無法解析成 JSON。")
+        if not self.response_schema_supported:
+            from .schemas import ANALYSIS_RESPONSE_SCHEMA
+            prompt_text += "\n回應必須符合此 JSON Schema：\n" + json.dumps(ANALYSIS_RESPONSE_SCHEMA, ensure_ascii=False)
+
+        # 內容與重試無關，只組裝一次
+        contents = []
+        for idx, p in enumerate(self._fit_images_to_budget(model, prompt_text, image_payloads, usage)):
+            image_data = base64.b64decode(p['data_uri'].split(',')[1])
+            contents.append({'mime_type': p['mime_type'], 'data': image_data})
+            contents.append(f"這是第 {idx+1} 張圖片，用於分析。")
+        contents.append(prompt_text)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                EVENT_COUNTERS.increment('analysis_attempt')
+                if self.rate_limiter is not None:
+                    with stage('rate_limit_wait'):
+                        acquired = self.rate_limiter.acquire(usage.counted_input_tokens + EXPECTED_OUTPUT_TOKENS,
+                                                             priority=self.priority, timeout=timeout_sec)
+                    if not acquired:
+                        EVENT_COUNTERS.increment(f'rate_limit_timeout_{self.priority}')
+                        raise TimeoutError(f"等待 Gemini 配額超過 {timeout_sec} 秒")
+                cancelled = threading.Event()
+                calls += 1
+                with stage('gemini_attempt'):
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                        future = executor.submit(consume_stream, model, contents, cancelled)
+                        try:
+                            parser, raw_text = future.result(timeout=timeout_sec)
+                        except concurrent.futures.TimeoutError:
+                            cancelled.set()
+                            raise
+
+                with stage('json_extract'):
+                    parsed = parser.result() or self._extract_json_from_text(raw_text)
+                    if not parsed:
+                        EVENT_COUNTERS.increment('analysis_parse_failure')
+                        raise AnalysisFormatError("AI 回傳內容無法解析成 JSON。")
+                    try:
+                        parsed = _validate_analysis(parsed)
+                    except AnalysisFormatError:
+                        EVENT_COUNTERS.increment('analysis_schema_failure')
+                        raise
                 parsed['ai_status'] = 'completed'
                 return parsed
             except Exception as e:
+                if isinstance(e, StreamFormatError):
+                    EVENT_COUNTERS.increment('analysis_parse_failure')
+                format_error = isinstance(e, (AnalysisFormatError, StreamFormatError))
+                if format_error and model is not self.model:
+                    # fast 輸出未通過驗證，改用 pro 重試（不佔用重試次數）
+                    EVENT_COUNTERS.increment('route_escalated')
+                    logger.info("fast 模型輸出未通過驗證，改用 pro 模型: %s", e)
+                    model = self.model
+                    usage.escalated = True
+                    attempt -= 1
+                    reset_partials()
+                    continue
+                rate_limited = _is_rate_limit_error(e)
+                if rate_limited and self.rate_limiter is not None:
+                    # 讓所有 worker 一起退讓，重試時由限流器排隊等待
+                    EVENT_COUNTERS.increment('rate_limit_429')
+                    self.rate_limiter.pause(self.retry_delay_sec)
+                reset_partials()
                 if attempt <= retries:
-                    time.sleep(10)
+                    EVENT_COUNTERS.increment('analysis_retry')
+                    logger.warning("Gemini 第 %d 次分析失敗，重試: %s", attempt, e)
+                    # 格式錯誤與限流無關，立即重試；429 交給限流器等待；其他錯誤（500/逾時）才在此等待
+                    if not format_error and not (rate_limited and self.rate_limiter is not None):
+                        time.sleep(self.retry_delay_sec)
                 else:
+                    EVENT_COUNTERS.increment('analysis_fallback')
+                    logger.error("Gemini 分析失敗，改用預設分析: %s", e)
                     return self._get_default_analysis(request_data)
 
-    def recommend_products(self, request_data: Dict[str, Any], analysis_result: Dict[str, Any]):
-        """直接從資料庫選風格及商品，產生三種方案"""
+    def recommend_products(self, request_data: Dict[str, Any], analysis_result: Dict[str, Any],
+                           catalog: List[Dict[str, Any]] = None):
+        """
+        直接從商品目錄選風格及商品，產生三種方案。
+        catalog 預設為跨行程共用的目錄快照（app/catalog_snapshot.py），無法載入時用 PRODUCT_DATABASE
+        """
+        if catalog is None:
+            catalog = get_catalog_snapshot() or PRODUCT_DATABASE
+        if isinstance(catalog, CatalogSnapshot):
+            db_styles = catalog.styles()
+            plan_products = catalog.plan_products
+        else:
+            db_styles = list({p['style'] for p in catalog})
+            plan_products = functools.partial(_plan_products, catalog)
         budget = float(request_data.get('total_budget', 0)) if str(request_data.get('total_budget','')).isdigit() else 0
         recommendations = {}
         
         # 從資料庫選出 4~6 個不同風格
-        db_styles = list({p['style'] for p in PRODUCT_DATABASE})
         random.shuffle(db_styles)
         selected_styles = db_styles[:6]
 
         for style_name in selected_styles:
-            style_products = [p for p in PRODUCT_DATABASE if p['style'] == style_name]
+            # 每個分類的 (便宜, 中等, 奢華) 候選，三種方案共用
+            candidates = {category: plan_products(style_name, category) for category in self.core_categories}
             recommendations[style_name] = {
                 "style_summary": f"{style_name} 風格",
                 "plans": []
             }
-            for plan_name, factor in [("便宜方案", 0.6), ("中等方案", 1.0), ("奢華方案", 1.5)]:
+            for plan_index, (plan_name, factor) in enumerate([("便宜方案", 0.6), ("中等方案", 1.0), ("奢華方案", 1.5)]):
                 plan_items = {}
                 total_cost = 0.0
                 for category in self.core_categories:
-                    filtered = [p for p in style_products if p['category'] == category] or [p for p in PRODUCT_DATABASE if p['category'] == category]
-                    if filtered:
-                        filtered_sorted = sorted(filtered, key=lambda x: x['price_per_unit'])
-                        if plan_name == "便宜方案":
-                            selected = filtered_sorted[:1]
-                        elif plan_name == "中等方案":
-                            selected = filtered_sorted[1:2] if len(filtered_sorted) > 1 else filtered_sorted[:1]
-                        else:
-                            selected = filtered_sorted[-1:]
-                        item = selected[0]
+                    if candidates[category]:
+                        item = candidates[category][plan_index]
                         cost = item['price_per_unit'] * 1
                         total_cost += cost
                         plan_items[category] = {
@@ -200,7 +638,9 @@ class AIRecommendationService:
                             "unit": item['unit'],
                             "description": item['description'],
                             "price_per_unit": item['price_per_unit'],
-                            "product_id": item['id']
+                            "product_id": item['id'],
+                            # catalog：PRODUCT_DATABASE 的 id；product：Product.pk（價格紀錄、縮圖等 API 使用）
+                            "source": SOURCE_NAMES[item.get('source', SOURCE_CATALOG)],
                         }
                     else:
                         plan_items[category] = {
@@ -209,7 +649,8 @@ class AIRecommendationService:
                             "unit": "件",
                             "description": "",
                             "price_per_unit": 0,
-                            "product_id": 0
+                            "product_id": 0,
+                            "source": None,
                         }
                 recommendations[style_name]["plans"].append({
                     "plan": plan_name,
@@ -227,13 +668,38 @@ class AIRecommendationService:
 
         return recommendations
 
-    def process_recommendation_request(self, request_data: Dict[str, Any]):
-        """整合圖片分析與資料庫推薦，回傳完整結果"""
+    def process_recommendation_request(self, request_data: Dict[str, Any],
+                                       on_partial: Optional[Callable[[str, Any], None]] = None):
+        """整合圖片分析與資料庫推薦，回傳完整結果（含 Gemini token 用量 usage）"""
+        usage = RequestUsage(getattr(self.model, 'model_name', 'unknown'), self.input_token_budget)
         try:
             image_files: List[UploadedFile] = request_data.pop('image_files', [])
-            image_payloads = [_uploaded_file_to_image_payload(f) for f in image_files]
-            analysis = self.analyze_user_requirements(request_data, image_payloads)
-            product_recommendations = self.recommend_products(request_data, analysis)
+            image_payloads = []
+            for f in image_files:
+                with stage('image_payload'):
+                    image_payloads.append(_uploaded_file_to_image_payload(f))
+            if self._is_form_complete(request_data, image_payloads):
+                with stage('local_analysis'):
+                    analysis = self._local_analysis(request_data)
+                usage.model_name = ''
+                usage.route_tier, usage.route_reason = 'local', 'complete_form'
+                EVENT_COUNTERS.increment('route_local_complete_form')
+                if getattr(settings, 'GEMINI_ENRICH_COMPLETE_FORMS', False):
+                    # 模型僅用來補充風格建議，失敗時保留本地結果
+                    enriched = self.analyze_user_requirements(request_data, image_payloads, usage=usage)
+                    # analyze_user_requirements 會改寫路由紀錄；本請求仍是本地分析，補充呼叫另外記錄
+                    usage.enriched_by = usage.route_tier
+                    usage.route_tier, usage.route_reason = 'local', 'complete_form'
+                    if enriched.get('ai_status') == 'completed':
+                        analysis['style_suggestions'] = enriched['style_suggestions']
+                        analysis['ai_status'] = 'enriched'
+                if on_partial:
+                    for key in ('estimated_dimensions', 'style_suggestions'):
+                        on_partial(key, analysis[key])
+            else:
+                analysis = self.analyze_user_requirements(request_data, image_payloads, on_partial=on_partial, usage=usage)
+            with stage('recommend_products'):
+                product_recommendations = self.recommend_products(request_data, analysis)
 
             return {
                 'id': 1,
@@ -243,12 +709,14 @@ class AIRecommendationService:
                 'style_name': request_data.get('style_name', '未指定'),
                 'ai_recommendation': analysis,
                 'status': 'completed',
-                'recommendations': product_recommendations
+                'recommendations': product_recommendations,
+                'usage': usage.as_dict(),
             }
         except Exception as e:
             return {
                 'id': 1,
                 'status': 'failed', 
                 'error': str(e),
-                'recommendations': {}
+                'recommendations': {},
+                'usage': usage.as_dict(),
             }
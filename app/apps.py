@@ -0,0 +1,15 @@
+# app/apps.py
+from django import apps
+
+
+class AppConfig(apps.AppConfig):
+    name = 'app'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from .models import Product
+        from .catalog_snapshot import mark_snapshot_dirty
+
+        # 後台編輯、停用或刪除商品後重建目錄快照，避免繼續推薦已停用的商品
+        post_save.connect(mark_snapshot_dirty, sender=Product, dispatch_uid='catalog_snapshot_product_saved')
+        post_delete.connect(mark_snapshot_dirty, sender=Product, dispatch_uid='catalog_snapshot_product_deleted')
@@ -0,0 +1,332 @@
+# app/catalog_snapshot.py
+"""
+跨 worker 行程共用的商品目錄快照
+
+目錄（product_data.PRODUCT_DATABASE 加上啟用中的 Product）編成一個唯讀檔案：
+- 每個欄位是固定寬度的陣列（id / 價格為 int64，其餘為 uint32 字串編號），字串集中在去重後的字串表
+- 商品依 (風格, 分類, 價格, 原始順序) 排序，另存每個 (風格, 分類) 的列範圍與每個分類全目錄最便宜 /
+  次便宜 / 最貴的列，推薦時直接取範圍頭尾，不必每次篩選與排序
+- 各 worker 以 mmap 唯讀映射同一個檔案，實體記憶體由作業系統的 page cache 共用，不會隨 worker 數倍增
+
+重建時先寫暫存檔再 os.replace，已映射舊檔的 worker 繼續讀舊 inode；get_catalog_snapshot()
+每 CATALOG_SNAPSHOT_CHECK_SEC 秒檢查一次檔案，換了 inode 就改映射新檔。
+
+Product 儲存或刪除（後台編輯、停用、init_sample_data）時 mark_snapshot_dirty() 在交易提交後更新
+<快照>.dirty 標記檔；get_catalog_snapshot() 檢查時發現標記比快照新就重建，同一段時間內的多次異動
+只重建一次（每個 worker 最多每 CATALOG_SNAPSHOT_CHECK_SEC 秒一次）。
+"""
+import os
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CATSNAP\x00'
+FORMAT_VERSION = 1
+# magic, 格式版本, 區段數, 內容版本, 建立時間(ns), 商品數, 字串數, 風格數, 分類數, 群組數
+HEADER = struct.Struct('<8sIIQQIIIII4x')
+SECTION = struct.Struct('<QQ')
+# (名稱, array typecode)；順序即檔案中的區段順序
+SECTIONS = (
+    ('id', 'q'), ('price_cents', 'q'), ('style', 'I'), ('category', 'I'),
+    ('name', 'I'), ('model', 'I'), ('unit', 'I'), ('description', 'I'), ('source', 'B'),
+    ('string_offsets', 'I'), ('strings', 'B'),
+    # 風格：(名稱, 起始列, 結束列)；分類：(名稱, 最便宜列, 次便宜列, 最貴列)；群組：(風格, 分類, 起始列, 結束列)
+    ('styles', 'I'), ('categories', 'I'), ('groups', 'I'),
+)
+SOURCE_CATALOG = 0
+SOURCE_PRODUCT = 1
+# id 只在同一來源內唯一（PRODUCT_DATABASE 的 id 與 Product.pk 可能重複），推薦方案以此名稱標示來源
+SOURCE_NAMES = {SOURCE_CATALOG: 'catalog', SOURCE_PRODUCT: 'product'}
+
+# Product 的中文分類 / 風格對應到 PRODUCT_DATABASE 使用的代碼，讓兩邊的商品能放進同一組方案
+CATEGORY_CODES = {'地板': 'flooring', '天花板': 'ceiling', '壁紙': 'wallpaper_塗料', '塗料': 'wallpaper_塗料'}
+STYLE_CODES = {
+    '現代風': 'modern', '北歐風': 'scandinavian', '工業風': 'industrial', '日式風': 'japanese',
+    '美式風': 'american', '英式風': 'english', '鄉村風': 'country',
+}
+
+
+# ======================================================
+# 建立
+# ======================================================
+def _price_cents(value) -> int:
+    return int((Decimal(str(value)) * 100).to_integral_value())
+
+
+def catalog_rows(include_products: bool = True) -> List[Dict[str, Any]]:
+    """快照的來源：PRODUCT_DATABASE 在前，啟用中的 Product 在後"""
+    from .models import Product
+    from .product_data import PRODUCT_DATABASE
+
+    rows = [dict(row, source=SOURCE_CATALOG) for row in PRODUCT_DATABASE]
+    if include_products:
+        products = Product.objects.filter(is_active=True).order_by('id').values_list(
+            'id', 'category__name', 'style', 'name', 'model_number', 'price', 'unit', 'description',
+        )
+        for product_id, category, style, name, model_number, price, unit, description in products.iterator():
+            rows.append({
+                'id': product_id,
+                'category': CATEGORY_CODES.get(category, category),
+                'style': STYLE_CODES.get(style, style),
+                'name': name,
+                'model': model_number,
+                'price_per_unit': price,
+                'unit': unit,
+                'description': description,
+                'source': SOURCE_PRODUCT,
+            })
+    return rows
+
+
+def build_snapshot_bytes(rows: Iterable[Dict[str, Any]], built_at_ns: Optional[int] = None) -> bytes:
+    """將目錄列編成快照格式（見模組說明）"""
+    strings: Dict[str, int] = {}
+
+    def sid(value) -> int:
+        value = str(value or '')
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    indexed = [(str(row['style'] or ''), str(row['category'] or ''), _price_cents(row['price_per_unit']), i, row)
+               for i, row in enumerate(rows)]
+    indexed.sort(key=lambda item: item[:4])
+
+    columns = {name: array(code) for name, code in SECTIONS}
+    for style, category, cents, _, row in indexed:
+        columns['id'].append(int(row['id']))
+        columns['price_cents'].append(cents)
+        columns['style'].append(sid(style))
+        columns['category'].append(sid(category))
+        columns['name'].append(sid(row.get('name')))
+        columns['model'].append(sid(row.get('model')))
+        columns['unit'].append(sid(row.get('unit')))
+        columns['description'].append(sid(row.get('description')))
+        columns['source'].append(int(row.get('source', SOURCE_CATALOG)))
+
+    # 依風格、(風格, 分類) 分段；列已排序，相同的鍵一定相鄰
+    style_ranges: Dict[str, List[int]] = {}
+    group_ranges: Dict[Tuple[str, str], List[int]] = {}
+    for position, (style, category, _, _, _) in enumerate(indexed):
+        style_ranges.setdefault(style, [position, position])[1] = position + 1
+        group_ranges.setdefault((style, category), [position, position])[1] = position + 1
+    for style, (start, end) in style_ranges.items():
+        columns['styles'].extend((sid(style), start, end))
+    for (style, category), (start, end) in group_ranges.items():
+        columns['groups'].extend((sid(style), sid(category), start, end))
+
+    # 全目錄同分類的便宜 / 次便宜 / 最貴（風格沒有該分類商品時使用），同價時與 sorted() 一樣保留原始順序
+    by_category: Dict[str, List[Tuple[int, int, int]]] = {}
+    for position, (_, category, cents, original, _) in enumerate(indexed):
+        by_category.setdefault(category, []).append((cents, original, position))
+    for category, items in by_category.items():
+        items.sort()
+        cheapest, last = items[0][2], items[-1][2]
+        second = items[1][2] if len(items) > 1 else cheapest
+        columns['categories'].extend((sid(category), cheapest, second, last))
+
+    blob = bytearray()
+    columns['string_offsets'].append(0)
+    for value in strings:
+        blob += value.encode('utf-8')
+        columns['string_offsets'].append(len(blob))
+    columns['strings'] = array('B', bytes(blob))
+
+    # 各區段對齊 8 bytes，映射後可直接以 memoryview.cast 讀取
+    payload = bytearray()
+    table = []
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    for name, _ in SECTIONS:
+        data = columns[name].tobytes()
+        table.append((offset + len(payload), len(data)))
+        payload += data + b'\0' * (-len(data) % 8)
+    version = int.from_bytes(hashlib.sha256(payload).digest()[:8], 'little')
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS), version, built_at_ns or time.time_ns(),
+                         len(indexed), len(strings), len(style_ranges), len(by_category), len(group_ranges))
+    return header + b''.join(SECTION.pack(*entry) for entry in table) + bytes(payload)
+
+
+def build_snapshot(path=None, include_products: Optional[bool] = None) -> 'CatalogSnapshot':
+    """由目前的目錄重建快照檔並以 os.replace 原子替換，回傳新快照"""
+    path = Path(path or settings.CATALOG_SNAPSHOT_PATH)
+    if include_products is None:
+        include_products = settings.CATALOG_SNAPSHOT_INCLUDE_PRODUCTS
+    # 建立時間取讀取資料前的時間，讀取期間的異動標記會比快照新，下次檢查時再重建
+    started_ns = time.time_ns()
+    data = build_snapshot_bytes(catalog_rows(include_products), built_at_ns=started_ns)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return CatalogSnapshot.open(path)
+
+
+def _dirty_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.dirty")
+
+
+def mark_snapshot_dirty(sender=None, **kwargs):
+    """Product post_save / post_delete 接收器：交易提交後更新標記檔，讓各 worker 下次檢查時重建快照"""
+    from django.db import transaction
+
+    if not (getattr(settings, 'CATALOG_SNAPSHOT_ENABLED', True) and settings.CATALOG_SNAPSHOT_INCLUDE_PRODUCTS):
+        return
+
+    def touch():
+        path = _dirty_path(Path(settings.CATALOG_SNAPSHOT_PATH))
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+        except OSError as e:
+            logger.warning("無法標記目錄快照需重建 %s: %s", path, e)
+
+    transaction.on_commit(touch)
+
+
+def _is_dirty(path: Path, snapshot: 'CatalogSnapshot') -> bool:
+    try:
+        return _dirty_path(path).stat().st_mtime_ns >= snapshot.built_at_ns
+    except FileNotFoundError:
+        return False
+
+
+# ======================================================
+# 讀取
+# ======================================================
+class CatalogSnapshot:
+    """唯讀的目錄快照；buffer 可以是 mmap（共用檔案）或 bytes（測試、基準）"""
+
+    def __init__(self, buffer, path: Optional[Path] = None):
+        view = memoryview(buffer)
+        magic, fmt, section_count, self.version, self.built_at_ns, self.row_count, _, _, _, _ = HEADER.unpack_from(view)
+        if magic != MAGIC or fmt != FORMAT_VERSION or section_count != len(SECTIONS):
+            raise ValueError("不是可讀取的目錄快照")
+        self.path = path
+        self._buffer = buffer
+        self._columns = {}
+        for index, (name, code) in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(view, HEADER.size + SECTION.size * index)
+            self._columns[name] = view[offset:offset + length].cast(code)
+        # 風格與群組數量很少（風格數 x 分類數），映射時建成字典
+        styles = self._columns['styles']
+        self._styles = [self._string(styles[i]) for i in range(0, len(styles), 3)]
+        groups = self._columns['groups']
+        self._groups = {
+            (self._string(groups[i]), self._string(groups[i + 1])): (groups[i + 2], groups[i + 3])
+            for i in range(0, len(groups), 4)
+        }
+        categories = self._columns['categories']
+        self._categories = {
+            self._string(categories[i]): (categories[i + 1], categories[i + 2], categories[i + 3])
+            for i in range(0, len(categories), 4)
+        }
+        # plan_products 的結果（最多 風格數 x 分類數 組），同一份快照內不會改變
+        self._plans: Dict[Tuple[str, str], Optional[Tuple[Dict, Dict, Dict]]] = {}
+
+    @classmethod
+    def open(cls, path) -> 'CatalogSnapshot':
+        path = Path(path)
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, path)
+
+    def _string(self, string_id: int) -> str:
+        offsets = self._columns['string_offsets']
+        return bytes(self._columns['strings'][offsets[string_id]:offsets[string_id + 1]]).decode('utf-8')
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """以 PRODUCT_DATABASE 相同的欄位回傳一列；整數價格維持 int"""
+        c = self._columns
+        cents = c['price_cents'][index]
+        return {
+            'id': c['id'][index],
+            'category': self._string(c['category'][index]),
+            'style': self._string(c['style'][index]),
+            'name': self._string(c['name'][index]),
+            'model': self._string(c['model'][index]),
+            'price_per_unit': cents // 100 if cents % 100 == 0 else cents / 100,
+            'unit': self._string(c['unit'][index]),
+            'description': self._string(c['description'][index]),
+            'source': c['source'][index],
+        }
+
+    def styles(self) -> List[str]:
+        """所有非空白的風格名稱（依名稱排序）"""
+        return [style for style in self._styles if style]
+
+    def plan_products(self, style_name: str, category: str) -> Optional[Tuple[Dict, Dict, Dict]]:
+        """回傳 (便宜, 中等, 奢華) 三個商品；該風格沒有此分類時改用全目錄同分類商品，都沒有時回傳 None"""
+        key = (style_name, category)
+        if key not in self._plans:
+            self._plans[key] = self._find_plan(style_name, category)
+        return self._plans[key]
+
+    def _find_plan(self, style_name: str, category: str) -> Optional[Tuple[Dict, Dict, Dict]]:
+        group = self._groups.get((style_name, category))
+        if group:
+            start, end = group
+            return self.row(start), self.row(start + 1 if end - start > 1 else start), self.row(end - 1)
+        fallback = self._categories.get(category)
+        if fallback is None:
+            return None
+        return tuple(self.row(index) for index in fallback)
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+_snapshot_identity: Optional[Tuple[int, int]] = None
+_snapshot_checked = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    """
+    回傳目前行程映射的快照；每 CATALOG_SNAPSHOT_CHECK_SEC 秒檢查檔案是否被替換。
+    檔案不存在或 Product 異動後（見 mark_snapshot_dirty）依 CATALOG_SNAPSHOT_AUTO_BUILD 建立；無法讀取或建立時回傳 None，由呼叫端改用 PRODUCT_DATABASE。
+    """
+    global _snapshot, _snapshot_identity, _snapshot_checked
+    if not getattr(settings, 'CATALOG_SNAPSHOT_ENABLED', True):
+        return None
+    now = time.monotonic()
+    if _snapshot is not None and now - _snapshot_checked < settings.CATALOG_SNAPSHOT_CHECK_SEC:
+        return _snapshot
+    with _snapshot_lock:
+        if _snapshot is not None and now - _snapshot_checked < settings.CATALOG_SNAPSHOT_CHECK_SEC:
+            return _snapshot
+        _snapshot_checked = now
+        path = Path(settings.CATALOG_SNAPSHOT_PATH)
+        try:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                if not settings.CATALOG_SNAPSHOT_AUTO_BUILD:
+                    return _snapshot
+                build_snapshot(path)
+                stat = path.stat()
+            identity = (stat.st_dev, stat.st_ino)
+            if identity != _snapshot_identity:
+                # 舊快照不主動關閉：仍在處理中的請求持有它的參照，釋放後由 GC 解除映射
+                _snapshot = CatalogSnapshot.open(path)
+                _snapshot_identity = identity
+                logger.info("載入目錄快照 %s（版本 %016x，%d 筆）", path, _snapshot.version, _snapshot.row_count)
+            if settings.CATALOG_SNAPSHOT_AUTO_BUILD and _is_dirty(path, _snapshot):
+                _snapshot = build_snapshot(path)
+                stat = path.stat()
+                _snapshot_identity = (stat.st_dev, stat.st_ino)
+                logger.info("商品有異動，已重建目錄快照 %s（版本 %016x，%d 筆）", path, _snapshot.version, _snapshot.row_count)
+        except Exception as e:
+            logger.warning("無法載入目錄快照 %s: %s", path, e)
+        return _snapshot
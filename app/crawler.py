@@ -0,0 +1,459 @@
+# app/crawler.py
+"""
+供應商商品頁爬蟲
+
+- fetch：aiohttp 連線池，TCPConnector 限制總並行數與每個主機的並行數，
+  帶上次的 ETag / Last-Modified 發出條件式請求，304 時不重新下載與解析
+- parse：優先讀取 schema.org Product 的 JSON-LD，其次為 OpenGraph / product:price meta 標籤；
+  回應為 JSON 時直接視為商品欄位
+- upsert：解析結果累積成批，依 source_url 一次查詢既有商品，再以 bulk_update / bulk_create 寫入；
+  內容雜湊（product_content_hash）與上次相同的商品不重寫，價格不同時才新增 ProductPriceHistory。
+  同時累計爬取次數與內容變動次數，供 app/recrawl.py 估計變動頻率
+
+由 `python manage.py crawl_products` 呼叫；可搭配 benchmarks/crawl_fixture_server.py 在本機測試。
+"""
+import json
+import random
+import threading
+import asyncio
+import logging
+from decimal import Decimal, InvalidOperation
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import PRODUCT_CONTENT_FIELDS, Category, Product, ProductPriceHistory, product_content_hash
+
+logger = logging.getLogger(__name__)
+
+# 爬蟲會寫入的 Product 欄位（source_url 為比對鍵）
+PRODUCT_FIELDS = PRODUCT_CONTENT_FIELDS
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+PRICE_MAX_DIGITS = Product._meta.get_field('price').max_digits
+
+
+# ======================================================
+# 解析
+# ======================================================
+class _ProductPageParser(HTMLParser):
+    """收集 JSON-LD script 與 meta 標籤，其餘內容略過"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.json_ld: List[str] = []
+        self.meta: Dict[str, str] = {}
+        self.title = ''
+        self._in_json_ld = False
+        self._in_title = False
+        self._buffer: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'script' and (attrs.get('type') or '').lower() == 'application/ld+json':
+            self._in_json_ld = True
+            self._buffer = []
+        elif tag == 'meta':
+            key = attrs.get('property') or attrs.get('name') or attrs.get('itemprop')
+            if key and attrs.get('content') is not None:
+                self.meta.setdefault(key.lower(), attrs['content'].strip())
+        elif tag == 'title':
+            self._in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self._in_json_ld:
+            self.json_ld.append(''.join(self._buffer))
+            self._in_json_ld = False
+        elif tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_json_ld:
+            self._buffer.append(data)
+        elif self._in_title:
+            self.title += data
+
+
+def _iter_json_ld_nodes(value):
+    """展開 JSON-LD 的 list 與 @graph"""
+    if isinstance(value, list):
+        for item in value:
+            yield from _iter_json_ld_nodes(item)
+    elif isinstance(value, dict):
+        yield value
+        if '@graph' in value:
+            yield from _iter_json_ld_nodes(value['@graph'])
+
+
+def _is_product_node(node: Dict[str, Any]) -> bool:
+    node_type = node.get('@type')
+    types = node_type if isinstance(node_type, list) else [node_type]
+    return 'Product' in types
+
+
+def _text(value) -> str:
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('@id') or ''
+    if isinstance(value, list):
+        value = value[0] if value else ''
+    return str(value or '').strip()
+
+
+def _first_object(value) -> Dict[str, Any]:
+    """offers / priceSpecification 可能是物件、物件清單或其他型別（字串、數字）；取第一個物件，沒有時回傳空 dict"""
+    if isinstance(value, list):
+        value = next((item for item in value if isinstance(item, dict)), None)
+    return value if isinstance(value, dict) else {}
+
+
+def _from_json_ld(node: Dict[str, Any]) -> Dict[str, Any]:
+    offers = _first_object(node.get('offers'))
+    size = node.get('size') or ' x '.join(_text(node.get(k)) for k in ('width', 'depth', 'height') if node.get(k))
+    return {
+        'name': _text(node.get('name')),
+        'brand': _text(node.get('brand')),
+        'model_number': _text(node.get('mpn') or node.get('sku') or node.get('model')),
+        'price': offers.get('price') or offers.get('lowPrice'),
+        'unit': _text(offers.get('unitText') or _first_object(offers.get('priceSpecification')).get('unitText')),
+        'material': _text(node.get('material')),
+        'color': _text(node.get('color')),
+        'style': _text(node.get('style')),
+        'size': _text(size),
+        'image_url': _text(node.get('image')),
+        'description': _text(node.get('description')),
+        'category': _text(node.get('category')),
+    }
+
+
+def _from_meta(meta: Dict[str, str], title: str) -> Dict[str, Any]:
+    return {
+        'name': meta.get('og:title') or title.strip(),
+        'brand': meta.get('product:brand', ''),
+        'model_number': meta.get('product:retailer_item_id', ''),
+        'price': meta.get('product:price:amount') or meta.get('og:price:amount'),
+        'image_url': meta.get('og:image', ''),
+        'description': meta.get('og:description') or meta.get('description', ''),
+        'category': meta.get('product:category', ''),
+    }
+
+
+def parse_product(body: str, content_type: str = 'text/html') -> Optional[Dict[str, Any]]:
+    """由商品頁內容取出商品欄位；找不到名稱或價格時回傳 None"""
+    if 'json' in content_type:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        fields = _from_json_ld(data) if _is_product_node(data) else data
+    else:
+        parser = _ProductPageParser()
+        parser.feed(body)
+        fields = None
+        for raw in parser.json_ld:
+            try:
+                nodes = list(_iter_json_ld_nodes(json.loads(raw)))
+            except ValueError:
+                continue
+            product = next((node for node in nodes if _is_product_node(node)), None)
+            if product:
+                fields = _from_json_ld(product)
+                break
+        if fields is None:
+            fields = _from_meta(parser.meta, parser.title)
+    return _clean_fields(fields)
+
+
+def _clean_fields(fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """套用 Product 欄位長度與型別；缺名稱、價格無效（NaN、Infinity、負數、超過 price 欄位位數）的頁面不寫入"""
+    try:
+        price = Decimal(str(fields.get('price')).replace(',', '')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+    if not price.is_finite() or price < 0 or len(price.as_tuple().digits) > PRICE_MAX_DIGITS:
+        return None
+    name = str(fields.get('name') or '').strip()
+    if not name:
+        return None
+    limits = {field.name: field.max_length for field in Product._meta.get_fields() if getattr(field, 'max_length', None)}
+    cleaned = {'price': price}
+    for key in PRODUCT_FIELDS + ('category',):
+        if key == 'price':
+            continue
+        value = str(fields.get(key) or '').strip()
+        if key in limits:
+            value = value[:limits[key]]
+        cleaned[key] = value
+    cleaned['unit'] = cleaned['unit'] or '件'
+    return cleaned
+
+
+# ======================================================
+# 寫入
+# ======================================================
+class ProductUpserter:
+    """依 source_url 批次 upsert Product；分類名稱對應 Category，查過的分類快取在記憶體"""
+
+    def __init__(self, default_category: str, log_path: Optional[str] = None):
+        self.default_category = default_category
+        self.log_path = log_path
+        self._categories: Dict[str, Category] = {}
+        self._log_lock = threading.Lock()
+
+    def _category(self, name: str) -> Category:
+        name = (name or self.default_category)[:50]
+        if name not in self._categories:
+            # Category.name 沒有唯一限制，取最早建立的同名分類
+            category = Category.objects.filter(name=name).order_by('id').first()
+            self._categories[name] = category or Category.objects.create(name=name)
+        return self._categories[name]
+
+    def write(self, results: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        results 每筆為 {'url', 'status', 'product', 'etag', 'last_modified'}，
+        status 為 fetched / not_modified / gone；回傳新增、更新（內容變動）、停用與價格變動筆數。
+        未變更（304 或內容雜湊相同）與下架的商品只以一次 UPDATE ... WHERE id IN 更新時間與狀態，不重寫內容。
+        """
+        now = timezone.now()
+        existing: Dict[str, Dict[str, Any]] = {}
+        rows = Product.objects.filter(source_url__in=[r['url'] for r in results]).order_by('id').values(
+            'source_url', 'id', 'is_active', 'price', 'content_hash', 'etag', 'last_modified', 'crawled_at',
+            'first_crawled_at', 'crawl_count', 'change_count',
+        )
+        for row in rows:
+            existing.setdefault(row['source_url'], row)
+
+        to_create, to_update, revalidated, touched_ids, gone_ids = [], [], [], [], []
+        price_changes: List[Tuple[Product, Optional[Decimal]]] = []
+        observations = []
+        for result in results:
+            row = existing.get(result['url'])
+            if result['status'] == 'gone':
+                if row is not None and row['is_active']:
+                    gone_ids.append(row['id'])
+                observations.append((result['url'], 'gone', False))
+                continue
+            if result['status'] == 'not_modified':
+                if row is not None:
+                    touched_ids.append(row['id'])
+                observations.append((result['url'], 'not_modified', False))
+                continue
+            fields = result['product']
+            category = self._category(fields['category'])
+            content_hash = product_content_hash(fields, category.name)
+            etag, last_modified = result.get('etag', ''), result.get('last_modified', '')
+            if row is not None and row['content_hash'] == content_hash:
+                # 內容相同（例如只有頁面版型或 ETag 變了）：只更新驗證值，不重寫商品也不記錄價格
+                touched_ids.append(row['id'])
+                if (etag, last_modified) != (row['etag'], row['last_modified']):
+                    revalidated.append(Product(pk=row['id'], etag=etag, last_modified=last_modified))
+                observations.append((result['url'], 'fetched', False))
+                continue
+            product = Product(pk=row['id'] if row else None, source_url=result['url'], category=category,
+                              etag=etag, last_modified=last_modified, content_hash=content_hash,
+                              crawled_at=now, is_active=True,
+                              **{key: fields[key] for key in PRODUCT_FIELDS})
+            if row is None:
+                product.first_crawled_at = now
+                product.crawl_count = 1
+                to_create.append(product)
+                price_changes.append((product, None))
+            else:
+                product.first_crawled_at = row['first_crawled_at'] or row['crawled_at']
+                product.last_changed_at = now
+                product.crawl_count = row['crawl_count'] + 1
+                product.change_count = row['change_count'] + 1
+                to_update.append(product)
+                if product.price != row['price']:
+                    price_changes.append((product, row['price']))
+            observations.append((result['url'], 'fetched', row is not None))
+
+        with transaction.atomic():
+            if to_create:
+                Product.objects.bulk_create(to_create, batch_size=500)
+            if to_update:
+                Product.objects.bulk_update(
+                    to_update,
+                    ['category', *PRODUCT_FIELDS, 'etag', 'last_modified', 'content_hash', 'crawled_at', 'is_active',
+                     'first_crawled_at', 'last_changed_at', 'crawl_count', 'change_count'],
+                    batch_size=500,
+                )
+            if revalidated:
+                Product.objects.bulk_update(revalidated, ['etag', 'last_modified'], batch_size=500)
+            if price_changes:
+                # 新商品的第一筆紀錄 previous_price 為空（資料庫不支援回傳主鍵時略過）
+                ProductPriceHistory.objects.bulk_create([
+                    ProductPriceHistory(product_id=product.pk, price=product.price, previous_price=previous, changed_at=now)
+                    for product, previous in price_changes if product.pk is not None
+                ], batch_size=500)
+            tracking = {
+                'crawl_count': F('crawl_count') + 1,
+                'first_crawled_at': Coalesce('first_crawled_at', 'crawled_at', Value(now, output_field=DateTimeField())),
+            }
+            if touched_ids:
+                Product.objects.filter(pk__in=touched_ids).update(crawled_at=now, is_active=True, **tracking)
+            if gone_ids:
+                Product.objects.filter(pk__in=gone_ids).update(crawled_at=now, is_active=False, **tracking)
+        if self.log_path:
+            self._append_log(now, observations)
+        return {'created': len(to_create), 'updated': len(to_update), 'deactivated': len(gone_ids),
+                'price_changed': sum(previous is not None for _, previous in price_changes)}
+
+    def _append_log(self, now, observations: List[Tuple[str, str, bool]]):
+        """附加爬取觀測紀錄（JSONL），供 recrawl_products --dry-run 回放"""
+        ts = now.isoformat()
+        lines = ''.join(
+            json.dumps({'url': url, 'ts': ts, 'status': status, 'changed': changed}) + '\n'
+            for url, status, changed in observations
+        )
+        with self._log_lock, open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+# ======================================================
+# 抓取
+# ======================================================
+class ProductCrawler:
+    """asyncio 爬蟲：並行抓取 → 解析 → 批次 upsert"""
+
+    def __init__(self, concurrency: int = 64, per_host: int = 8, batch_size: int = 200, timeout_sec: float = 30.0,
+                 retries: int = 2, default_category: str = '未分類', user_agent: str = 'lab-and-contest-crawler/1.0',
+                 log_path: Optional[str] = None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.batch_size = batch_size
+        self.timeout_sec = timeout_sec
+        self.retries = retries
+        self.user_agent = user_agent
+        self.upserter = ProductUpserter(default_category, log_path)
+        self.stats = {'fetched': 0, 'not_modified': 0, 'gone': 0, 'parse_failed': 0, 'errors': 0, 'write_failed': 0,
+                      'created': 0, 'updated': 0, 'deactivated': 0, 'price_changed': 0}
+
+    async def fetch(self, session, url: str, validators: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """抓取單一網址，回傳 upsert 用的結果；錯誤時回傳 None"""
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url, headers=headers, allow_redirects=True) as resp:
+                    if resp.status == 304:
+                        self.stats['not_modified'] += 1
+                        return {'url': url, 'status': 'not_modified'}
+                    if resp.status in (404, 410):
+                        self.stats['gone'] += 1
+                        return {'url': url, 'status': 'gone'}
+                    if resp.status in RETRY_STATUSES and attempt < self.retries:
+                        await asyncio.sleep(_backoff(attempt, resp.headers.get('Retry-After')))
+                        continue
+                    if resp.status != 200:
+                        self.stats['errors'] += 1
+                        logger.warning("抓取失敗 %s: HTTP %d", url, resp.status)
+                        return None
+                    body = await resp.text(errors='replace')
+                    try:
+                        product = parse_product(body, resp.headers.get('Content-Type', 'text/html'))
+                    except Exception:
+                        # 單一頁面格式異常不中斷整批爬取
+                        self.stats['errors'] += 1
+                        logger.exception("解析失敗 %s", url)
+                        return None
+                    if product is None:
+                        self.stats['parse_failed'] += 1
+                        return None
+                    self.stats['fetched'] += 1
+                    return {
+                        'url': url,
+                        'status': 'fetched',
+                        'product': product,
+                        'etag': resp.headers.get('ETag', ''),
+                        'last_modified': resp.headers.get('Last-Modified', ''),
+                    }
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.retries:
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+                self.stats['errors'] += 1
+                logger.warning("抓取失敗 %s: %s", url, e)
+                return None
+        return None
+
+    async def run(self, targets: List[Dict[str, str]]) -> Dict[str, int]:
+        """targets 每筆為 {'url', 'etag', 'last_modified'}；回傳統計"""
+        urls = asyncio.Queue()
+        for target in targets:
+            urls.put_nowait(target)
+        results = asyncio.Queue(maxsize=self.batch_size * 2)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout_sec)
+        write = sync_to_async(self.upserter.write, thread_sensitive=True)
+
+        async def fetcher(session):
+            while True:
+                try:
+                    target = urls.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self.fetch(session, target['url'], target)
+                if result is not None:
+                    await results.put(result)
+
+        async def write_batch(batch):
+            try:
+                counts = await write(batch)
+            except Exception:
+                # 單批寫入失敗（資料庫錯誤等）只略過該批，其餘批次照常寫入
+                self.stats['write_failed'] += len(batch)
+                logger.exception("寫入 %d 筆商品失敗", len(batch))
+                return
+            for key, value in counts.items():
+                self.stats[key] += value
+
+        async def writer():
+            batch = []
+            while True:
+                result = await results.get()
+                if result is not None:
+                    batch.append(result)
+                if batch and (result is None or len(batch) >= self.batch_size):
+                    await write_batch(batch)
+                    batch = []
+                if result is None:
+                    return
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={'User-Agent': self.user_agent}) as session:
+            fetchers = [asyncio.create_task(fetcher(session)) for _ in range(min(self.concurrency, len(targets)) or 1)]
+
+            async def fetch_all():
+                await asyncio.gather(*fetchers)
+                await results.put(None)
+
+            writer_task = asyncio.create_task(writer())
+            fetch_task = asyncio.create_task(fetch_all())
+            tasks = [*fetchers, fetch_task, writer_task]
+            try:
+                # writer 出錯結束時 fetcher 會卡在已滿的 results.put()；同時監看兩者，任一方出錯就取消其餘工作並拋出
+                done, _ = await asyncio.wait([fetch_task, writer_task], return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        return self.stats
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    """重試等待秒數：優先採用 Retry-After，否則指數退避加抖動"""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), 60.0)
+    return min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
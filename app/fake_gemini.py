@@ -0,0 +1,164 @@
+# app/fake_gemini.py
+"""
+本地 Gemini 替身，用於壓力測試與離線開發
+
+設定 GEMINI_BACKEND=fake 後，AIRecommendationService 會改用 FakeGeminiModel，
+不呼叫真正的 API、不消耗配額。行為由環境變數控制：
+
+    GEMINI_FAKE_LATENCY_MS       延遲中位數（毫秒），預設 800
+    GEMINI_FAKE_LATENCY_DIST     延遲分佈：fixed / uniform / lognormal，預設 lognormal
+    GEMINI_FAKE_LATENCY_SIGMA    lognormal 的 sigma；uniform 時為 ±比例，預設 0.5
+    GEMINI_FAKE_ERROR_RATE       丟出例外（模擬 429/500）的機率，預設 0
+    GEMINI_FAKE_MALFORMED_RATE   回傳無法解析 JSON 的機率，預設 0
+    GEMINI_FAKE_SEED             亂數種子（選填）
+"""
+import os
+import json
+import time
+import random
+import functools
+import threading
+from typing import Any, Dict, Optional
+
+from .token_budget import IMAGE_TILE_TOKENS, estimate_text_tokens
+
+FAKE_STYLE_SUGGESTIONS = [
+    {"style_name": "現代風", "description": "線條俐落、色彩簡潔，適合都會小宅。"},
+    {"style_name": "北歐風", "description": "淺色木質與自然採光，營造溫暖明亮的空間。"},
+    {"style_name": "工業風", "description": "裸露管線與水泥質感，展現粗獷個性。"},
+    {"style_name": "日式風", "description": "木質與和紙元素，強調收納與寧靜氛圍。"},
+    {"style_name": "美式風", "description": "經典線板與溫潤配色，舒適大方。"},
+]
+
+
+class FakeUsageMetadata:
+    """模擬回應的 usage_metadata"""
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeCountTokensResponse:
+    """模擬 count_tokens 回傳物件"""
+
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+class FakeResponse:
+    """模擬 generate_content 回傳物件，提供 .text 與 .usage_metadata"""
+
+    def __init__(self, text: str, usage_metadata: Optional[FakeUsageMetadata] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeGeminiError(RuntimeError):
+    """模擬 Gemini API 錯誤（429 / 500）"""
+
+
+class FakeGeminiModel:
+    """與 genai.GenerativeModel 相容的 generate_content 替身"""
+
+    def __init__(self, latency_ms: float = 800.0, latency_dist: str = 'lognormal', latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, malformed_rate: float = 0.0, seed: Optional[int] = None):
+        if latency_dist not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"不支援的延遲分佈: {latency_dist}")
+        self.model_name = 'fake-gemini'
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.call_count = 0
+
+    @classmethod
+    def from_env(cls) -> 'FakeGeminiModel':
+        seed = os.getenv('GEMINI_FAKE_SEED')
+        return cls(
+            latency_ms=float(os.getenv('GEMINI_FAKE_LATENCY_MS', '800')),
+            latency_dist=os.getenv('GEMINI_FAKE_LATENCY_DIST', 'lognormal'),
+            latency_sigma=float(os.getenv('GEMINI_FAKE_LATENCY_SIGMA', '0.5')),
+            error_rate=float(os.getenv('GEMINI_FAKE_ERROR_RATE', '0')),
+            malformed_rate=float(os.getenv('GEMINI_FAKE_MALFORMED_RATE', '0')),
+            seed=int(seed) if seed else None,
+        )
+
+    def _sample_latency_sec(self) -> float:
+        with self._lock:
+            if self.latency_dist == 'fixed':
+                ms = self.latency_ms
+            elif self.latency_dist == 'uniform':
+                spread = self.latency_ms * self.latency_sigma
+                ms = self._random.uniform(self.latency_ms - spread, self.latency_ms + spread)
+            else:
+                ms = self.latency_ms * self._random.lognormvariate(0.0, self.latency_sigma)
+        return max(ms, 0.0) / 1000
+
+    def _roll(self) -> float:
+        with self._lock:
+            self.call_count += 1
+            return self._random.random()
+
+    def _build_payload(self) -> Dict[str, Any]:
+        return {
+            "estimated_dimensions": {
+                "area_ping": 8.5,
+                "LxWxH": "4.2x3.3x2.8",
+                "analysis_basis": "依據門框與地磚尺寸推估（fake backend）。",
+            },
+            "style_suggestions": FAKE_STYLE_SUGGESTIONS,
+        }
+
+    def _build_text(self, roll: float, json_mode: bool = False) -> str:
+        payload = json.dumps(self._build_payload(), ensure_ascii=False)
+        if roll < self.error_rate + self.malformed_rate:
+            # 截斷的 JSON（非 JSON 模式時夾在說明文字中），觸發解析失敗與重試
+            truncated = payload[:len(payload) // 2]
+            return truncated if json_mode else f"以下是分析結果：\n{truncated}"
+        # structured output 模式只回傳 JSON 本體，與真實 API 相同
+        return payload if json_mode else f"```json\n{payload}\n```"
+
+    def _count(self, contents) -> int:
+        if isinstance(contents, (str, dict)):
+            contents = [contents]
+        return sum(estimate_text_tokens(part) if isinstance(part, str) else IMAGE_TILE_TOKENS
+                   for part in contents or [])
+
+    def count_tokens(self, contents=None, **kwargs) -> FakeCountTokensResponse:
+        """以粗估值模擬 count_tokens（不計延遲）"""
+        return FakeCountTokensResponse(self._count(contents))
+
+    def _stream_chunks(self, text: str, latency_sec: float, usage: FakeUsageMetadata, chunk_size: int = 64):
+        # 首個 chunk 約在 1/4 延遲後到達，其餘時間平均分配給後續 chunk；usage_metadata 隨最後一個 chunk 回傳
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        time.sleep(latency_sec / 4)
+        per_chunk = latency_sec * 3 / 4 / max(len(chunks), 1)
+        for chunk in chunks:
+            yield FakeResponse(chunk)
+            time.sleep(per_chunk)
+        yield FakeResponse('', usage)
+
+    def generate_content(self, contents=None, stream: bool = False, generation_config=None, **kwargs):
+        json_mode = (generation_config or {}).get('response_mime_type') == 'application/json'
+        latency_sec = self._sample_latency_sec()
+        roll = self._roll()
+        if roll < self.error_rate:
+            time.sleep(latency_sec / 4)
+            raise FakeGeminiError("429 Resource has been exhausted (fake backend)")
+        text = self._build_text(roll, json_mode)
+        usage = FakeUsageMetadata(self._count(contents), estimate_text_tokens(text))
+        if stream:
+            return self._stream_chunks(text, latency_sec, usage)
+        time.sleep(latency_sec)
+        return FakeResponse(text, usage)
+
+
+@functools.lru_cache(maxsize=None)
+def get_shared_fake_model() -> FakeGeminiModel:
+    """同一行程共用一個替身，讓錯誤率與亂數序列跨請求累積"""
+    return FakeGeminiModel.from_env()
@@ -0,0 +1,257 @@
+# app/fields.py
+"""
+壓縮儲存的 JSON 欄位
+
+CompressedJSONField 與 JSONField 用法相同，資料庫欄位為 BLOB，內容格式：
+    1 byte 編碼（RAW / ZLIB / ZSTD，最高位元表示使用字典）[+ 4 bytes 字典 id] + 內容
+- 序列化後小於 JSON_COMPRESSION_MIN_BYTES 的值不壓縮
+- 可選的共用字典（dictionary 參數為字典名稱）：由 train_json_dictionary 以過去的資料訓練，
+  存在 JSON_DICTIONARY_DIR/<名稱>-<id>.zdict，<名稱>.active 記錄壓縮時使用的字典 id；
+  舊字典必須保留，既有資料以寫入時的字典 id 解壓
+- 延遲解壓：從資料庫載入時只保存壓縮後的 bytes，第一次存取屬性才解壓；
+  未讀取就 save() 時直接寫回原本的 bytes，不重新壓縮
+- values() / values_list() 取得的是壓縮後的 bytes，需以 field.decode() 解開
+"""
+import re
+import json
+import zlib
+import struct
+import functools
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+from django import forms
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+# zstandard 為選用套件，未安裝時只能讀寫 zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+WITH_DICTIONARY = 0x80
+CODECS = {'zlib': ZLIB, 'zstd': ZSTD}
+DICTIONARY_ID = struct.Struct('>I')
+# zlib 的視窗只有 32KB，更長的字典用不到
+ZLIB_MAX_DICTIONARY_BYTES = 32 * 1024
+
+
+# ======================================================
+# 字典
+# ======================================================
+def dictionary_path(name: str, dictionary_id: int) -> Path:
+    return Path(settings.JSON_DICTIONARY_DIR) / f"{name}-{dictionary_id:08x}.zdict"
+
+
+def dictionary_id(data: bytes) -> int:
+    return zlib.crc32(data)
+
+
+@functools.lru_cache(maxsize=None)
+def load_dictionary(name: str, dictionary_id: int) -> bytes:
+    path = dictionary_path(name, dictionary_id)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        raise ValueError(f"找不到 JSON 壓縮字典 {path}") from None
+
+
+@functools.lru_cache(maxsize=None)
+def active_dictionary(name: str) -> Optional[int]:
+    """壓縮時使用的字典 id；沒有 <名稱>.active 時回傳 None（每個行程只讀一次，更換字典後需重啟）"""
+    try:
+        return int((Path(settings.JSON_DICTIONARY_DIR) / f"{name}.active").read_text().strip(), 16)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_dictionary(name: str, data: bytes, activate: bool = False) -> int:
+    """寫入字典檔並回傳 id；activate 時設為之後壓縮使用的字典"""
+    did = dictionary_id(data)
+    path = dictionary_path(name, did)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if activate:
+        (path.parent / f"{name}.active").write_text(f"{did:08x}\n")
+        active_dictionary.cache_clear()
+    return did
+
+
+_SEGMENT = re.compile(r'"[^"\\]{2,80}"\s*:|[^"\\,:{}\[\]，。、；！？\s]{2,80}[，。、；！？]?')
+
+
+def train_dictionary(samples: List[bytes], size: int = ZLIB_MAX_DICTIONARY_BYTES) -> bytes:
+    """
+    由樣本（序列化後的 JSON）建立 zlib 可用的原始內容字典：
+    取出 JSON 鍵與以中文標點切開的句段，依「出現在幾份樣本 x 長度」挑選，分數最高的放在字典尾端
+    （deflate 對距離較近的重複字串編碼較短）
+    """
+    frequency = Counter()
+    for sample in samples:
+        frequency.update(set(_SEGMENT.findall(sample.decode('utf-8', 'replace'))))
+    scored = sorted(
+        ((count - 1) * len(encoded), encoded)
+        for encoded, count in ((segment.encode('utf-8'), count) for segment, count in frequency.items())
+        if count > 1
+    )
+    chosen, total = [], 0
+    for _, segment in reversed(scored):
+        if total + len(segment) > size:
+            continue
+        chosen.append(segment)
+        total += len(segment)
+    return b''.join(reversed(chosen))
+
+
+def _zstd_dictionary(data: bytes):
+    return zstandard.ZstdCompressionDict(data)
+
+
+# ======================================================
+# 編碼
+# ======================================================
+def compress_json(value, codec: str = 'zlib', level: int = 6, dictionary: Optional[str] = None,
+                  min_bytes: int = 64) -> bytes:
+    """將 JSON 值編碼為 CompressedJSONField 的儲存格式"""
+    data = json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(data) < min_bytes:
+        return bytes((RAW,)) + data
+    tag = CODECS[codec]
+    header = b''
+    zdict = None
+    did = active_dictionary(dictionary) if dictionary else None
+    if did is not None:
+        zdict = load_dictionary(dictionary, did)
+        tag |= WITH_DICTIONARY
+        header = DICTIONARY_ID.pack(did)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("JSON_COMPRESSION_CODEC=zstd 需要 zstandard 套件")
+        compressor = zstandard.ZstdCompressor(level=level, dict_data=_zstd_dictionary(zdict) if zdict else None)
+        payload = compressor.compress(data)
+    else:
+        compressor = zlib.compressobj(level, zdict=zdict[-ZLIB_MAX_DICTIONARY_BYTES:]) if zdict else zlib.compressobj(level)
+        payload = compressor.compress(data) + compressor.flush()
+    # 無法壓縮的內容（例如極短或已壓縮的字串）改存原文
+    if len(payload) + len(header) >= len(data):
+        return bytes((RAW,)) + data
+    return bytes((tag,)) + header + payload
+
+
+def decompress_json(raw, dictionary: Optional[str] = None):
+    """解開 compress_json 的輸出；也接受未轉換前的 JSON 文字"""
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()
+    if isinstance(raw, str):
+        return json.loads(raw)
+    tag = raw[0]
+    body = raw[1:]
+    zdict = None
+    if tag & WITH_DICTIONARY:
+        if not dictionary:
+            raise ValueError("資料使用了字典，但欄位未設定 dictionary")
+        (did,) = DICTIONARY_ID.unpack_from(body)
+        zdict = load_dictionary(dictionary, did)
+        body = body[DICTIONARY_ID.size:]
+        tag &= ~WITH_DICTIONARY
+    if tag == RAW:
+        data = body
+    elif tag == ZLIB:
+        decompressor = zlib.decompressobj(zdict=zdict[-ZLIB_MAX_DICTIONARY_BYTES:]) if zdict else zlib.decompressobj()
+        data = decompressor.decompress(body) + decompressor.flush()
+    elif tag == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("讀取 zstd 壓縮的 JSON 需要 zstandard 套件")
+        data = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary(zdict) if zdict else None).decompress(body)
+    elif raw[:1] in b'{["':
+        # AlterField 後尚未轉換的 JSON 文字
+        data = raw
+    else:
+        raise ValueError(f"未知的 JSON 壓縮格式: {tag}")
+    return json.loads(data)
+
+
+# ======================================================
+# 欄位
+# ======================================================
+class CompressedJSONAttribute(DeferredAttribute):
+    """存取時才解壓；資料庫載入的 bytes 留在 instance.__dict__，解壓後以解開的值取代"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            value = instance.__dict__[self.field.attname] = self.field.decode(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedJSONField(models.Field):
+    """以 zlib / zstd（可選共用字典）壓縮儲存的 JSON 欄位"""
+
+    descriptor_class = CompressedJSONAttribute
+    empty_strings_allowed = False
+    description = "壓縮儲存的 JSON"
+
+    def __init__(self, *args, dictionary: Optional[str] = None, **kwargs):
+        self.dictionary = dictionary
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dictionary:
+            kwargs['dictionary'] = self.dictionary
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def encode(self, value) -> bytes:
+        return compress_json(
+            value,
+            codec=settings.JSON_COMPRESSION_CODEC,
+            level=settings.JSON_COMPRESSION_LEVEL,
+            dictionary=self.dictionary,
+            min_bytes=settings.JSON_COMPRESSION_MIN_BYTES,
+        )
+
+    def decode(self, raw):
+        return decompress_json(raw, self.dictionary)
+
+    def pre_save(self, model_instance, add):
+        # 不經過 descriptor，未讀取的值維持壓縮後的 bytes
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        # 從資料庫載入後未曾讀取的值直接寫回
+        if isinstance(value, (bytes, memoryview)):
+            return value
+        return self.encode(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        return connection.Database.Binary(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return self.decode(value)
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.JSONField, 'encoder': DjangoJSONEncoder, **kwargs})
@@ -0,0 +1,169 @@
+# app/instrumentation.py
+"""
+推薦流程各階段延遲量測
+
+以 `with stage('名稱'):` 包住要量測的程式區塊，記錄牆鐘時間與 CPU 時間：
+- 全域直方圖保存在記憶體中，由 /metrics 以 Prometheus 文字格式輸出
+- 同一請求內的量測結果由 ServerTimingMiddleware 寫入 Server-Timing 標頭
+- 事件次數（如 Gemini 解析失敗、重試）以 `EVENT_COUNTERS.increment('名稱')` 累計
+"""
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# 直方圖區間上限（秒），涵蓋毫秒級本地運算到數十秒的 Gemini 呼叫
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 150.0)
+
+
+class _Histogram:
+    """固定區間直方圖（非累積計數，輸出時再累加）"""
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(STAGE_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(STAGE_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class StageMetrics:
+    """各階段牆鐘/CPU 時間直方圖，執行緒安全"""
+
+    METRICS = (
+        ('wall', 'recommendation_stage_wall_seconds', '推薦流程各階段牆鐘時間'),
+        ('cpu', 'recommendation_stage_cpu_seconds', '推薦流程各階段 CPU 時間'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[str, _Histogram]] = {'wall': {}, 'cpu': {}}
+
+    def observe(self, stage_name: str, wall_seconds: float, cpu_seconds: float):
+        with self._lock:
+            for kind, value in (('wall', wall_seconds), ('cpu', cpu_seconds)):
+                histogram = self._histograms[kind].get(stage_name)
+                if histogram is None:
+                    histogram = self._histograms[kind][stage_name] = _Histogram()
+                histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {'wall': {}, 'cpu': {}}
+
+    def render_prometheus(self) -> str:
+        """輸出 Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for kind, metric_name, help_text in self.METRICS:
+                lines.append(f"# HELP {metric_name} {help_text}")
+                lines.append(f"# TYPE {metric_name} histogram")
+                for stage_name in sorted(self._histograms[kind]):
+                    histogram = self._histograms[kind][stage_name]
+                    cumulative = 0
+                    for bound, bucket_count in zip(STAGE_BUCKETS, histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f'{metric_name}_bucket{{stage="{stage_name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric_name}_bucket{{stage="{stage_name}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric_name}_sum{{stage="{stage_name}"}} {histogram.total:.6f}')
+                    lines.append(f'{metric_name}_count{{stage="{stage_name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+STAGE_METRICS = StageMetrics()
+
+
+class EventCounters:
+    """事件計數器，執行緒安全；比值（例如解析失敗率）交由 Prometheus 計算"""
+
+    METRIC_NAME = 'recommendation_events_total'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def increment(self, event: str, amount: int = 1):
+        with self._lock:
+            self._counts[event] = self._counts.get(event, 0) + amount
+
+    def get(self, event: str) -> int:
+        with self._lock:
+            return self._counts.get(event, 0)
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+
+    def render_prometheus(self) -> str:
+        """輸出 Prometheus text exposition format"""
+        lines = [
+            f"# HELP {self.METRIC_NAME} 推薦流程事件次數",
+            f"# TYPE {self.METRIC_NAME} counter",
+        ]
+        with self._lock:
+            for event in sorted(self._counts):
+                lines.append(f'{self.METRIC_NAME}{{event="{event}"}} {self._counts[event]}')
+        return "\n".join(lines) + "\n"
+
+
+EVENT_COUNTERS = EventCounters()
+
+# 目前請求的 (階段, 牆鐘秒數) 清單；請求範圍外為 None
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    'request_timings', default=None
+)
+
+
+def start_request_timing() -> contextvars.Token:
+    """開始收集當前請求的各階段時間"""
+    return _request_timings.set([])
+
+
+def finish_request_timing(token: contextvars.Token) -> List[Tuple[str, float]]:
+    """結束收集並回傳當前請求的各階段時間"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def current_request_timings() -> List[Tuple[str, float]]:
+    """目前請求到目前為止收集的各階段時間（複本）；請求範圍外為空清單"""
+    return list(_request_timings.get() or [])
+
+
+@contextmanager
+def stage(stage_name: str):
+    """量測區塊的牆鐘與 CPU 時間，寫入全域直方圖與當前請求"""
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.thread_time() - cpu_start
+        STAGE_METRICS.observe(stage_name, wall_seconds, cpu_seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage_name, wall_seconds))
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """將同名階段加總後組成 Server-Timing 標頭值"""
+    totals: Dict[str, List[float]] = {}
+    for stage_name, seconds in timings:
+        entry = totals.setdefault(stage_name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = []
+    for stage_name, (seconds, count) in totals.items():
+        part = f"{stage_name};dur={seconds * 1000:.1f}"
+        if count > 1:
+            part += f';desc="x{count}"'
+        parts.append(part)
+    return ", ".join(parts)
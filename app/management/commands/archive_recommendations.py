@@ -0,0 +1,240 @@
+# app/management/commands/archive_recommendations.py
+"""
+將超過保存期限的 RecommendationRequest 移到壓縮 JSONL 封存檔
+
+    python manage.py archive_recommendations                          # 封存 RECOMMENDATION_RETENTION_DAYS 天前的紀錄
+    python manage.py archive_recommendations --older-than-days 30 --images drop --dry-run
+    python manage.py archive_recommendations --enable-incremental-vacuum    # 一次性：切換成 auto_vacuum=INCREMENTAL
+
+每批（--batch-size 筆，含 RecommendationItem）先寫成一個完整的 gzip member / zstd frame 附加到封存檔並 fsync，
+再於短交易中刪除資料列，之後以 PRAGMA incremental_vacuum 歸還該批釋出的空間（--vacuum-pages 可限制頁數）；
+批次之間暫停 --pause 秒讓線上請求取得寫入鎖。中斷後重新執行會從剩下的紀錄繼續，
+寫入封存檔後、刪除前中斷的批次會在下次再封存一次（寫入另一個封存檔），read_archive() 讀取時以 id 去重。
+
+圖片（real_photo / floor_plan）預設縮成 --image-size 的 JPEG 後封存，--images drop 不封存，--images keep 原樣保留。
+封存檔可用 read_archive(目錄或檔案...) 逐筆讀回；gzip 封存也可直接 zcat（不去重）。
+"""
+import os
+import gzip
+import time
+import json
+import base64
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app.fields import CompressedJSONField
+from app.models import RecommendationItem, RecommendationRequest
+from app.thumbnails import ThumbnailError, _resize
+
+# zstandard 為選用套件，未安裝時只能使用 gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+IMAGE_FIELDS = ('real_photo', 'floor_plan')
+COMPRESSED_FIELDS = [
+    field for field in RecommendationRequest._meta.concrete_fields if isinstance(field, CompressedJSONField)
+]
+SUFFIXES = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+
+def compress_batch(data: bytes, compression: str) -> bytes:
+    """壓縮成獨立的 gzip member / zstd frame；兩種格式都允許直接串接"""
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=10, write_checksum=True).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _read_archive_file(path: Path):
+    """逐筆讀回單一封存檔（不去重）"""
+    if path.name.endswith(SUFFIXES['zstd']):
+        if zstandard is None:
+            raise RuntimeError("讀取 zstd 封存檔需要 zstandard 套件")
+        f = zstandard.ZstdDecompressor().stream_reader(path.open('rb'), read_across_frames=True)
+    else:
+        f = gzip.open(path, 'rb')
+    with f:
+        buffer = b''
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if buffer.strip():
+            yield json.loads(buffer)
+
+
+def read_archive(*paths):
+    """
+    逐筆讀回封存檔中的紀錄；傳入目錄時依檔名（時間）順序讀取其中所有封存檔。
+    刪除前中斷的批次會出現在多個封存檔，同一 id 只回傳第一次讀到的紀錄。
+    """
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.iterdir() if p.name.endswith(tuple(SUFFIXES.values()))))
+        else:
+            files.append(path)
+    seen = set()
+    for path in files:
+        for record in _read_archive_file(path):
+            if record['id'] not in seen:
+                seen.add(record['id'])
+                yield record
+
+
+def downsample_image(value: str, size: int) -> str:
+    """將 base64（可含 data URI 前綴）圖片縮成 JPEG；無法解碼時回傳空字串"""
+    if not value:
+        return value
+    prefix, _, encoded = value.rpartition(',') if value.startswith('data:') else ('', '', value)
+    try:
+        data = _resize(base64.b64decode(encoded), size, 'jpeg', quality=70)
+    except (ValueError, ThumbnailError):
+        return ''
+    encoded = base64.b64encode(data).decode('ascii')
+    return f"data:image/jpeg;base64,{encoded}" if prefix else encoded
+
+
+class Command(BaseCommand):
+    help = '將超過保存期限的推薦紀錄分批移到壓縮封存檔，並漸進回收 SQLite 空間'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=float, default=None,
+                            help='封存幾天前建立的紀錄（預設 RECOMMENDATION_RETENTION_DAYS）')
+        parser.add_argument('--output-dir', help='封存檔目錄（預設 RECOMMENDATION_ARCHIVE_DIR）')
+        parser.add_argument('--compression', choices=sorted(SUFFIXES), default='zstd' if zstandard else 'gzip',
+                            help='封存檔壓縮格式（zstd 需安裝 zstandard）')
+        parser.add_argument('--images', choices=('downsample', 'drop', 'keep'), default='downsample',
+                            help='封存檔中的圖片處理方式')
+        parser.add_argument('--image-size', type=int, default=320, help='--images downsample 的最長邊像素')
+        parser.add_argument('--batch-size', type=int, default=200, help='每批封存與刪除的筆數')
+        parser.add_argument('--max-batches', type=int, default=0, help='本次最多處理幾批（0 為不限）')
+        parser.add_argument('--pause', type=float, default=0.05, help='批次之間暫停的秒數')
+        parser.add_argument('--vacuum-pages', type=int, default=0,
+                            help='每批之後最多歸還的頁數（0 為歸還該批釋出的全部空閒頁）')
+        parser.add_argument('--no-vacuum', action='store_true', help='不歸還空間，空閒頁留給之後的寫入重複使用')
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help='將資料庫切換為 auto_vacuum=INCREMENTAL（會執行一次完整 VACUUM）後結束')
+        parser.add_argument('--dry-run', action='store_true', help='只統計會封存的紀錄')
+
+    def handle(self, *args, **options):
+        if options['enable_incremental_vacuum']:
+            self.enable_incremental_vacuum()
+            return
+        if options['compression'] == 'zstd' and zstandard is None:
+            raise CommandError('zstd 需要安裝 zstandard 套件，或改用 --compression gzip')
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size 必須大於 0')
+        days = options['older_than_days']
+        if days is None:
+            days = settings.RECOMMENDATION_RETENTION_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+        pending = RecommendationRequest.objects.filter(created_at__lt=cutoff)
+
+        if options['dry_run']:
+            count = pending.count()
+            self.stdout.write(f"{count} 筆紀錄建立於 {cutoff:%Y-%m-%d %H:%M} 之前，將被封存")
+            return
+
+        output_dir = Path(options['output_dir'] or settings.RECOMMENDATION_ARCHIVE_DIR)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / f"recommendations-{timezone.now():%Y%m%d-%H%M%S}{SUFFIXES[options['compression']]}"
+        vacuum = not options['no_vacuum'] and self.incremental_vacuum_enabled()
+        if not options['no_vacuum'] and not vacuum:
+            self.stdout.write(self.style.WARNING(
+                '資料庫未啟用 auto_vacuum=INCREMENTAL，刪除後的空間只供重複使用、檔案不會縮小；'
+                '可先執行 --enable-incremental-vacuum'
+            ))
+
+        start = time.perf_counter()
+        archived = batches = raw_bytes = released = 0
+        with path.open('ab') as f:
+            while not options['max_batches'] or batches < options['max_batches']:
+                ids = list(pending.order_by('created_at', 'id').values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                data = self.serialize(ids, options)
+                f.write(compress_batch(data, options['compression']))
+                f.flush()
+                # 封存資料確實寫入磁碟後才刪除資料列
+                os.fsync(f.fileno())
+                with transaction.atomic():
+                    RecommendationItem.objects.filter(request_id__in=ids).delete()
+                    RecommendationRequest.objects.filter(id__in=ids).delete()
+                if vacuum:
+                    released += self.incremental_vacuum(options['vacuum_pages'])
+                archived += len(ids)
+                raw_bytes += len(data)
+                batches += 1
+                if options['pause']:
+                    time.sleep(options['pause'])
+
+        elapsed = time.perf_counter() - start
+        if not archived:
+            path.unlink()
+            self.stdout.write(f"沒有建立於 {cutoff:%Y-%m-%d %H:%M} 之前的紀錄")
+            return
+        size = path.stat().st_size
+        self.stdout.write(self.style.SUCCESS(
+            f"封存 {archived} 筆（{batches} 批）→ {path}：{raw_bytes / 1024:.0f} KB 壓縮為 {size / 1024:.0f} KB，"
+            f"歸還 {released} 頁，耗時 {elapsed:.1f} 秒"
+        ))
+
+    def serialize(self, ids, options) -> bytes:
+        """將一批紀錄（含推薦項目）輸出為 JSONL bytes"""
+        items = {}
+        for item in RecommendationItem.objects.filter(request_id__in=ids).values().order_by('id'):
+            items.setdefault(item['request_id'], []).append(item)
+        lines = []
+        for record in RecommendationRequest.objects.filter(id__in=ids).values().order_by('created_at', 'id'):
+            for field in IMAGE_FIELDS:
+                if options['images'] == 'drop':
+                    record[field] = ''
+                elif options['images'] == 'downsample':
+                    record[field] = downsample_image(record[field], options['image_size'])
+            # values() 取得的是 CompressedJSONField 壓縮後的 bytes
+            for field in COMPRESSED_FIELDS:
+                record[field.attname] = field.decode(record[field.attname])
+            record['items'] = items.get(record['id'], [])
+            lines.append(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    # ---------- SQLite 空間回收 ----------
+    def incremental_vacuum_enabled(self) -> bool:
+        if connection.vendor != 'sqlite':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA auto_vacuum')
+            return cursor.fetchone()[0] == 2
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """歸還最多 pages 個空閒頁（0 為全部），回傳實際歸還的頁數；每批釋出的頁數有限，鎖住資料庫的時間很短"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA freelist_count')
+            before = cursor.fetchone()[0]
+            # sqlite3 的 execute 對沒有結果欄位的陳述式只執行一步（只歸還一頁），executescript 會執行到完成
+            connection.connection.executescript(f'PRAGMA incremental_vacuum({int(pages)});' if pages else 'PRAGMA incremental_vacuum;')
+            cursor.execute('PRAGMA freelist_count')
+            return before - cursor.fetchone()[0]
+
+    def enable_incremental_vacuum(self):
+        if connection.vendor != 'sqlite':
+            raise CommandError('incremental vacuum 只適用於 SQLite')
+        if self.incremental_vacuum_enabled():
+            self.stdout.write('資料庫已是 auto_vacuum=INCREMENTAL')
+            return
+        self.stdout.write('切換 auto_vacuum=INCREMENTAL 並執行 VACUUM（期間資料庫無法寫入）...')
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('VACUUM')
+        self.stdout.write(self.style.SUCCESS(f"完成，耗時 {time.perf_counter() - start:.1f} 秒"))
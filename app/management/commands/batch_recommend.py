@@ -0,0 +1,209 @@
+# app/management/commands/batch_recommend.py
+"""
+離線批次產生推薦
+
+manifest 為 JSONL（每行一個物件）或 CSV（含標題列），欄位：
+    key                   房間識別碼（必填，用於續跑）
+    images                圖片資料夾（相對於 manifest 所在目錄，可省略）
+    total_budget          總預算（必填）
+    room_area, dimensions, style_name, separate_budget, special_requirements  同表單欄位
+
+範例：
+    python manage.py batch_recommend rooms.jsonl --concurrency 8 --rpm 120 --batch-size 50
+
+Gemini 呼叫與線上請求共用 GEMINI_RPM / GEMINI_TPM 配額（app/rate_limit.py），以 batch 優先權排隊，
+線上請求等待時批次會暫停取額度。
+
+進度寫入 checkpoint（預設 <manifest>.checkpoint，每行一筆 JSON）。每批結果（含 AI 分析與商品方案）
+先以 bulk_create 寫入 RecommendationRequest，再寫 checkpoint，因此中斷後重新執行會從未完成的房間繼續。
+Gemini 失敗而改用預設分析（ai_status == 'fallback'）的房間記為失敗，--retry-failed 重新處理時
+以 usage_metadata.batch_key 取代先前失敗的紀錄。
+"""
+import csv
+import json
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.ai_service import AIRecommendationService
+from app.models import RecommendationRequest
+from app.rate_limit import BATCH, TokenBucket
+
+IMAGE_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
+FORM_FIELDS = ('room_area', 'dimensions', 'total_budget', 'style_name', 'separate_budget', 'special_requirements')
+
+
+def read_manifest(path: Path) -> list:
+    """讀取 JSONL 或 CSV manifest，回傳房間字典清單"""
+    if path.suffix.lower() == '.csv':
+        with path.open(newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with path.open(encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    seen = set()
+    for row in rows:
+        key = str(row.get('key') or '').strip()
+        if not key:
+            raise CommandError(f"manifest 缺少 key 欄位: {row}")
+        if key in seen:
+            raise CommandError(f"manifest 的 key 重複: {key}")
+        if not str(row.get('total_budget') or '').strip():
+            raise CommandError(f"{key} 缺少 total_budget")
+        seen.add(key)
+        row['key'] = key
+    return rows
+
+
+def read_checkpoint(path: Path) -> dict:
+    """回傳 {key: status}；最後一行可能因中斷而不完整，直接略過"""
+    done = {}
+    if not path.exists():
+        return done
+    with path.open(encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[entry['key']] = entry['status']
+    return done
+
+
+def room_status(result: dict) -> str:
+    """completed / failed；process_recommendation_request 在 Gemini 失敗改用預設分析時仍回傳 completed，需另外判斷"""
+    if result.get('status') != 'completed':
+        return 'failed'
+    if (result.get('ai_recommendation') or {}).get('ai_status') == 'fallback':
+        return 'failed'
+    return 'completed'
+
+
+def load_images(folder: Path) -> list:
+    """讀取資料夾中的圖片為 UploadedFile，依檔名排序"""
+    if not folder.is_dir():
+        raise FileNotFoundError(f"找不到圖片資料夾 {folder}")
+    return [
+        SimpleUploadedFile(path.name, path.read_bytes(), content_type=IMAGE_TYPES[path.suffix.lower()])
+        for path in sorted(folder.iterdir())
+        if path.suffix.lower() in IMAGE_TYPES
+    ]
+
+
+class Command(BaseCommand):
+    help = '依 manifest 批次產生推薦並寫入 RecommendationRequest（可中斷續跑）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help='JSONL 或 CSV manifest 路徑')
+        parser.add_argument('--checkpoint', help='進度檔路徑（預設 <manifest>.checkpoint）')
+        parser.add_argument('--concurrency', type=int, default=8, help='同時處理的房間數')
+        parser.add_argument('--rpm', type=float, help='額外限制每分鐘呼叫 Gemini 的房間數（預設只受共用配額限流）')
+        parser.add_argument('--batch-size', type=int, default=50, help='每批寫入資料庫的筆數')
+        parser.add_argument('--retry-failed', action='store_true', help='重新處理先前失敗的房間')
+        parser.add_argument('--limit', type=int, help='本次最多處理的房間數')
+
+    def handle(self, *args, **options):
+        manifest_path = Path(options['manifest']).resolve()
+        if not manifest_path.exists():
+            raise CommandError(f"找不到 manifest: {manifest_path}")
+        checkpoint_path = Path(options['checkpoint'] or f"{manifest_path}.checkpoint")
+        rooms = read_manifest(manifest_path)
+        done = read_checkpoint(checkpoint_path)
+        pending = [
+            room for room in rooms
+            if room['key'] not in done or (options['retry_failed'] and done[room['key']] == 'failed')
+        ]
+        if options['limit']:
+            pending = pending[:options['limit']]
+        self.stdout.write(f"共 {len(rooms)} 間，已完成 {len(rooms) - len(pending)} 間，本次處理 {len(pending)} 間")
+        if not pending:
+            return
+
+        self.limiter = TokenBucket(options['rpm']) if options['rpm'] else None
+        self.local = threading.local()
+        batch_size = max(1, options['batch_size'])
+        buffer = []
+        processed = failed = 0
+        start = time.perf_counter()
+        concurrency = max(1, options['concurrency'])
+        queue = iter(pending)
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                # 只預先排入兩倍並行數的房間，避免數千筆結果同時留在記憶體
+                for room in queue:
+                    in_flight.add(pool.submit(self.process_room, room, manifest_path.parent))
+                    if len(in_flight) >= concurrency * 2:
+                        break
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key, result = future.result()
+                    buffer.append((key, result))
+                    processed += 1
+                    failed += room_status(result) != 'completed'
+                if len(buffer) >= batch_size:
+                    self.flush(buffer, checkpoint_path)
+                    self.report(processed, failed, len(pending), start)
+        if buffer:
+            self.flush(buffer, checkpoint_path)
+        self.report(processed, failed, len(pending), start)
+        self.stdout.write(self.style.SUCCESS(f"批次完成：成功 {processed - failed} 間，失敗 {failed} 間"))
+
+    def get_service(self) -> AIRecommendationService:
+        # 每個工作執行緒各自建立服務物件；以 batch 優先權排隊，互動請求優先取得配額
+        if not hasattr(self.local, 'service'):
+            self.local.service = AIRecommendationService(priority=BATCH)
+        return self.local.service
+
+    def process_room(self, room: dict, base_dir: Path):
+        """前處理圖片並產生推薦，回傳 (key, 結果)；任何錯誤都轉為失敗結果，不中斷整批"""
+        try:
+            request_data = {field: str(room.get(field) or '').strip() for field in FORM_FIELDS}
+            images = load_images(base_dir / room['images']) if room.get('images') else []
+            request_data['image_files'] = images
+            service = self.get_service()
+            # 表單完整且沒有圖片時走本地分析，不佔用 Gemini 額度
+            if self.limiter and (images or not service._is_form_complete(request_data, [])):
+                self.limiter.acquire()
+            result = service.process_recommendation_request(request_data)
+        except Exception as e:
+            result = {'status': 'failed', 'error': str(e), 'recommendations': {}}
+        result['batch'] = {field: room.get(field, '') for field in ('separate_budget', 'special_requirements')}
+        return room['key'], result
+
+    def flush(self, buffer: list, checkpoint_path: Path):
+        """整批寫入資料庫後再記錄 checkpoint，確保 checkpoint 中的房間都已寫入"""
+        records = []
+        for key, result in buffer:
+            result.setdefault('usage', {})['batch_key'] = key
+            batch_fields = result.pop('batch')
+            record = RecommendationRequest.from_result(
+                result,
+                separate_budget=str(batch_fields['separate_budget'] or '')[:200],
+                special_requirements=str(batch_fields['special_requirements'] or ''),
+            )
+            record.status = room_status(result)
+            records.append(record)
+        with transaction.atomic():
+            # 重新處理的房間取代先前失敗的紀錄，不重複新增
+            RecommendationRequest.objects.filter(
+                status='failed', usage_metadata__batch_key__in=[key for key, _ in buffer],
+            ).delete()
+            RecommendationRequest.objects.bulk_create(records, batch_size=500)
+        with checkpoint_path.open('a', encoding='utf-8') as f:
+            for (key, _), record in zip(buffer, records):
+                f.write(json.dumps({'key': key, 'status': record.status}, ensure_ascii=False) + '\n')
+            f.flush()
+        buffer.clear()
+
+    def report(self, processed: int, failed: int, total: int, start: float):
+        elapsed = time.perf_counter() - start
+        per_hour = processed / elapsed * 3600 if elapsed else 0
+        self.stdout.write(f"進度 {processed}/{total}（失敗 {failed}），約 {per_hour:.0f} 間/小時")
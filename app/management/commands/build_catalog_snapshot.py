@@ -0,0 +1,31 @@
+# app/management/commands/build_catalog_snapshot.py
+"""
+重建跨 worker 共用的商品目錄快照（見 app/catalog_snapshot.py）
+
+    python manage.py build_catalog_snapshot
+    python manage.py build_catalog_snapshot --path /dev/shm/catalog.snapshot --catalog-only
+
+新檔以 os.replace 原子替換，執行中的 worker 在 CATALOG_SNAPSHOT_CHECK_SEC 秒內改讀新版本。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.catalog_snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = '由 PRODUCT_DATABASE 與 Product 重建商品目錄快照'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='快照檔路徑（預設 CATALOG_SNAPSHOT_PATH）')
+        parser.add_argument('--catalog-only', action='store_true', help='只包含 PRODUCT_DATABASE，不讀取 Product')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        snapshot = build_snapshot(options['path'], include_products=False if options['catalog_only'] else None)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"目錄快照 {snapshot.path}：版本 {snapshot.version:016x}，{snapshot.row_count} 筆、"
+            f"{len(snapshot.styles())} 種風格，{snapshot.path.stat().st_size / 1024:.0f} KB，耗時 {elapsed:.2f} 秒"
+        ))
@@ -1,6 +1,8 @@
 
 # app/management/commands/init_sample_data.py
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from app.catalog_snapshot import build_snapshot
 from app.models import Category, Product, Style
 
 class Command(BaseCommand):
@@ -267,13 +269,20 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(f'創建產品: {product.name}')
         
+        # 推薦改讀目錄快照，新商品要重建後才會出現
+        if settings.CATALOG_SNAPSHOT_ENABLED:
+            snapshot = build_snapshot()
+            self.stdout.write(f"已重建目錄快照（{snapshot.row_count} 筆）")
+
         self.stdout.write(
             self.style.SUCCESS('範例資料初始化完成！')
         )
 
 
 # app/management/commands/init_sample_data.py
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from app.catalog_snapshot import build_snapshot
 from app.models import Category, Product, Style
 
 class Command(BaseCommand):
@@ -540,6 +549,11 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(f'創建產品: {product.name}')
         
+        # 推薦改讀目錄快照，新商品要重建後才會出現
+        if settings.CATALOG_SNAPSHOT_ENABLED:
+            snapshot = build_snapshot()
+            self.stdout.write(f"已重建目錄快照（{snapshot.row_count} 筆）")
+
         self.stdout.write(
             self.style.SUCCESS('範例資料初始化完成！')
         )
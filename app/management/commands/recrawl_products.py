@@ -0,0 +1,103 @@
+# app/management/commands/recrawl_products.py
+"""
+依變動頻率挑選商品重新爬取（排程見 app/recrawl.py）
+
+    python manage.py recrawl_products --budget 500 --interval-hours 6 --log crawl_log.jsonl
+    python manage.py recrawl_products --budget 500 --interval-hours 6 --dry-run crawl_log.jsonl
+
+--budget 為每次執行可抓取的網址數，搭配 --interval-hours（排程執行間隔）換算每日預算。
+--dry-run 不連線、不寫資料庫，回放 crawl_products / recrawl_products --log 產生的觀測紀錄，
+比較依優先權排程與輪流重爬在同樣預算下的平均新鮮度。
+"""
+import time
+import asyncio
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.catalog_snapshot import build_snapshot
+from app.crawler import ProductCrawler
+from app.models import Product
+from app.recrawl import load_crawl_log, select_targets, simulate
+
+
+class Command(BaseCommand):
+    help = '依商品變動頻率分配爬取預算，重新抓取最可能過期的商品'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, default=500, help='本次最多抓取的網址數')
+        parser.add_argument('--interval-hours', type=float, default=24.0, help='排程執行間隔（小時），用於換算每日預算')
+        parser.add_argument('--dry-run', metavar='LOG', help='以觀測紀錄模擬新鮮度，不實際抓取')
+        parser.add_argument('--show', type=int, default=0, help='列出優先權最高的幾筆')
+        parser.add_argument('--log', help='附加本次爬取的觀測紀錄（JSONL）')
+        parser.add_argument('--concurrency', type=int, default=64, help='同時連線數上限')
+        parser.add_argument('--per-host', type=int, default=8, help='每個主機的同時連線數上限')
+        parser.add_argument('--batch-size', type=int, default=200, help='每批寫入資料庫的筆數')
+        parser.add_argument('--timeout', type=float, default=30.0, help='單一請求逾時秒數')
+        parser.add_argument('--retries', type=int, default=2, help='429/5xx/連線錯誤的重試次數')
+        parser.add_argument('--default-category', default='未分類', help='頁面沒有分類時使用的分類名稱')
+
+    def handle(self, *args, **options):
+        if options['budget'] <= 0 or options['interval_hours'] <= 0:
+            raise CommandError('--budget 與 --interval-hours 必須大於 0')
+        if options['dry_run']:
+            budget_per_day = options['budget'] * 24 / options['interval_hours']
+            self.dry_run(Path(options['dry_run']), budget_per_day, options['interval_hours'])
+            return
+
+        products = Product.objects.filter(is_active=True).values(
+            'source_url', 'etag', 'last_modified', 'crawled_at', 'first_crawled_at', 'crawl_count', 'change_count',
+        )
+        targets = select_targets(products.iterator(), options['budget'], timezone.now())
+        if not targets:
+            self.stdout.write('沒有需要抓取的網址')
+            return
+        for target in targets[:options['show']]:
+            self.stdout.write(f"{target['priority']:.4f}  {target['change_rate']:.3f}/天  {target['source_url']}")
+
+        self.stdout.write(f"依優先權抓取 {len(targets)} 個網址")
+        crawler = ProductCrawler(
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            batch_size=options['batch_size'],
+            timeout_sec=options['timeout'],
+            retries=options['retries'],
+            default_category=options['default_category'],
+            log_path=options['log'],
+        )
+        start = time.perf_counter()
+        stats = asyncio.run(crawler.run([
+            {'url': target['source_url'], 'etag': target['etag'], 'last_modified': target['last_modified']}
+            for target in targets
+        ]))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"抓取 {stats['fetched']}、未變更 {stats['not_modified']}、下架 {stats['gone']}、"
+            f"解析失敗 {stats['parse_failed']}、錯誤 {stats['errors']}、寫入失敗 {stats['write_failed']}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"內容變動 {stats['updated']}（價格變動 {stats['price_changed']}）、停用 {stats['deactivated']}，耗時 {elapsed:.1f} 秒"
+        ))
+        # 商品有新增、內容變動或停用時重建目錄快照，各 worker 在 CATALOG_SNAPSHOT_CHECK_SEC 秒內改讀新版本
+        if settings.CATALOG_SNAPSHOT_ENABLED and stats['created'] + stats['updated'] + stats['deactivated']:
+            snapshot = build_snapshot()
+            self.stdout.write(f"已重建目錄快照（{snapshot.row_count} 筆）")
+
+    def dry_run(self, log_path: Path, budget_per_day: float, step_hours: float):
+        if not log_path.exists():
+            raise CommandError(f"找不到觀測紀錄: {log_path}")
+        try:
+            report = simulate(load_crawl_log(str(log_path)), budget_per_day, step_hours)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"{report['products']} 個商品、{report['days']:.1f} 天、推估變動 {report['changes']} 次，"
+            f"每日預算 {budget_per_day:.0f}、每 {step_hours:g} 小時執行一次"
+        )
+        for policy, label in (('round_robin', '輪流重爬'), ('scheduled', '依變動頻率排程')):
+            result = report[policy]
+            self.stdout.write(f"{label}：平均新鮮度 {result['freshness']:.1%}（抓取 {result['crawls']} 次）")
+        gain = report['scheduled']['freshness'] - report['round_robin']['freshness']
+        self.stdout.write(self.style.SUCCESS(f"排程相較輪流重爬：新鮮度 {gain:+.1%}"))
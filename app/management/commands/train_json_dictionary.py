@@ -0,0 +1,90 @@
+# app/management/commands/train_json_dictionary.py
+"""
+以既有資料訓練 CompressedJSONField 的共用壓縮字典（見 app/fields.py）
+
+    python manage.py train_json_dictionary app.RecommendationRequest.ai_recommendation --samples 2000
+    python manage.py train_json_dictionary app.RecommendationRequest.ai_recommendation --activate
+
+取最近的 --samples 筆資料，80% 用來訓練、20% 比較有無字典的壓縮率；--activate 後新寫入的資料使用新字典
+（執行中的 worker 需重啟）。字典檔存在 JSON_DICTIONARY_DIR，舊字典仍被既有資料引用，不可刪除。
+"""
+import json
+import zlib
+import random
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.fields import (
+    CompressedJSONField, ZLIB_MAX_DICTIONARY_BYTES, save_dictionary, train_dictionary, zstandard,
+)
+
+
+class Command(BaseCommand):
+    help = '由既有資料訓練 CompressedJSONField 的壓縮字典'
+
+    def add_arguments(self, parser):
+        parser.add_argument('field', help='app_label.Model.field，例如 app.RecommendationRequest.ai_recommendation')
+        parser.add_argument('--samples', type=int, default=2000, help='取最近幾筆資料')
+        parser.add_argument('--size', type=int, default=None,
+                            help='字典大小（bytes，預設 zlib 為 32KB、zstd 為 64KB）')
+        parser.add_argument('--activate', action='store_true', help='設為之後寫入時使用的字典')
+
+    def handle(self, *args, **options):
+        try:
+            app_label, model_name, field_name = options['field'].split('.')
+            model = apps.get_model(app_label, model_name)
+            field = model._meta.get_field(field_name)
+        except (ValueError, LookupError) as e:
+            raise CommandError(f"找不到欄位 {options['field']}: {e}")
+        if not isinstance(field, CompressedJSONField) or not field.dictionary:
+            raise CommandError(f"{options['field']} 不是設定了 dictionary 的 CompressedJSONField")
+
+        codec = settings.JSON_COMPRESSION_CODEC
+        raw_values = model.objects.order_by('-pk').values_list(field.attname, flat=True)[:options['samples']]
+        samples = [
+            json.dumps(field.decode(raw), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            for raw in raw_values.iterator()
+        ]
+        samples = [sample for sample in samples if len(sample) >= settings.JSON_COMPRESSION_MIN_BYTES]
+        if len(samples) < 10:
+            raise CommandError(f"只有 {len(samples)} 筆可用的資料，不足以訓練字典")
+        random.Random(0).shuffle(samples)
+        split = max(1, len(samples) // 5)
+        held_out, training = samples[:split], samples[split:]
+
+        if codec == 'zstd' and zstandard is not None:
+            size = options['size'] or 64 * 1024
+            data = zstandard.train_dictionary(size, training).as_bytes()
+        else:
+            size = min(options['size'] or ZLIB_MAX_DICTIONARY_BYTES, ZLIB_MAX_DICTIONARY_BYTES)
+            data = train_dictionary(training, size)
+        if not data:
+            raise CommandError('樣本之間沒有共同內容，無法建立字典')
+
+        plain, with_dictionary = self.evaluate(held_out, data, codec)
+        total = sum(len(sample) for sample in held_out)
+        self.stdout.write(
+            f"訓練 {len(training)} 筆、驗證 {len(held_out)} 筆，字典 {len(data) / 1024:.1f} KB\n"
+            f"無字典：{total / 1024:.0f} KB → {plain / 1024:.0f} KB（{plain / total:.1%}）\n"
+            f"有字典：{total / 1024:.0f} KB → {with_dictionary / 1024:.0f} KB（{with_dictionary / total:.1%}）"
+        )
+        did = save_dictionary(field.dictionary, data, activate=options['activate'])
+        status = '已啟用' if options['activate'] else '未啟用（加上 --activate 以使用）'
+        self.stdout.write(self.style.SUCCESS(f"字典 {field.dictionary}-{did:08x} {status}"))
+
+    def evaluate(self, samples, data, codec):
+        """回傳 (無字典, 有字典) 壓縮後的總大小"""
+        level = settings.JSON_COMPRESSION_LEVEL
+        if codec == 'zstd' and zstandard is not None:
+            plain = zstandard.ZstdCompressor(level=level)
+            trained = zstandard.ZstdCompressor(level=level, dict_data=zstandard.ZstdCompressionDict(data))
+            return (sum(len(plain.compress(sample)) for sample in samples),
+                    sum(len(trained.compress(sample)) for sample in samples))
+        plain = with_dictionary = 0
+        for sample in samples:
+            plain += len(zlib.compress(sample, level))
+            compressor = zlib.compressobj(level, zdict=data)
+            with_dictionary += len(compressor.compress(sample) + compressor.flush())
+        return plain, with_dictionary
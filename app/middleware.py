@@ -0,0 +1,46 @@
+# app/middleware.py
+import re
+import time
+import uuid
+
+from .instrumentation import start_request_timing, finish_request_timing, server_timing_header
+from .structured_logging import set_request_id, reset_request_id
+
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class RequestIdMiddleware:
+    """為每個請求設定 request_id（沿用合法的 X-Request-ID），並回傳於回應標頭"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id = incoming if _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        request.request_id = request_id
+        token = set_request_id(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+
+class ServerTimingMiddleware:
+    """收集請求內各階段耗時，輸出 Server-Timing 標頭"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_request_timing()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = finish_request_timing(token)
+        # 不改動原清單：串流回應的產生器之後仍會在同一個清單記錄階段
+        response['Server-Timing'] = server_timing_header(timings + [('total', time.perf_counter() - start)])
+        return response
@@ -0,0 +1,112 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='分類名稱')),
+                ('description', models.TextField(blank=True, verbose_name='分類描述')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '產品分類',
+                'verbose_name_plural': '產品分類',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_area', models.FloatField(verbose_name='房間總坪數')),
+                ('dimensions', models.CharField(max_length=100, verbose_name='長寬高')),
+                ('total_budget', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='總預算')),
+                ('separate_budget', models.CharField(blank=True, max_length=200, verbose_name='分別預算')),
+                ('special_requirements', models.TextField(blank=True, verbose_name='特殊需求')),
+                ('real_photo', models.TextField(blank=True, verbose_name='實體圖')),
+                ('floor_plan', models.TextField(blank=True, verbose_name='平面圖')),
+                ('ai_recommendation', models.JSONField(default=dict, verbose_name='AI推薦結果')),
+                ('status', models.CharField(choices=[('pending', '處理中'), ('completed', '已完成'), ('failed', '失敗')], default='pending', max_length=20, verbose_name='狀態')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='創建時間')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '推薦請求',
+                'verbose_name_plural': '推薦請求',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Style',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='風格名稱')),
+                ('description', models.TextField(verbose_name='風格描述')),
+                ('characteristics', models.JSONField(default=list, verbose_name='風格特徵')),
+                ('suitable_spaces', models.JSONField(default=list, verbose_name='適合空間')),
+            ],
+            options={
+                'verbose_name': '設計風格',
+                'verbose_name_plural': '設計風格',
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='產品名稱')),
+                ('brand', models.CharField(blank=True, max_length=100, verbose_name='品牌')),
+                ('model_number', models.CharField(blank=True, max_length=100, verbose_name='型號')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='價格')),
+                ('unit', models.CharField(default='件', max_length=20, verbose_name='單位')),
+                ('material', models.CharField(blank=True, max_length=100, verbose_name='材質')),
+                ('color', models.CharField(blank=True, max_length=50, verbose_name='顏色')),
+                ('style', models.CharField(blank=True, max_length=50, verbose_name='風格')),
+                ('size', models.CharField(blank=True, max_length=100, verbose_name='尺寸')),
+                ('image_url', models.URLField(blank=True, verbose_name='圖片網址')),
+                ('description', models.TextField(blank=True, verbose_name='產品描述')),
+                ('source_url', models.URLField(verbose_name='來源網址')),
+                ('crawled_at', models.DateTimeField(auto_now_add=True, verbose_name='爬取時間')),
+                ('is_active', models.BooleanField(default=True, verbose_name='是否啟用')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.category', verbose_name='分類')),
+            ],
+            options={
+                'verbose_name': '產品',
+                'verbose_name_plural': '產品',
+                'ordering': ['-crawled_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField(verbose_name='數量')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='總價')),
+                ('ai_score', models.FloatField(help_text='0-1之間的分數', verbose_name='AI推薦分數')),
+                ('reason', models.TextField(verbose_name='推薦理由')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.category', verbose_name='產品分類')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.product', verbose_name='推薦產品')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='app.recommendationrequest')),
+            ],
+            options={
+                'verbose_name': '推薦項目',
+                'verbose_name_plural': '推薦項目',
+            },
+        ),
+        migrations.AddField(
+            model_name='recommendationrequest',
+            name='selected_style',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app.style', verbose_name='選擇風格'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationrequest',
+            name='estimated_cost_usd',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True, verbose_name='估算成本（美元）'),
+        ),
+        migrations.AddField(
+            model_name='recommendationrequest',
+            name='input_tokens',
+            field=models.PositiveIntegerField(default=0, verbose_name='輸入 token'),
+        ),
+        migrations.AddField(
+            model_name='recommendationrequest',
+            name='model_name',
+            field=models.CharField(blank=True, max_length=100, verbose_name='使用模型'),
+        ),
+        migrations.AddField(
+            model_name='recommendationrequest',
+            name='output_tokens',
+            field=models.PositiveIntegerField(default=0, verbose_name='輸出 token'),
+        ),
+        migrations.AddField(
+            model_name='recommendationrequest',
+            name='usage_metadata',
+            field=models.JSONField(blank=True, default=dict, verbose_name='用量明細'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_recommendationrequest_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='etag',
+            field=models.CharField(blank=True, max_length=200, verbose_name='ETag'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Last-Modified'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_product_http_validators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='change_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='觀測到的變動次數'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='crawl_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='爬取次數'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='first_crawled_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='首次爬取時間'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_changed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最後變動時間'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:43
+
+import json
+import hashlib
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 此 migration 建立時 app.models 的欄位清單與雜湊方式；固定在此，之後模型或雜湊方式變更不影響本 migration
+PRODUCT_CONTENT_FIELDS = ('name', 'brand', 'model_number', 'price', 'unit', 'material', 'color', 'style', 'size',
+                          'image_url', 'description')
+
+
+def product_content_hash(values: dict, category_name: str) -> str:
+    payload = [category_name] + [
+        format(Decimal(str(values[field])), '.2f') if field == 'price' else str(values.get(field) or '')
+        for field in PRODUCT_CONTENT_FIELDS
+    ]
+    return hashlib.md5(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def backfill(apps, schema_editor):
+    """既有商品補上內容雜湊，並以目前價格作為價格紀錄的起點"""
+    Product = apps.get_model('app', 'Product')
+    ProductPriceHistory = apps.get_model('app', 'ProductPriceHistory')
+    products = []
+    history = []
+    for product in Product.objects.select_related('category').iterator():
+        product.content_hash = product_content_hash(product.__dict__, product.category.name)
+        products.append(product)
+        history.append(ProductPriceHistory(product_id=product.pk, price=product.price, changed_at=product.crawled_at))
+    Product.objects.bulk_update(products, ['content_hash'], batch_size=500)
+    ProductPriceHistory.objects.bulk_create(history, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_product_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32, verbose_name='內容雜湊'),
+        ),
+        migrations.CreateModel(
+            name='ProductPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='價格')),
+                ('previous_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='前次價格')),
+                ('changed_at', models.DateTimeField(db_index=True, verbose_name='變動時間')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='app.product', verbose_name='產品')),
+            ],
+            options={
+                'verbose_name': '產品價格紀錄',
+                'verbose_name_plural': '產品價格紀錄',
+                'ordering': ['-changed_at'],
+                'indexes': [models.Index(fields=['product', 'changed_at'], name='app_product_product_cfca0a_idx')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:01
+
+import json
+
+import app.fields
+from django.db import migrations
+
+from app.fields import compress_json, decompress_json
+
+# (資料表, 欄位, 字典名稱)
+COMPRESSED_COLUMNS = (
+    ('app_recommendationrequest', 'ai_recommendation', 'ai_recommendation'),
+    ('app_style', 'characteristics', None),
+    ('app_style', 'suitable_spaces', None),
+)
+BATCH_SIZE = 500
+
+
+def _convert(schema_editor, convert):
+    """逐批讀出各欄位並以 convert(原值, 字典名稱) 的結果寫回"""
+    quote = schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        for table, column, dictionary in COMPRESSED_COLUMNS:
+            last_id = 0
+            while True:
+                cursor.execute(
+                    f"SELECT id, {quote(column)} FROM {quote(table)} WHERE id > %s ORDER BY id LIMIT %s",
+                    [last_id, BATCH_SIZE],
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                cursor.executemany(
+                    f"UPDATE {quote(table)} SET {quote(column)} = %s WHERE id = %s",
+                    [(convert(value, dictionary), pk) for pk, value in rows],
+                )
+                last_id = rows[-1][0]
+
+
+def compress_existing(apps, schema_editor):
+    """既有的 JSON 文字改存為壓縮格式"""
+    from django.conf import settings
+
+    def convert(value, dictionary):
+        if isinstance(value, (bytes, memoryview)):
+            # 已是壓縮格式（重複執行）
+            return value
+        return compress_json(json.loads(value), codec=settings.JSON_COMPRESSION_CODEC,
+                             level=settings.JSON_COMPRESSION_LEVEL, dictionary=dictionary,
+                             min_bytes=settings.JSON_COMPRESSION_MIN_BYTES)
+    _convert(schema_editor, convert)
+
+
+def decompress_existing(apps, schema_editor):
+    """還原為 JSONField 使用的 JSON 文字"""
+    _convert(schema_editor, lambda value, dictionary: json.dumps(decompress_json(value, dictionary), ensure_ascii=False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_product_price_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recommendationrequest',
+            name='ai_recommendation',
+            field=app.fields.CompressedJSONField(default=dict, dictionary='ai_recommendation', verbose_name='AI推薦結果'),
+        ),
+        migrations.AlterField(
+            model_name='style',
+            name='characteristics',
+            field=app.fields.CompressedJSONField(default=list, verbose_name='風格特徵'),
+        ),
+        migrations.AlterField(
+            model_name='style',
+            name='suitable_spaces',
+            field=app.fields.CompressedJSONField(default=list, verbose_name='適合空間'),
+        ),
+        migrations.RunPython(compress_existing, decompress_existing),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:11
+
+import app.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_compressed_json_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationrequest',
+            name='recommendations',
+            field=app.fields.CompressedJSONField(blank=True, default=dict, verbose_name='推薦方案'),
+        ),
+    ]
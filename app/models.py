@@ -1,8 +1,37 @@
 
 # app/models.py
+import re
+import json
+import hashlib
+from decimal import Decimal
+
 from django.db import models
+from django.urls import reverse
 from django.core.validators import MinValueValidator
 
+from .fields import CompressedJSONField
+
+_LEADING_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+# 爬蟲匯入的商品內容欄位（source_url 為比對鍵，不在內）
+PRODUCT_CONTENT_FIELDS = ('name', 'brand', 'model_number', 'price', 'unit', 'material', 'color', 'style', 'size',
+                          'image_url', 'description')
+
+
+def product_content_hash(values: dict, category_name: str) -> str:
+    """匯入內容的雜湊；價格一律以兩位小數表示，與資料庫讀回的 Decimal 相同"""
+    payload = [category_name] + [
+        format(Decimal(str(values[field])), '.2f') if field == 'price' else str(values.get(field) or '')
+        for field in PRODUCT_CONTENT_FIELDS
+    ]
+    return hashlib.md5(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _leading_float(value) -> float:
+    """取出字串中的第一個數字（例如「約 8.5 坪」→ 8.5），取不到時回傳 0"""
+    match = _LEADING_NUMBER.search(str(value or ''))
+    return float(match.group()) if match else 0.0
+
 class Category(models.Model):
     """產品分類（地板、天花板、壁紙等）"""
     name = models.CharField(max_length=50, verbose_name="分類名稱")
@@ -39,6 +68,16 @@ class Product(models.Model):
     source_url = models.URLField(verbose_name="來源網址")
     crawled_at = models.DateTimeField(auto_now_add=True, verbose_name="爬取時間")
     is_active = models.BooleanField(default=True, verbose_name="是否啟用")
+    # 條件式請求（If-None-Match / If-Modified-Since）用的快取驗證值
+    etag = models.CharField(max_length=200, blank=True, verbose_name="ETag")
+    last_modified = models.CharField(max_length=100, blank=True, verbose_name="Last-Modified")
+    # 重新爬取排程用的觀測紀錄（見 app/recrawl.py）
+    first_crawled_at = models.DateTimeField(null=True, blank=True, verbose_name="首次爬取時間")
+    last_changed_at = models.DateTimeField(null=True, blank=True, verbose_name="最後變動時間")
+    crawl_count = models.PositiveIntegerField(default=0, verbose_name="爬取次數")
+    change_count = models.PositiveIntegerField(default=0, verbose_name="觀測到的變動次數")
+    # 上次匯入內容的雜湊（product_content_hash），相同時不重寫商品也不記錄價格
+    content_hash = models.CharField(max_length=32, blank=True, verbose_name="內容雜湊")
     
     class Meta:
         verbose_name = "產品"
@@ -48,129 +87,55 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} - {self.brand}"
 
-class Style(models.Model):
-    """設計風格"""
-    name = models.CharField(max_length=50, verbose_name="風格名稱")
-    description = models.TextField(verbose_name="風格描述")
-    characteristics = models.JSONField(default=list, verbose_name="風格特徵")  # 存儲特徵列表
-    suitable_spaces = models.JSONField(default=list, verbose_name="適合空間")  # 存儲適合的空間類型
-    
-    class Meta:
-        verbose_name = "設計風格"
-        verbose_name_plural = "設計風格"
-    
-    def __str__(self):
-        return self.name
+    def thumbnail_url(self, size: int) -> str:
+        """縮圖代理網址；帶圖片網址的雜湊，圖片換了網址就會改變，瀏覽器可長期快取"""
+        version = hashlib.md5(self.image_url.encode('utf-8')).hexdigest()[:8]
+        return f"{reverse('product_thumbnail', args=[self.pk, size])}?v={version}"
 
-class RecommendationRequest(models.Model):
-    """推薦請求記錄"""
-    STATUS_CHOICES = [
-        ('pending', '處理中'),
-        ('completed', '已完成'),
-        ('failed', '失敗'),
-    ]
-    
-    # 用戶輸入的資料
-    room_area = models.FloatField(verbose_name="房間總坪數")
-    dimensions = models.CharField(max_length=100, verbose_name="長寬高")
-    total_budget = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="總預算")
-    separate_budget = models.CharField(max_length=200, blank=True, verbose_name="分別預算")
-    special_requirements = models.TextField(blank=True, verbose_name="特殊需求")
-    selected_style = models.ForeignKey(Style, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="選擇風格")
-    
-    # 圖片（Base64編碼存儲）
-    real_photo = models.TextField(blank=True, verbose_name="實體圖")
-    floor_plan = models.TextField(blank=True, verbose_name="平面圖")
-    
-    # 推薦結果
-    ai_recommendation = models.JSONField(default=dict, verbose_name="AI推薦結果")
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="狀態")
-    
-    # 時間戳
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="創建時間")
-    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
-    
-    class Meta:
-        verbose_name = "推薦請求"
-        verbose_name_plural = "推薦請求"
-        ordering = ['-created_at']
-    
-    def __str__(self):
-        return f"推薦請求 - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+class ProductPriceHistoryQuerySet(models.QuerySet):
+    def series(self, product_ids) -> dict:
+        """回傳 {product_id: [(changed_at, price), ...]}，依時間由舊到新"""
+        result = {product_id: [] for product_id in product_ids}
+        rows = self.filter(product_id__in=result).order_by('product_id', 'changed_at', 'id')
+        for product_id, changed_at, price in rows.values_list('product_id', 'changed_at', 'price'):
+            result[product_id].append((changed_at, price))
+        return result
 
-class RecommendationItem(models.Model):
-    """推薦項目"""
-    request = models.ForeignKey(RecommendationRequest, on_delete=models.CASCADE, related_name='items')
-    category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="產品分類")
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="推薦產品")
-    quantity = models.FloatField(verbose_name="數量")
-    total_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="總價")
-    ai_score = models.FloatField(verbose_name="AI推薦分數", help_text="0-1之間的分數")
-    reason = models.TextField(verbose_name="推薦理由")
-    
-    class Meta:
-        verbose_name = "推薦項目"
-        verbose_name_plural = "推薦項目"
-    
-    def __str__(self):
-        return f"{self.product.name} - 分數: {self.ai_score}"
+    def changes_since(self, since):
+        """since 之後的價格變動（不含首次匯入），由新到舊"""
+        return self.filter(changed_at__gt=since, previous_price__isnull=False).order_by('-changed_at', '-id')
 
+    def changed_styles(self, since) -> set:
+        """since 之後有商品價格變動的風格，供推薦方案快取只失效這些風格"""
+        styles = self.changes_since(since).order_by().exclude(product__style='').values_list('product__style', flat=True)
+        return set(styles.distinct())
 
-# app/models.py
-from django.db import models
-from django.core.validators import MinValueValidator
-
-class Category(models.Model):
-    """產品分類（地板、天花板、壁紙等）"""
-    name = models.CharField(max_length=50, verbose_name="分類名稱")
-    description = models.TextField(blank=True, verbose_name="分類描述")
-    created_at = models.DateTimeField(auto_now_add=True)
-    
-    class Meta:
-        verbose_name = "產品分類"
-        verbose_name_plural = "產品分類"
-    
-    def __str__(self):
-        return self.name
 
-class Product(models.Model):
-    """產品模型"""
-    category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="分類")
-    name = models.CharField(max_length=200, verbose_name="產品名稱")
-    brand = models.CharField(max_length=100, blank=True, verbose_name="品牌")
-    model_number = models.CharField(max_length=100, blank=True, verbose_name="型號")
+class ProductPriceHistory(models.Model):
+    """產品價格紀錄（只在匯入的價格與上次不同時寫入）"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history', verbose_name="產品")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="價格")
-    unit = models.CharField(max_length=20, default="件", verbose_name="單位")  # 件、坪、公尺等
-    
-    # 產品特性
-    material = models.CharField(max_length=100, blank=True, verbose_name="材質")
-    color = models.CharField(max_length=50, blank=True, verbose_name="顏色")
-    style = models.CharField(max_length=50, blank=True, verbose_name="風格")
-    size = models.CharField(max_length=100, blank=True, verbose_name="尺寸")
-    
-    # 圖片和描述
-    image_url = models.URLField(blank=True, verbose_name="圖片網址")
-    description = models.TextField(blank=True, verbose_name="產品描述")
-    
-    # 爬蟲相關
-    source_url = models.URLField(verbose_name="來源網址")
-    crawled_at = models.DateTimeField(auto_now_add=True, verbose_name="爬取時間")
-    is_active = models.BooleanField(default=True, verbose_name="是否啟用")
-    
+    # 首次匯入時為空
+    previous_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="前次價格")
+    changed_at = models.DateTimeField(db_index=True, verbose_name="變動時間")
+
+    objects = ProductPriceHistoryQuerySet.as_manager()
+
     class Meta:
-        verbose_name = "產品"
-        verbose_name_plural = "產品"
-        ordering = ['-crawled_at']
-    
+        verbose_name = "產品價格紀錄"
+        verbose_name_plural = "產品價格紀錄"
+        ordering = ['-changed_at']
+        indexes = [models.Index(fields=['product', 'changed_at'])]
+
     def __str__(self):
-        return f"{self.name} - {self.brand}"
+        return f"{self.product_id}: {self.previous_price} → {self.price}"
 
 class Style(models.Model):
     """設計風格"""
     name = models.CharField(max_length=50, verbose_name="風格名稱")
     description = models.TextField(verbose_name="風格描述")
-    characteristics = models.JSONField(default=list, verbose_name="風格特徵")  # 存儲特徵列表
-    suitable_spaces = models.JSONField(default=list, verbose_name="適合空間")  # 存儲適合的空間類型
+    characteristics = CompressedJSONField(default=list, verbose_name="風格特徵")  # 存儲特徵列表
+    suitable_spaces = CompressedJSONField(default=list, verbose_name="適合空間")  # 存儲適合的空間類型
     
     class Meta:
         verbose_name = "設計風格"
@@ -200,9 +165,19 @@ class RecommendationRequest(models.Model):
     floor_plan = models.TextField(blank=True, verbose_name="平面圖")
     
     # 推薦結果
-    ai_recommendation = models.JSONField(default=dict, verbose_name="AI推薦結果")
+    # 大多是 Gemini 產生的長篇中文說明，壓縮後存放並以共用字典提高壓縮率（見 app/fields.py）
+    ai_recommendation = CompressedJSONField(default=dict, dictionary='ai_recommendation', verbose_name="AI推薦結果")
+    # 各風格的商品方案（AIRecommendationService.recommend_products 的輸出）
+    recommendations = CompressedJSONField(default=dict, blank=True, verbose_name="推薦方案")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="狀態")
     
+    # Gemini 用量（見 app/token_budget.py）
+    model_name = models.CharField(max_length=100, blank=True, verbose_name="使用模型")
+    input_tokens = models.PositiveIntegerField(default=0, verbose_name="輸入 token")
+    output_tokens = models.PositiveIntegerField(default=0, verbose_name="輸出 token")
+    estimated_cost_usd = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True, verbose_name="估算成本（美元）")
+    usage_metadata = models.JSONField(default=dict, blank=True, verbose_name="用量明細")
+    
     # 時間戳
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="創建時間")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
@@ -215,6 +190,25 @@ class RecommendationRequest(models.Model):
     def __str__(self):
         return f"推薦請求 - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
+    @classmethod
+    def from_result(cls, result: dict, **fields) -> 'RecommendationRequest':
+        """由 process_recommendation_request 的結果建立（未儲存的）紀錄，含 Gemini 用量"""
+        usage = result.get('usage') or {}
+        return cls(
+            room_area=_leading_float(result.get('room_area')),
+            dimensions=str(result.get('dimensions') or '')[:100],
+            total_budget=result.get('total_budget') or 0,
+            ai_recommendation=result.get('ai_recommendation') or {},
+            recommendations=result.get('recommendations') or {},
+            status='completed' if result.get('status') in ['completed', 'fallback'] else 'failed',
+            model_name=usage.get('model', '')[:100],
+            input_tokens=usage.get('prompt_tokens', 0),
+            output_tokens=usage.get('output_tokens', 0),
+            estimated_cost_usd=usage.get('estimated_cost_usd'),
+            usage_metadata=usage,
+            **fields,
+        )
+
 class RecommendationItem(models.Model):
     """推薦項目"""
     request = models.ForeignKey(RecommendationRequest, on_delete=models.CASCADE, related_name='items')
@@ -0,0 +1,237 @@
+# app/rate_limit.py
+"""
+Gemini 呼叫的用戶端限流
+
+- TokenBucket：行程內 token bucket，acquire() 額度不足時等待而不是失敗
+- QuotaLimiter：依 RPM（每分鐘請求數）與 TPM（每分鐘 token 數）兩個 bucket 同時扣額度，
+  狀態存在記憶體（單一行程）或 SQLite（同一台機器的多個 worker 行程共用）。
+  interactive 優先於 batch：interactive 等待期間 batch 暫停取額度，且 batch 不得動用
+  保留給 interactive 的額度（BATCH_RESERVE_FRACTION）。收到 429 時以 pause() 讓所有呼叫端一起退讓。
+"""
+import os
+import time
+import random
+import sqlite3
+import functools
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITIES = (INTERACTIVE, BATCH)
+# batch 只能使用 bucket 容量的 (1 - 此比例)，其餘留給 interactive
+BATCH_RESERVE_FRACTION = 0.2
+# 等待中的 interactive 呼叫端宣告優先權的延長秒數
+INTERACTIVE_HOLD_SEC = 0.5
+# 共用狀態的輪詢上限（秒），讓其他行程釋出的額度能及時被看到
+MAX_POLL_SEC = 1.0
+
+_PAUSE_KEY = '__pause__'
+_INTERACTIVE_HOLD_KEY = '__interactive_hold__'
+
+
+class TokenBucket:
+    """行程內 token bucket 限流器"""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute 必須大於 0")
+        self.rate_per_sec = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1.0, rate_per_minute / 60.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """取得 amount 個額度，必要時等待；超過 timeout 秒仍未取得時回傳 False"""
+        # 超過桶容量的請求永遠湊不齊，最多扣到滿桶
+        amount = min(amount, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return True
+                wait = (amount - self._tokens) / self.rate_per_sec
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+# ======================================================
+# 跨行程共用的配額限流
+# ======================================================
+# demand：(bucket 名稱, 扣除量, 每秒補充量, 容量)
+Demand = Tuple[str, float, float, float]
+
+
+def _decide(state: Dict[str, Tuple[float, float]], demands: List[Demand], priority: str, now: float) -> float:
+    """
+    在 state（{key: (值, 更新時間)}）上嘗試扣除所有 demand，全部足夠才扣。
+    回傳 0 表示取得額度，否則回傳建議等待秒數。state 會就地更新。
+    """
+    pause_until = state.get(_PAUSE_KEY, (0.0, 0.0))[0]
+    if pause_until > now:
+        return pause_until - now
+    if priority == BATCH:
+        hold_until = state.get(_INTERACTIVE_HOLD_KEY, (0.0, 0.0))[0]
+        if hold_until > now:
+            return hold_until - now
+
+    levels = {}
+    wait = 0.0
+    for name, amount, rate_per_sec, capacity in demands:
+        tokens, updated = state.get(name, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate_per_sec)
+        levels[name] = tokens
+        amount = min(amount, capacity)
+        reserve = min(capacity * BATCH_RESERVE_FRACTION, capacity - amount) if priority == BATCH else 0.0
+        shortfall = amount + reserve - tokens
+        if shortfall > 0:
+            wait = max(wait, shortfall / rate_per_sec)
+
+    if wait > 0:
+        if priority == INTERACTIVE:
+            state[_INTERACTIVE_HOLD_KEY] = (now + min(wait, MAX_POLL_SEC) + INTERACTIVE_HOLD_SEC, now)
+        for name in levels:
+            state[name] = (levels[name], now)
+        return wait
+    for name, amount, _, capacity in demands:
+        state[name] = (levels[name] - min(amount, capacity), now)
+    return 0.0
+
+
+class MemoryQuotaStore:
+    """單一行程內共用的限流狀態"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: Dict[str, Tuple[float, float]] = {}
+
+    def try_acquire(self, demands: List[Demand], priority: str) -> float:
+        with self._lock:
+            return _decide(self._state, demands, priority, time.time())
+
+    def pause(self, seconds: float):
+        with self._lock:
+            now = time.time()
+            until = max(self._state.get(_PAUSE_KEY, (0.0, 0.0))[0], now + seconds)
+            self._state[_PAUSE_KEY] = (until, now)
+
+
+class SQLiteQuotaStore:
+    """以 SQLite 檔案在同一台機器的多個行程間共用限流狀態（BEGIN IMMEDIATE 序列化更新）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS quota_state (key TEXT PRIMARY KEY, value REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def _transact(self, fn):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            state = {key: (value, updated) for key, value, updated in conn.execute('SELECT key, value, updated FROM quota_state')}
+            before = dict(state)
+            result = fn(state)
+            changed = [(key, value, updated) for key, (value, updated) in state.items() if before.get(key) != (value, updated)]
+            if changed:
+                conn.executemany('INSERT OR REPLACE INTO quota_state (key, value, updated) VALUES (?, ?, ?)', changed)
+            conn.execute('COMMIT')
+            return result
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def try_acquire(self, demands: List[Demand], priority: str) -> float:
+        return self._transact(lambda state: _decide(state, demands, priority, time.time()))
+
+    def pause(self, seconds: float):
+        def apply(state):
+            now = time.time()
+            until = max(state.get(_PAUSE_KEY, (0.0, 0.0))[0], now + seconds)
+            state[_PAUSE_KEY] = (until, now)
+        self._transact(apply)
+
+
+class QuotaLimiter:
+    """依 RPM/TPM 配額排隊取得呼叫額度；額度不足時等待而不是失敗"""
+
+    def __init__(self, rpm: float, tpm: float, store=None, name: str = 'gemini'):
+        if rpm <= 0 or tpm <= 0:
+            raise ValueError("rpm 與 tpm 必須大於 0")
+        self.rpm = rpm
+        self.tpm = tpm
+        self.name = name
+        self.store = store or MemoryQuotaStore()
+
+    def _demands(self, tokens: int) -> List[Demand]:
+        # 容量為一分鐘的配額，允許短時間突發後再以穩定速率補充
+        return [
+            (f'{self.name}:requests', 1.0, self.rpm / 60.0, float(self.rpm)),
+            (f'{self.name}:tokens', float(tokens), self.tpm / 60.0, float(self.tpm)),
+        ]
+
+    def acquire(self, tokens: int = 0, priority: str = INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        """取得一次呼叫與 tokens 個 token 的額度；超過 timeout 秒仍未取得時回傳 False"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"不支援的優先權: {priority}")
+        demands = self._demands(tokens)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.store.try_acquire(demands, priority)
+            if wait <= 0:
+                return True
+            wait = min(wait, MAX_POLL_SEC)
+            if priority == BATCH:
+                # 錯開各行程的輪詢時間，避免同時搶同一筆額度
+                wait *= random.uniform(1.0, 1.5)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """收到 429 時呼叫，讓所有共用此狀態的呼叫端暫停 seconds 秒"""
+        self.store.pause(seconds)
+
+
+@functools.lru_cache(maxsize=None)
+def get_gemini_limiter() -> Optional[QuotaLimiter]:
+    """依 settings 建立全行程共用的 Gemini 限流器；GEMINI_RPM 或 GEMINI_TPM 為 0 時不限流"""
+    rpm = float(getattr(settings, 'GEMINI_RPM', 0))
+    tpm = float(getattr(settings, 'GEMINI_TPM', 0))
+    if rpm <= 0 or tpm <= 0:
+        return None
+    backend = getattr(settings, 'GEMINI_RATE_LIMIT_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        store = SQLiteQuotaStore(os.fspath(settings.GEMINI_RATE_LIMIT_PATH))
+    elif backend == 'memory':
+        store = MemoryQuotaStore()
+    else:
+        raise ValueError(f"不支援的限流後端: {backend}")
+    return QuotaLimiter(rpm, tpm, store)
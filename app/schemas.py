@@ -0,0 +1,71 @@
+# app/schemas.py
+"""
+Gemini 分析結果的結構定義
+
+- ANALYSIS_RESPONSE_SCHEMA：傳給 Gemini structured output（response_schema）的 JSON schema
+- AnalysisResult：回應的型別驗證（pydantic），多餘欄位保留以相容模板使用的其他欄位
+- analysis_member_adapter：AnalysisResult 單一頂層欄位的驗證器，串流中每個欄位閉合時先驗證再推送
+"""
+import functools
+from typing import Annotated, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "estimated_dimensions": {
+            "type": "object",
+            "properties": {
+                "area_ping": {"type": "number", "description": "房間總坪數"},
+                "LxWxH": {"type": "string", "description": "長x寬x高（公尺），例如 4.2x3.3x2.8"},
+                "analysis_basis": {"type": "string", "description": "估算依據"},
+            },
+            "required": ["area_ping", "LxWxH", "analysis_basis"],
+        },
+        "style_suggestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "style_name": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["style_name", "description"],
+            },
+        },
+    },
+    "required": ["estimated_dimensions", "style_suggestions"],
+}
+
+
+class EstimatedDimensions(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    # 使用者填寫或模型回傳的坪數可能是文字（例如「約 8 坪」）
+    area_ping: Union[int, float, str]
+    LxWxH: str
+    analysis_basis: str = ''
+
+
+class StyleSuggestion(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    style_name: str
+    description: str = ''
+
+
+class AnalysisResult(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    estimated_dimensions: EstimatedDimensions
+    style_suggestions: List[StyleSuggestion] = Field(min_length=1)
+
+
+@functools.lru_cache(maxsize=None)
+def analysis_member_adapter(key: str) -> Optional[TypeAdapter]:
+    """AnalysisResult 頂層欄位 key 的驗證器（含 min_length 等欄位限制）；不在結構內的欄位回傳 None"""
+    field = AnalysisResult.model_fields.get(key)
+    if field is None:
+        return None
+    return TypeAdapter(Annotated[field.annotation, field])
@@ -0,0 +1,135 @@
+# app/session_backend.py
+"""
+以快取為主的 session 引擎（SESSION_ENGINE = 'app.session_backend'）
+
+- session 內容存在 SESSION_CACHE_ALIAS 指定的快取（settings 的 'sessions'）：
+  預設為多個 worker 共用的檔案快取（SessionFileCache），單一行程部署可改用行程內 LRU（locmem）
+- 存入快取的是 SESSION_SERIALIZER 序列化後的 bytes，超過 SESSION_COMPRESS_MIN_BYTES 時以 zlib 壓縮；
+  不經過資料庫 backend 的簽章與 base64（session key 只存在快取端，不需要防竄改）
+- SESSION_WRITE_THROUGH=True 時同時寫入 django_session，快取被淘汰或清空後由資料庫補回
+"""
+import time
+import zlib
+import pickle
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+KEY_PREFIX = 'app.session_backend'
+# 快取內容的第一個 byte 標示是否壓縮
+RAW = b'\x00'
+ZLIB = b'\x01'
+
+
+class SessionStore(DBStore):
+    """快取優先的 session；寫入資料庫與否由 SESSION_WRITE_THROUGH 決定"""
+
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        self._cache = caches[settings.SESSION_CACHE_ALIAS]
+        self._write_through = settings.SESSION_WRITE_THROUGH
+        super().__init__(session_key)
+
+    @property
+    def cache_key(self):
+        return self.cache_key_prefix + self._get_or_create_session_key()
+
+    # ---------- 快取內容 ----------
+    def _dump(self, session_dict) -> bytes:
+        data = self.serializer().dumps(session_dict)
+        if len(data) >= settings.SESSION_COMPRESS_MIN_BYTES:
+            return ZLIB + zlib.compress(data, settings.SESSION_COMPRESS_LEVEL)
+        return RAW + data
+
+    def _load(self, payload: bytes):
+        data = payload[1:]
+        if payload[:1] == ZLIB:
+            data = zlib.decompress(data)
+        return self.serializer().loads(data)
+
+    # ---------- SessionBase ----------
+    def load(self):
+        try:
+            payload = self._cache.get(self.cache_key)
+            if payload is not None:
+                return self._load(payload)
+        except Exception:
+            # 無效的 key 或毀損的內容都當成沒有 session
+            pass
+        if self._write_through:
+            s = self._get_session_from_db()
+            if s:
+                data = self.decode(s.session_data)
+                self._cache.set(self.cache_key, self._dump(data), self.get_expiry_age(expiry=s.expire_date))
+                return data
+            return {}
+        self._session_key = None
+        return {}
+
+    def exists(self, session_key):
+        if not session_key:
+            return False
+        return self._cache.has_key(self.cache_key_prefix + session_key) or (
+            self._write_through and super().exists(session_key)
+        )
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if self._write_through:
+            super().save(must_create=must_create)
+            self._cache.set(self.cache_key, self._dump(self._get_session(no_load=must_create)), self.get_expiry_age())
+            return
+        if must_create:
+            func = self._cache.add
+        elif self._cache.has_key(self.cache_key):
+            func = self._cache.set
+        else:
+            raise UpdateError
+        result = func(self.cache_key, self._dump(self._get_session(no_load=must_create)), self.get_expiry_age())
+        if must_create and not result:
+            raise CreateError
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self._cache.delete(self.cache_key_prefix + session_key)
+        if self._write_through:
+            super().delete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        # 快取項目自帶逾期時間；只有寫入資料庫時需要清理 django_session
+        if settings.SESSION_WRITE_THROUGH:
+            super().clear_expired()
+
+
+class SessionFileCache(FileBasedCache):
+    """
+    session 用的檔案快取，與 FileBasedCache 檔案格式相同，差別在：
+    - FileBasedCache 每次 set 都會列出整個目錄判斷是否超過 MAX_ENTRIES，session 數量多時寫入成本隨之增加；
+      這裡每個行程每 CULL_INTERVAL 秒（OPTIONS）最多檢查一次
+    - 內容已由 SessionStore 壓縮，寫入時以 zlib level 0（不壓縮的 stored block）包裝，FileBasedCache.get 仍可讀取
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = float(params.get('OPTIONS', {}).get('CULL_INTERVAL', 60))
+        self._next_cull = 0.0
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self._cull_interval
+        super()._cull()
+
+    def _write_content(self, file, timeout, value):
+        file.write(pickle.dumps(self.get_backend_timeout(timeout), self.pickle_protocol))
+        file.write(zlib.compress(pickle.dumps(value, self.pickle_protocol), 0))
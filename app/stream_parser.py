@@ -0,0 +1,116 @@
+# app/stream_parser.py
+"""
+串流 JSON 增量解析
+
+Gemini 以串流回傳時，逐段 feed() 文字；每當第一個 JSON 物件的頂層成員
+（例如 estimated_dimensions）完整閉合，就立即解析並回傳，不必等整份回應結束。
+解析只掃描新進的文字，總成本與輸出長度成線性。
+"""
+import json
+import re
+from typing import Any, List, Tuple
+
+_STREAM_TOKENS = re.compile(r'[{}\[\]",\\]')
+
+
+class StreamFormatError(ValueError):
+    """串流輸出明顯不是 JSON，可提前中止"""
+
+
+class IncrementalJSONObjectParser:
+    """增量解析第一個頂層 JSON 物件的成員"""
+
+    def __init__(self, max_preamble: int = 2000):
+        # 超過 max_preamble 個字元仍未出現 '{'，視為格式錯誤
+        self.max_preamble = max_preamble
+        self._buffer = ''
+        self._offset = 0
+        self.members = {}
+        self.done = False
+        self.failed_members = 0
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._skip_until = -1
+        self._member_start = -1
+        self._member_emitted = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """加入一段文字，回傳本次新完成的 (key, value) 成員"""
+        if self.done or not chunk:
+            return []
+        self._buffer += chunk
+        completed = []
+        for match in _STREAM_TOKENS.finditer(self._buffer, self._pos):
+            i = match.start()
+            if i < self._skip_until:
+                continue
+            ch = self._buffer[i]
+            if self._in_string:
+                if ch == '\\':
+                    self._skip_until = i + 2
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if self._start < 0:
+                if ch == '{':
+                    self._start = i
+                    self._depth = 1
+                    self._member_start = i + 1
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 1 and not self._member_emitted:
+                    # 物件或陣列成員剛閉合，立即輸出
+                    self._emit(self._buffer[self._member_start:i + 1], completed)
+                    self._member_emitted = True
+                elif self._depth == 0:
+                    if not self._member_emitted:
+                        self._emit(self._buffer[self._member_start:i], completed)
+                    self.done = True
+                    self._pos = i + 1
+                    return completed
+            elif ch == ',' and self._depth == 1:
+                if not self._member_emitted:
+                    self._emit(self._buffer[self._member_start:i], completed)
+                self._member_start = i + 1
+                self._member_emitted = False
+        # 字串中的跳脫字元可能落在 chunk 邊界，_skip_until 會延續到下一次 feed
+        self._pos = len(self._buffer)
+        if self._start < 0 and self._offset + len(self._buffer) > self.max_preamble:
+            raise StreamFormatError(f"前 {self.max_preamble} 個字元內沒有 JSON 物件")
+        self._compact()
+        return completed
+
+    def _compact(self):
+        """丟棄已處理完的文字，只保留尚未完成的成員，避免緩衝區重複複製"""
+        cut = self._member_start if self._start >= 0 else self._pos
+        if cut <= 0:
+            return
+        self._buffer = self._buffer[cut:]
+        self._offset += cut
+        self._pos -= cut
+        self._skip_until -= cut
+        if self._start >= 0:
+            self._member_start -= cut
+
+    def _emit(self, member_text: str, completed: list):
+        if not member_text.strip():
+            return
+        try:
+            member = json.loads('{' + member_text + '}')
+        except (ValueError, RecursionError):
+            self.failed_members += 1
+            return
+        for key, value in member.items():
+            self.members[key] = value
+            completed.append((key, value))
+
+    def result(self):
+        """物件完整閉合且所有成員皆可解析時回傳成員字典，否則回傳 None"""
+        return dict(self.members) if self.done and not self.failed_members else None
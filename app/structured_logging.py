@@ -0,0 +1,142 @@
+# app/structured_logging.py
+"""
+結構化、非阻塞的日誌輸出
+
+- 呼叫端只把 LogRecord 放入佇列（QueueHandler），由背景 QueueListener 執行 JSON 格式化與 stdout 寫入
+- 每行日誌帶有 request_id（由 RequestIdMiddleware 設定）
+- SamplingFilter 用於大型除錯輸出（如完整渲染 context），只保留部分樣本
+
+設定方式見 settings.LOGGING。
+"""
+import os
+import sys
+import copy
+import json
+import queue
+import random
+import atexit
+import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar('request_id', default='-')
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(request_id: str) -> contextvars.Token:
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token):
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    在呼叫端執行緒把目前的 request_id 寫入 LogRecord。
+    Django 在中介層返回後才以 log_response 記錄 4xx/5xx（此時 contextvar 已重設），
+    這類日誌帶有 extra={'request': request}，改用 RequestIdMiddleware 存在 request 上的 request_id。
+    """
+
+    def filter(self, record):
+        request_id = get_request_id()
+        if request_id == '-':
+            request_id = getattr(getattr(record, 'request', None), 'request_id', None) or '-'
+        record.request_id = request_id
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """依比例抽樣保留日誌，rate=1.0 全部保留，rate=0 全部丟棄"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, float(rate)))
+
+    def filter(self, record):
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆日誌輸出為一行 JSON；extra={'fields': {...}} 會併入輸出"""
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'msg': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if isinstance(fields, dict):
+            payload.update(fields)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        elif record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class BufferedQueueHandler(QueueHandler):
+    """
+    將日誌放入記憶體佇列後立即返回，由背景執行緒格式化並寫入 stdout。
+    佇列滿時丟棄新日誌，避免在高負載下阻塞請求。
+    背景執行緒不會隨 fork 複製（gunicorn --preload 等），因此每個行程第一次寫日誌時才啟動；
+    fork 出的子行程改用新的佇列，不沿用父行程佇列中的日誌與鎖。
+    """
+
+    def __init__(self, maxsize: int = 10000, stream=None):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.target.setFormatter(JsonFormatter())
+        self.listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self._stop_listener)
+
+    def _after_fork(self):
+        self.queue = queue.Queue(maxsize=self.maxsize)
+        self.listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._start_lock:
+            if self._listener_pid != pid:
+                self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+                self.listener.start()
+                self._listener_pid = pid
+
+    def _stop_listener(self):
+        # atexit 會被子行程繼承，只停止本行程啟動的執行緒
+        if self.listener is not None and self._listener_pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._listener_pid = None
+
+    def prepare(self, record):
+        # 只合併訊息參數與例外文字，JSON 格式化留給背景執行緒
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
@@ -0,0 +1,303 @@
+# app/thumbnails.py
+"""
+商品圖片縮圖代理與磁碟快取
+
+- 來源圖片（Product.image_url）只下載一次，縮成最大尺寸的母圖後以來源內容的 SHA-256 定址存放，
+  不同商品共用同一張圖時只存一份；各尺寸 WebP / JPEG 縮圖在第一次被請求時由母圖產生
+- 快取索引存在同一目錄的 SQLite（與 app/rate_limit.py 相同，讓多個 worker 行程共用），
+  記錄每個檔案的大小與最後存取時間；總大小超過 THUMBNAIL_CACHE_MAX_BYTES 時刪除最久未使用的檔案
+- 網址對應到的來源內容在 THUMBNAIL_SOURCE_TTL 秒後重新下載，以反映供應商更新圖片
+- image_url 來自爬取的供應商頁面，不可信任：只下載 http(s)，主機解析到私有、loopback、link-local
+  等非公開位址時拒絕（例如雲端 metadata 169.254.169.254），轉址不自動跟隨，每一跳都重新檢查；
+  下載時直接連線到檢查過的位址，不再重新解析 DNS
+"""
+import io
+import os
+import time
+import socket
+import sqlite3
+import ipaddress
+import hashlib
+import functools
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from django.conf import settings
+
+from .instrumentation import stage, EVENT_COUNTERS
+
+FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+MASTER_NAME = 'master.webp'
+# 超過上限時刪到此比例，避免每次寫入都觸發淘汰
+EVICT_LOW_WATER = 0.9
+# 最後存取時間的更新間隔（秒），命中時不必每次都寫入索引
+TOUCH_INTERVAL_SEC = 60
+MAX_REDIRECTS = 3
+
+
+class ThumbnailError(Exception):
+    """來源圖片無法下載或解碼"""
+
+
+class ThumbnailCache:
+    """以來源內容雜湊定址、依總大小做 LRU 淘汰的縮圖磁碟快取"""
+
+    def __init__(self, root, sizes=(128, 256, 512), max_bytes: int = 512 * 1024 * 1024, source_ttl: float = 7 * 86400,
+                 fetch_timeout: float = 10.0, max_source_bytes: int = 15 * 1024 * 1024, allow_private: bool = False):
+        self.root = Path(root)
+        self.sizes = tuple(sorted(sizes))
+        self.max_bytes = max_bytes
+        self.source_ttl = source_ttl
+        self.fetch_timeout = fetch_timeout
+        self.max_source_bytes = max_source_bytes
+        self.allow_private = allow_private
+        self._local = threading.local()
+        # 同一行程內同一網址同時只下載一次；值為 [鎖, 使用中的執行緒數]，數到 0 才移除
+        self._fetch_locks = {}
+        self._fetch_locks_guard = threading.Lock()
+
+    # ---------- 索引 ----------
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.root / 'index.sqlite3', timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sources (url TEXT PRIMARY KEY, digest TEXT NOT NULL, fetched REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, bytes INTEGER NOT NULL, last_access REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS files_last_access ON files (last_access)')
+            self._local.conn = conn
+        return conn
+
+    def _read(self, relpath: str) -> Optional[bytes]:
+        """讀取快取檔案並更新存取時間；檔案已被淘汰時回傳 None"""
+        try:
+            data = (self.root / relpath).read_bytes()
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        self._connection().execute('UPDATE files SET last_access = ? WHERE path = ? AND last_access < ?',
+                                   (now, relpath, now - TOUCH_INTERVAL_SEC))
+        return data
+
+    def _write(self, relpath: str, data: bytes):
+        """先寫暫存檔再 rename，讀取端不會看到寫到一半的檔案；寫入後視需要淘汰舊檔"""
+        path = self.root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO files (path, bytes, last_access) VALUES (?, ?, ?)', (relpath, len(data), time.time()))
+        total = conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM files').fetchone()[0]
+        if total > self.max_bytes:
+            self._evict(total)
+
+    def _evict(self, total: int):
+        conn = self._connection()
+        target = self.max_bytes * EVICT_LOW_WATER
+        evicted = 0
+        while total > target:
+            rows = conn.execute('SELECT path, bytes FROM files ORDER BY last_access LIMIT 100').fetchall()
+            if not rows:
+                break
+            removed = []
+            for relpath, size in rows:
+                if total <= target:
+                    break
+                path = self.root / relpath
+                try:
+                    path.unlink()
+                    # 移除變空的 <digest> 與 <前綴> 目錄；仍有其他檔案時 rmdir 會失敗，直接略過
+                    path.parent.rmdir()
+                    path.parent.parent.rmdir()
+                except OSError:
+                    pass
+                total -= size
+                removed.append((relpath,))
+            conn.executemany('DELETE FROM files WHERE path = ?', removed)
+            evicted += len(removed)
+        EVENT_COUNTERS.increment('thumbnail_evicted', evicted)
+
+    # ---------- 來源 ----------
+    def _check_url(self, url: str) -> str:
+        """只允許 http(s)，且主機的每個解析結果都必須是公開位址；回傳檢查過、實際要連線的位址"""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ThumbnailError(f"不支援的圖片網址: {url}")
+        try:
+            infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                       type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError, ValueError) as e:
+            raise ThumbnailError(f"無法解析圖片主機 {parts.hostname}: {e}") from e
+        addresses = []
+        for info in infos:
+            address = ipaddress.ip_address(info[4][0].split('%')[0])
+            if address.version == 6 and address.ipv4_mapped:
+                address = address.ipv4_mapped
+            if not self.allow_private and (not address.is_global or address.is_multicast):
+                raise ThumbnailError(f"圖片主機 {parts.hostname} 解析到非公開位址 {address}")
+            addresses.append(address)
+        if not addresses:
+            raise ThumbnailError(f"無法解析圖片主機 {parts.hostname}")
+        return str(addresses[0])
+
+    def _fetch(self, url: str) -> bytes:
+        # requests 匯入成本高，只在真正需要下載時才載入（與 gemini_test 相同）
+        import requests
+
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                address = self._check_url(url)
+                with _pinned_session(url, address) as session:
+                    pinned_url, headers = _pinned_request(url, address)
+                    with session.get(pinned_url, headers=headers, timeout=self.fetch_timeout,
+                                     stream=True, allow_redirects=False) as resp:
+                        if resp.is_redirect:
+                            url = urljoin(url, resp.headers['Location'])
+                            continue
+                        resp.raise_for_status()
+                        chunks, received = [], 0
+                        for chunk in resp.iter_content(64 * 1024):
+                            received += len(chunk)
+                            if received > self.max_source_bytes:
+                                raise ThumbnailError(f"來源圖片超過 {self.max_source_bytes} bytes: {url}")
+                            chunks.append(chunk)
+                        return b''.join(chunks)
+        except requests.RequestException as e:
+            raise ThumbnailError(f"下載來源圖片失敗 {url}: {e}") from e
+        raise ThumbnailError(f"來源圖片轉址超過 {MAX_REDIRECTS} 次: {url}")
+
+    def _source_digest(self, url: str) -> Optional[str]:
+        """網址目前對應的來源內容雜湊；未下載過或已過期時回傳 None"""
+        row = self._connection().execute('SELECT digest, fetched FROM sources WHERE url = ?', (url,)).fetchone()
+        if row and time.time() - row[1] < self.source_ttl:
+            return row[0]
+        return None
+
+    def _master(self, url: str) -> Tuple[str, bytes]:
+        """回傳 (來源內容雜湊, 母圖)；網址未下載過、已過期或母圖被淘汰時重新下載"""
+        with self._fetch_locks_guard:
+            entry = self._fetch_locks.setdefault(url, [threading.Lock(), 0])
+            entry[1] += 1
+        lock = entry[0]
+        try:
+            with lock:
+                # 等待期間其他執行緒可能已下載完成
+                digest = self._source_digest(url)
+                master = self._read(f"{digest[:2]}/{digest}/{MASTER_NAME}") if digest else None
+                if master is not None:
+                    return digest, master
+                EVENT_COUNTERS.increment('thumbnail_source_fetch')
+                with stage('thumbnail_fetch'):
+                    source = self._fetch(url)
+                digest = hashlib.sha256(source).hexdigest()
+                relpath = f"{digest[:2]}/{digest}/{MASTER_NAME}"
+                master = self._read(relpath)
+                if master is None:
+                    with stage('thumbnail_render'):
+                        master = _resize(source, self.sizes[-1], 'webp', quality=95)
+                    self._write(relpath, master)
+                self._connection().execute('INSERT OR REPLACE INTO sources (url, digest, fetched) VALUES (?, ?, ?)',
+                                           (url, digest, time.time()))
+                return digest, master
+        finally:
+            with self._fetch_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._fetch_locks[url]
+
+    def get(self, url: str, size: int, fmt: str) -> Tuple[bytes, str]:
+        """回傳 (縮圖內容, 來源內容雜湊)；size 必須是設定的尺寸之一"""
+        if size not in self.sizes:
+            raise ValueError(f"不支援的縮圖尺寸: {size}")
+        if fmt not in FORMATS:
+            raise ValueError(f"不支援的縮圖格式: {fmt}")
+        digest = self._source_digest(url)
+        if digest:
+            data = self._read(f"{digest[:2]}/{digest}/{size}.{fmt}")
+            if data is not None:
+                EVENT_COUNTERS.increment('thumbnail_hit')
+                return data, digest
+        EVENT_COUNTERS.increment('thumbnail_miss')
+        digest, master = self._master(url)
+        relpath = f"{digest[:2]}/{digest}/{size}.{fmt}"
+        # 來源更新後內容可能與其他網址相同，縮圖已存在就直接使用
+        data = self._read(relpath)
+        if data is None:
+            with stage('thumbnail_render'):
+                data = _resize(master, size, fmt)
+            self._write(relpath, data)
+        return data, digest
+
+
+# ======================================================
+# 固定連線位址
+# ======================================================
+def _pinned_request(url: str, address: str) -> Tuple[str, dict]:
+    """把網址的主機換成已檢查的位址，原本的主機名稱改由 Host 標頭帶上"""
+    parts = urlsplit(url)
+    host = f"[{address}]" if ':' in address else address
+    hostname = f"[{parts.hostname}]" if ':' in parts.hostname else parts.hostname
+    if parts.port:
+        host, hostname = f"{host}:{parts.port}", f"{hostname}:{parts.port}"
+    return urlunsplit(parts._replace(netloc=host)), {'Host': hostname}
+
+
+def _pinned_session(url: str, address: str):
+    """
+    直接連線到 _check_url 檢查過的位址，不讓 requests 再解析一次 DNS
+    （否則 DNS rebinding 可在檢查後把主機改指向內部位址）。
+    HTTPS 以原主機名稱做 SNI 與憑證驗證；不使用環境變數中的 proxy，避免繞過固定的位址。
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    parts = urlsplit(url)
+    session = requests.Session()
+    session.trust_env = False
+    if parts.scheme == 'https':
+        adapter = HTTPAdapter()
+        adapter.init_poolmanager(1, 1, server_hostname=parts.hostname)
+        session.mount('https://', adapter)
+    return session
+
+
+def _resize(data: bytes, size: int, fmt: str, quality: int = 82) -> bytes:
+    """等比縮小到最長邊不超過 size（不放大）；JPEG 不支援透明，以白色底合成"""
+    from PIL import Image, ImageOps
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+    except Exception as e:
+        raise ThumbnailError(f"無法解碼來源圖片: {e}") from e
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    out = io.BytesIO()
+    if fmt == 'jpeg':
+        if has_alpha:
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img.convert('RGBA'), mask=img.convert('RGBA').getchannel('A'))
+            img = background
+        img.convert('RGB').save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        img.convert('RGBA' if has_alpha else 'RGB').save(out, 'WEBP', quality=quality, method=4)
+    return out.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def get_thumbnail_cache() -> ThumbnailCache:
+    """依 settings 建立全行程共用的縮圖快取"""
+    return ThumbnailCache(
+        settings.THUMBNAIL_CACHE_DIR,
+        sizes=settings.THUMBNAIL_SIZES,
+        max_bytes=settings.THUMBNAIL_CACHE_MAX_BYTES,
+        source_ttl=settings.THUMBNAIL_SOURCE_TTL,
+        fetch_timeout=settings.THUMBNAIL_FETCH_TIMEOUT,
+        max_source_bytes=settings.THUMBNAIL_MAX_SOURCE_BYTES,
+        allow_private=settings.THUMBNAIL_ALLOW_PRIVATE_SOURCES,
+    )
@@ -0,0 +1,156 @@
+# app/token_budget.py
+"""
+Gemini 請求的 token 預算與成本估算
+
+- 呼叫前以 SDK 的 count_tokens 計算提示文字 token，圖片依 Gemini 切塊規則以尺寸計算，
+  合計超過 GEMINI_INPUT_TOKEN_BUDGET 時依序縮小圖片解析度、捨棄多餘圖片（至少保留一張）
+- 呼叫後依回應的 usage_metadata 累計實際用量，並依 GEMINI_PRICING_PER_MILLION 估算成本
+"""
+import math
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Gemini 影像計費：兩邊皆 <= 384px 為 258 token，否則以 768x768 切塊，每塊 258 token
+IMAGE_TILE_TOKENS = 258
+IMAGE_SMALL_SIDE = 384
+IMAGE_TILE_SIDE = 768
+# 縮圖時依序嘗試的最長邊（像素）
+IMAGE_SIDE_STEPS = (1280, 768, 384)
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """依 Gemini 影像切塊規則估算單張圖片的 token 數"""
+    if width <= IMAGE_SMALL_SIDE and height <= IMAGE_SMALL_SIDE:
+        return IMAGE_TILE_TOKENS
+    return math.ceil(width / IMAGE_TILE_SIDE) * math.ceil(height / IMAGE_TILE_SIDE) * IMAGE_TILE_TOKENS
+
+
+def scaled_size(width: int, height: int, max_side: int) -> Tuple[int, int]:
+    """等比縮小到最長邊不超過 max_side（與 PIL thumbnail 相同，不放大）"""
+    longest = max(width, height)
+    if longest <= max_side:
+        return width, height
+    ratio = max_side / longest
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def estimate_text_tokens(text: str) -> int:
+    """粗估文字 token：ASCII 約 4 字元一個 token，中日韓文字約一字一個 token"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def estimate_contents_tokens(contents: List[str]) -> int:
+    """在無法呼叫 count_tokens 時估算文字 contents 的 token 數"""
+    return sum(estimate_text_tokens(part) for part in contents)
+
+
+def count_input_tokens(model, contents: List[str]) -> int:
+    """以 SDK 的 count_tokens 計算文字 token；模型不支援或呼叫失敗時改用估算值"""
+    count_tokens = getattr(model, 'count_tokens', None)
+    if count_tokens is not None:
+        try:
+            return int(count_tokens(contents).total_tokens)
+        except Exception as e:
+            logger.warning("count_tokens 失敗，改用估算值: %s", e)
+    return estimate_contents_tokens(contents)
+
+
+def plan_image_budget(image_sizes: List[Tuple[int, int]], text_tokens: int, budget: int) -> Tuple[int, int]:
+    """
+    回傳符合預算的 (最長邊, 保留張數)。
+    先逐步降低解析度，最小解析度仍超出預算時再從後面捨棄圖片，至少保留一張。
+    """
+    if not image_sizes:
+        return IMAGE_SIDE_STEPS[0], 0
+    for max_side in IMAGE_SIDE_STEPS:
+        tokens = sum(estimate_image_tokens(*scaled_size(w, h, max_side)) for w, h in image_sizes)
+        if text_tokens + tokens <= budget:
+            return max_side, len(image_sizes)
+    max_side = IMAGE_SIDE_STEPS[-1]
+    keep = len(image_sizes)
+    tokens = sum(estimate_image_tokens(*scaled_size(w, h, max_side)) for w, h in image_sizes)
+    while keep > 1 and text_tokens + tokens > budget:
+        keep -= 1
+        tokens -= estimate_image_tokens(*scaled_size(*image_sizes[keep], max_side))
+    return max_side, keep
+
+
+def _pricing_key(model_name: str) -> str:
+    # genai.list_models() 回傳的名稱帶有 "models/" 前綴
+    return model_name.split('/', 1)[-1]
+
+
+def estimate_cost_usd(model_name: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """依 GEMINI_PRICING_PER_MILLION 估算成本（美元），未設定價格的模型回傳 None"""
+    pricing = getattr(settings, 'GEMINI_PRICING_PER_MILLION', {}).get(_pricing_key(model_name))
+    if not pricing:
+        return None
+    input_price, output_price = pricing
+    return round((input_tokens * input_price + output_tokens * output_price) / 1_000_000, 6)
+
+
+class RequestUsage:
+    """單一推薦請求的 token 用量（跨重試累計）"""
+
+    def __init__(self, model_name: str, budget: int):
+        self.model_name = model_name
+        self.budget = budget
+        self.counted_input_tokens = 0
+        self.images_received = 0
+        self.images_sent = 0
+        self.image_max_side = 0
+        self.attempts = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.total_tokens = 0
+        # 每次呼叫依當次模型計價；任一模型沒有價格時成本為 None
+        self._cost_usd: Optional[float] = 0.0
+        # 模型路由紀錄（見 AIRecommendationService._route_tier）
+        self.route_tier = ''
+        self.route_reason = ''
+        self.escalated = False
+        # 本地分析後另以模型補充時，補充呼叫所用的路由層級（route_tier 仍為 local）
+        self.enriched_by = ''
+
+    def add_response(self, usage_metadata, output_text: str = '', model_name: Optional[str] = None):
+        """累計一次呼叫的 usage_metadata；串流提前結束時沒有，改以預先計算的輸入 token 與輸出文字估算"""
+        self.attempts += 1
+        if model_name:
+            self.model_name = model_name
+        if usage_metadata is None:
+            prompt = self.counted_input_tokens
+            output = estimate_text_tokens(output_text)
+            total = prompt + output
+        else:
+            prompt = getattr(usage_metadata, 'prompt_token_count', 0) or 0
+            output = getattr(usage_metadata, 'candidates_token_count', 0) or 0
+            total = getattr(usage_metadata, 'total_token_count', 0) or prompt + output
+        self.prompt_tokens += prompt
+        self.output_tokens += output
+        self.total_tokens += total
+        cost = estimate_cost_usd(self.model_name, prompt, output)
+        self._cost_usd = None if cost is None or self._cost_usd is None else round(self._cost_usd + cost, 6)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'model': self.model_name,
+            'budget_tokens': self.budget,
+            'counted_input_tokens': self.counted_input_tokens,
+            'images_received': self.images_received,
+            'images_sent': self.images_sent,
+            'image_max_side': self.image_max_side,
+            'attempts': self.attempts,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+            'total_tokens': self.total_tokens,
+            'estimated_cost_usd': self._cost_usd if self.attempts else None,
+            'route_tier': self.route_tier,
+            'route_reason': self.route_reason,
+            'escalated': self.escalated,
+            'enriched_by': self.enriched_by,
+        }
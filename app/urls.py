@@ -11,7 +11,19 @@ urlpatterns = [
     
     # --- AI 推薦 API ---
     path('api/ai_recommend/', views.ai_recommend, name='api_ai_recommend_submission'),
+    path('api/ai_recommend/stream/', views.ai_recommend_stream, name='api_ai_recommend_stream'),
+
+    # --- 推薦結果 JSON API (v1) ---
+    path('api/v1/recommendation/<int:recommendation_id>/', views.api_recommendation_v1, name='api_recommendation_v1'),
+    path('api/v1/products/<int:product_id>/prices/', views.api_product_prices_v1, name='api_product_prices_v1'),
+    path('api/v1/products/price_changes/', views.api_price_changes_v1, name='api_price_changes_v1'),
+
+    # --- 商品縮圖代理 ---
+    path('media/thumb/<int:product_id>/<int:size>/', views.product_thumbnail, name='product_thumbnail'),
 
     # --- ✅ 新增 Gemini 測試 API (對應 curl 指令) ---
     path('api/gemini_test/', views.gemini_test, name='api_gemini_test'),
+
+    # --- 效能指標 ---
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,16 +1,48 @@
 import os
-import traceback
-import requests
+import json
+import queue
+import hmac
+import hashlib
+import logging
+import threading
+import contextvars
+from datetime import timedelta
 from typing import Dict, Any
+from urllib.parse import urlsplit
 from dotenv import load_dotenv 
 
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.db import DatabaseError
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_datetime
 
 # 導入 AI 服務
-from .ai_service import AIRecommendationService
+from .ai_service import PARTIAL_RESET, AIRecommendationService
+from .models import Product, ProductPriceHistory, RecommendationRequest
+from .instrumentation import stage, current_request_timings, server_timing_header, STAGE_METRICS, EVENT_COUNTERS
+from .thumbnails import FORMATS as THUMBNAIL_FORMATS, ThumbnailError, get_thumbnail_cache
+
+logger = logging.getLogger(__name__)
+# 大型除錯輸出，依 settings.LOGGING 抽樣
+dump_logger = logging.getLogger('app.dump')
+
+# orjson 為選用套件，未安裝時退回標準 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_VERSION = 1
+API_RECOMMENDATION_FIELDS = (
+    'id', 'status', 'room_area', 'dimensions', 'total_budget', 'style_name',
+    'recommended_style_name', 'total_cost', 'styles', 'plans',
+)
 
 # ======================================================
 # 輔助函式
@@ -24,6 +56,87 @@ def _get_uploaded_files(request) -> list:
     # 確保檔案清單是唯一的
     return list(set(image_files))
 
+def _fragment_hash(data: Any) -> str:
+    """計算模板片段快取用的內容雜湊"""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()[:16]
+
+def _precompute_recommendation_totals(result: Dict[str, Any]):
+    """計算各方案總價與推薦風格，結果寫回 result 以便後續請求直接取用"""
+    ai_analysis = result.get('ai_recommendation', {})
+
+    # --- ✅ 修正風格名稱未知問題 ---
+    raw_recommendations = result.get('recommendations', {})
+    if isinstance(raw_recommendations, list):
+        processed_recommendations = {
+            item.get("style_name", f"unknown_{idx+1}"): item
+            for idx, item in enumerate(raw_recommendations)
+        }
+    elif isinstance(raw_recommendations, dict):
+        processed_recommendations = raw_recommendations
+    else:
+        processed_recommendations = {}
+
+    # 計算每個風格每個方案總價
+    for style_name, style_data in processed_recommendations.items():
+        if not isinstance(style_data, dict):
+            processed_recommendations[style_name] = {}
+            continue
+
+        plans = style_data.get('plans', [])
+        for i, plan in enumerate(plans):
+            plan_total_cost = 0
+            items_dict = plan.get('items', {})
+            for category in ['flooring', 'wallpaper_塗料', 'ceiling']:
+                product_info = items_dict.get(category, {})
+                price_per_unit = product_info.get('price_per_unit', 0)
+                quantity = product_info.get('quantity', 1)
+                try:
+                    product_price = float(price_per_unit) * float(quantity)
+                except (ValueError, TypeError):
+                    product_price = 0
+                # 將每個分類資料存回 plan
+                plan[category] = {
+                    'price': product_price,
+                    'name': product_info.get('name', '無推薦商品'),
+                    'unit': product_info.get('unit', '件'),
+                    'description': product_info.get('description', '')
+                }
+                plan_total_cost += product_price
+            # 將方案總價存回 plan
+            plan['total_cost'] = plan_total_cost
+
+        # 計算風格總價 (取最便宜方案)
+        style_data['total_cost'] = min([p.get('total_cost', float('inf')) for p in plans]) if plans else 0
+        style_data['style_summary'] = style_data.get('style_summary', ai_analysis.get('style_suggestions', '無建議'))
+
+    # --- ✅ 選擇最便宜風格當推薦 ---
+    recommended_style_name = None
+    min_price = float('inf')
+    for style_name, style_data in processed_recommendations.items():
+        plans = style_data.get('plans', [])
+        for plan in plans:
+            plan_cost = plan.get('total_cost', float('inf'))
+            if plan_cost < min_price:
+                min_price = plan_cost
+                recommended_style_name = style_name
+
+    # 預先排序方案並計算片段快取鍵，避免模板每次 dictsort
+    for style_name, style_data in processed_recommendations.items():
+        plans = style_data.get('plans', [])
+        plans.sort(key=lambda p: p.get('total_cost', float('inf')))
+        for plan in plans:
+            plan['fragment_hash'] = _fragment_hash([plan.get('plan'), plan.get('total_cost'), plan.get('items', {})])
+        style_data['is_recommended'] = style_name == recommended_style_name
+        style_data['fragment_hash'] = _fragment_hash([
+            style_name, style_data.get('total_cost'), style_data.get('style_summary'), style_data['is_recommended']
+        ])
+
+    result['recommendations'] = processed_recommendations
+    result['recommended_style_name'] = recommended_style_name
+    result['totals_precomputed'] = True
+    return processed_recommendations, recommended_style_name
+
 # ======================================================
 # 首頁
 # ======================================================
@@ -38,61 +151,79 @@ def index(request):
         'total_budget': '',
         'style_name': ''
     }
-    print("首頁 index 被呼叫")
+    logger.debug("首頁 index 被呼叫")
     return render(request, 'index.html', {'initial_data': initial_data, 'styles': styles})
 
 # ======================================================
 # API: AI 推薦
 # ======================================================
+def _collect_ai_request_data(request) -> Dict[str, Any]:
+    """從表單與上傳檔案組裝 AI 服務所需數據"""
+    data = request.POST.copy()
+    with stage('upload_collection'):
+        image_files = _get_uploaded_files(request)
+    ai_data: Dict[str, Any] = {
+        'room_area': data.get('room_area', '').strip(),
+        'dimensions': data.get('dimensions', '').strip(),
+        'total_budget': data.get('total_budget', '').strip(),
+        'style_name': data.get('style_name', '').strip(),
+        'image_files': image_files,
+        'separate_budget': data.get('separate_budget', '').strip(),
+        'special_requirements': data.get('special_requirements', '').strip(),
+    }
+    logger.info("收到推薦請求", extra={'fields': {
+        'room_area': ai_data['room_area'], 'total_budget': ai_data['total_budget'], 'image_count': len(image_files),
+    }})
+    return ai_data
+
+def _record_recommendation_request(recommendation_result: Dict[str, Any]) -> None:
+    """將推薦結果與 Gemini token 用量寫入 RecommendationRequest，並以資料列 id 作為推薦 id"""
+    try:
+        with stage('usage_record'):
+            record = RecommendationRequest.from_result(recommendation_result)
+            record.save()
+    except DatabaseError:
+        # 記錄用量失敗不影響推薦結果
+        logger.exception("寫入 RecommendationRequest 失敗")
+        return
+    recommendation_result['id'] = record.pk
+
+
+def _store_recommendation_result(request, recommendation_result: Dict[str, Any]) -> bool:
+    """記錄用量；推薦成功時預先計算總價並存入 session，回傳是否成功"""
+    _record_recommendation_request(recommendation_result)
+    if recommendation_result.get('status') not in ['completed', 'fallback']:
+        return False
+    _precompute_recommendation_totals(recommendation_result)
+    request.session['recommendation_result'] = recommendation_result
+    with stage('session_save'):
+        request.session.save()
+    logger.info("AI推薦完成，存入 session")
+    return True
+
 @csrf_exempt
 @require_POST
 def ai_recommend(request):
     """接收用戶表單與圖片，呼叫 AI 服務返回推薦結果"""
     try:
-        data = request.POST.copy()
-        room_area = data.get('room_area', '').strip()
-        dimensions = data.get('dimensions', '').strip()
-        total_budget = data.get('total_budget', '').strip()
-        style_name = data.get('style_name', '').strip()
-        image_files = _get_uploaded_files(request)
-
-        print(f"收到推薦請求: room_area={room_area}, total_budget={total_budget}, 圖片數量={len(image_files)}")
-
-        if not total_budget:
+        ai_data = _collect_ai_request_data(request)
+        if not ai_data['total_budget']:
             return JsonResponse({'success': False, 'error': '缺少必要欄位: 總預算'}, status=400)
-        
-        # 組裝 AI 服務所需數據
-        ai_data: Dict[str, Any] = {
-            'room_area': room_area,
-            'dimensions': dimensions,
-            'total_budget': total_budget,
-            'style_name': style_name,
-            'image_files': image_files,
-            'separate_budget': data.get('separate_budget', '').strip(),
-            'special_requirements': data.get('special_requirements', '').strip(),
-        }
 
         # 呼叫 AI 推薦服務
         service = AIRecommendationService()
         recommendation_result = service.process_recommendation_request(ai_data)
 
         # 儲存結果到 session
-        if recommendation_result.get('status') in ['completed', 'fallback']:
-            request.session['recommendation_result'] = recommendation_result
-            request.session.save()
-            print("✅ AI推薦完成，存入 session")
+        if _store_recommendation_result(request, recommendation_result):
             return JsonResponse({'success': True, 'redirect_url': '/recommend/'})
         else:
             error_msg = recommendation_result.get('error', 'AI 服務處理失敗')
-            print(f"⚠️ AI推薦失敗: {error_msg}")
+            logger.warning("AI推薦失敗: %s", error_msg)
             return JsonResponse({'success': False, 'error': error_msg}, status=500)
 
     except Exception as e:
-        error_trace = traceback.format_exc()
-        print("=" * 60)
-        print(f"FATAL: AI推薦請求發生未預期錯誤: {e}")
-        print(error_trace)
-        print("=" * 60)
+        logger.exception("AI推薦請求發生未預期錯誤: %s", e)
 
         if "file is not a recognized image file" in str(e) or "CorruptImageError" in str(e):
             return JsonResponse({'success': False, 'error': '圖片檔案無效或已損壞，請檢查圖片格式後重新上傳。'}, status=400)
@@ -104,15 +235,91 @@ def ai_recommend(request):
         }, status=500)
 
 # ======================================================
-# 推薦結果頁面
+# API: AI 推薦（串流，NDJSON）
 # ======================================================
-def recommend(request):
-    """渲染推薦結果頁面"""
-    result = request.session.get('recommendation_result', {})
-    if not result:
-        print("⚠️ 沒有推薦結果，跳轉首頁")
-        return redirect('index')
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return json.dumps(event, ensure_ascii=False).encode('utf-8') + b"\n"
+
+def _iterate_in_context(ctx: contextvars.Context, iterator):
+    """以 ctx.run 執行每一次 next()，讓回應產生器沿用建立時的 contextvars"""
+    while True:
+        try:
+            chunk = ctx.run(next, iterator)
+        except StopIteration:
+            return
+        yield chunk
+
+@csrf_exempt
+@require_POST
+def ai_recommend_stream(request):
+    """
+    與 ai_recommend 相同，但以 NDJSON 串流回傳進度：
+    Gemini 每完成一個通過驗證的頂層欄位（如 estimated_dimensions）就推送 {"event": "partial", "attempt": n, ...}；
+    該次呼叫失敗而重試、改用 pro 或改用預設分析時推送 {"event": "reset", "attempt": n}，
+    用戶端應丟棄先前的 partial，之後的 partial 屬於第 n 次呼叫。
+    partial 只供預覽，最後的 {"event": "done", ...}（結果存入 session）或 {"event": "error", ...} 才是最終結果，
+    並帶有 server_timing（串流開始後才完成的階段無法放進 Server-Timing 標頭）。
+    """
+    ai_data = _collect_ai_request_data(request)
+    if not ai_data['total_budget']:
+        return JsonResponse({'success': False, 'error': '缺少必要欄位: 總預算'}, status=400)
+
+    # 串流開始前先建立 session，確保 Set-Cookie 隨回應標頭送出
+    request.session['recommendation_pending'] = True
+    events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+    attempt = 1
+
+    def on_partial(key, value):
+        nonlocal attempt
+        if key == PARTIAL_RESET:
+            attempt = value['attempt']
+            events.put({'event': 'reset', 'attempt': attempt})
+        else:
+            events.put({'event': 'partial', 'attempt': attempt, 'key': key, 'data': value})
+
+    def worker():
+        try:
+            service = AIRecommendationService()
+            result = service.process_recommendation_request(ai_data, on_partial=on_partial)
+            events.put({'event': '_result', 'data': result})
+        except Exception as e:
+            logger.exception("AI推薦串流發生未預期錯誤: %s", e)
+            events.put({'event': '_result', 'data': {'status': 'failed', 'error': str(e)}})
 
+    # 沿用目前請求的 request_id 與計時 context
+    threading.Thread(target=contextvars.copy_context().run, args=(worker,), daemon=True).start()
+
+    def stream():
+        while True:
+            event = events.get()
+            if event['event'] != '_result':
+                yield _ndjson(event)
+                continue
+            result = event['data']
+            request.session.pop('recommendation_pending', None)
+            if _store_recommendation_result(request, result):
+                final = {'event': 'done', 'success': True, 'redirect_url': '/recommend/'}
+            else:
+                error_msg = result.get('error', 'AI 服務處理失敗')
+                logger.warning("AI推薦失敗: %s", error_msg)
+                with stage('session_save'):
+                    request.session.save()
+                final = {'event': 'error', 'success': False, 'error': error_msg}
+            final['server_timing'] = server_timing_header(current_request_timings())
+            yield _ndjson(final)
+            return
+
+    # 產生器在中介層返回後才被迭代，每一步都在請求的 context 中執行，日誌才帶有 request_id、計時寫入同一請求
+    response = StreamingHttpResponse(_iterate_in_context(contextvars.copy_context(), stream()),
+                                     content_type='application/x-ndjson; charset=utf-8')
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# ======================================================
+# 推薦結果頁面
+# ======================================================
+def _build_recommend_context(result: Dict[str, Any]) -> Dict[str, Any]:
+    """由 session 推薦結果組出 recommend_style.html 的 context"""
     ai_analysis = result.get('ai_recommendation', {})
     estimated_dims = ai_analysis.get('estimated_dimensions', {})
 
@@ -127,61 +334,11 @@ def recommend(request):
 
     gemini_text = ai_analysis.get('style_suggestions', "無詳細 AI 分析結果") 
 
-    # --- ✅ 修正風格名稱未知問題 ---
-    raw_recommendations = result.get('recommendations', {})
-    if isinstance(raw_recommendations, list):
-        processed_recommendations = {
-            item.get("style_name", f"unknown_{idx+1}"): item
-            for idx, item in enumerate(raw_recommendations)
-        }
-    elif isinstance(raw_recommendations, dict):
-        processed_recommendations = raw_recommendations
+    if result.get('totals_precomputed'):
+        processed_recommendations = result.get('recommendations', {})
+        recommended_style_name = result.get('recommended_style_name')
     else:
-        processed_recommendations = {}
-
-    # 計算每個風格每個方案總價
-    for style_name, style_data in processed_recommendations.items():
-        if not isinstance(style_data, dict):
-            processed_recommendations[style_name] = {}
-            continue
-
-        plans = style_data.get('plans', [])
-        for i, plan in enumerate(plans):
-            plan_total_cost = 0
-            items_dict = plan.get('items', {})
-            for category in ['flooring', 'wallpaper_塗料', 'ceiling']:
-                product_info = items_dict.get(category, {})
-                price_per_unit = product_info.get('price_per_unit', 0)
-                quantity = product_info.get('quantity', 1)
-                try:
-                    product_price = float(price_per_unit) * float(quantity)
-                except (ValueError, TypeError):
-                    product_price = 0
-                # 將每個分類資料存回 plan
-                plan[category] = {
-                    'price': product_price,
-                    'name': product_info.get('name', '無推薦商品'),
-                    'unit': product_info.get('unit', '件'),
-                    'description': product_info.get('description', '')
-                }
-                plan_total_cost += product_price
-            # 將方案總價存回 plan
-            plan['total_cost'] = plan_total_cost
-
-        # 計算風格總價 (取最便宜方案)
-        style_data['total_cost'] = min([p.get('total_cost', float('inf')) for p in plans]) if plans else 0
-        style_data['style_summary'] = style_data.get('style_summary', ai_analysis.get('style_suggestions', '無建議'))
-
-    # --- ✅ 選擇最便宜風格當推薦 ---
-    recommended_style_name = None
-    min_price = float('inf')
-    for style_name, style_data in processed_recommendations.items():
-        plans = style_data.get('plans', [])
-        for plan in plans:
-            plan_cost = plan.get('total_cost', float('inf'))
-            if plan_cost < min_price:
-                min_price = plan_cost
-                recommended_style_name = style_name
+        processed_recommendations, recommended_style_name = _precompute_recommendation_totals(result)
 
     context = {
         'recommendation_id': result.get('id'),
@@ -197,9 +354,20 @@ def recommend(request):
         'gemini_analysis': gemini_text,
         'recommended_style_name': recommended_style_name,  
     }
+    return context
 
-    print(f"渲染 recommend_style.html，推薦結果: {context}")
-    return render(request, 'recommend_style.html', context)
+def recommend(request):
+    """渲染推薦結果頁面"""
+    result = request.session.get('recommendation_result', {})
+    if not result:
+        logger.info("沒有推薦結果，跳轉首頁")
+        return redirect('index')
+
+    context = _build_recommend_context(result)
+
+    dump_logger.debug("渲染 recommend_style.html，推薦結果: %s", context)
+    with stage('template_render'):
+        return render(request, 'recommend_style.html', context)
 
 # ======================================================
 # Google Gemini API 測試
@@ -207,6 +375,8 @@ def recommend(request):
 @csrf_exempt
 def gemini_test(request):
     """測試呼叫 Google Gemini API"""
+    import requests
+
     try:
         GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
         if not GOOGLE_API_KEY:
@@ -221,7 +391,7 @@ def gemini_test(request):
         return JsonResponse({"success": True, "response": result}, status=200)
 
     except Exception as e:
-        print("Gemini API 呼叫失敗:", e)
+        logger.warning("Gemini API 呼叫失敗: %s", e)
         return JsonResponse({"success": False, "error": str(e)}, status=500)
 
 # ======================================================
@@ -233,7 +403,7 @@ def recommendation_detail(request, recommendation_id):
 
     recommendation_id_str = str(recommendation_id)
     if not result or str(result.get('id')) != recommendation_id_str:
-        print(f"⚠️ 找不到 recommendation_id={recommendation_id} 的資料，跳轉首頁")
+        logger.info("找不到 recommendation_id=%s 的資料，跳轉首頁", recommendation_id)
         return redirect('index')
 
     ai_analysis = result.get('ai_recommendation', {})
@@ -246,5 +416,190 @@ def recommendation_detail(request, recommendation_id):
         'style_name': result.get('style_name', ''),
     }
 
-    print(f"渲染 recommendation_detail.html，推薦詳情: {context}")
+    dump_logger.debug("渲染 recommendation_detail.html，推薦詳情: %s", context)
     return render(request, 'recommendation_detail.html', context)
+
+# ======================================================
+# API: 推薦結果 JSON (v1)
+# ======================================================
+def _compact_json_response(payload: Dict[str, Any], status: int = 200) -> HttpResponse:
+    """以精簡格式序列化 JSON（優先使用 orjson）"""
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return HttpResponse(body, status=status, content_type='application/json; charset=utf-8')
+
+def _build_recommendation_payload(result: Dict[str, Any]) -> Dict[str, Any]:
+    """將 session 中的推薦結果整理為 API 輸出格式"""
+    if result.get('totals_precomputed'):
+        processed_recommendations = result.get('recommendations', {})
+        recommended_style_name = result.get('recommended_style_name')
+    else:
+        processed_recommendations, recommended_style_name = _precompute_recommendation_totals(result)
+
+    styles = {}
+    plans = []
+    for style_name, style_data in processed_recommendations.items():
+        styles[style_name] = {
+            'style_summary': style_data.get('style_summary', ''),
+            'total_cost': style_data.get('total_cost', 0),
+            'cheapest_flag': style_data.get('cheapest_flag', False),
+        }
+        for plan in style_data.get('plans', []):
+            plans.append({
+                'style_name': style_name,
+                'plan': plan.get('plan', ''),
+                'total_cost': plan.get('total_cost', 0),
+                'items': plan.get('items', {}),
+            })
+
+    recommended_total = styles.get(recommended_style_name, {}).get('total_cost', 0) if recommended_style_name else 0
+    return {
+        'id': result.get('id'),
+        'status': result.get('status'),
+        'room_area': result.get('room_area'),
+        'dimensions': result.get('dimensions'),
+        'total_budget': result.get('total_budget'),
+        'style_name': result.get('style_name'),
+        'recommended_style_name': recommended_style_name,
+        'total_cost': recommended_total,
+        'styles': styles,
+        'plans': plans,
+    }
+
+@require_GET
+def api_recommendation_v1(request, recommendation_id):
+    """以 JSON 回傳推薦結果，支援 ?fields= 欄位篩選"""
+    result = request.session.get('recommendation_result', {})
+    if not result or str(result.get('id')) != str(recommendation_id):
+        return _compact_json_response({'success': False, 'error': '找不到推薦結果'}, status=404)
+
+    fields_param = request.GET.get('fields', '').strip()
+    fields = [f.strip() for f in fields_param.split(',') if f.strip()] if fields_param else list(API_RECOMMENDATION_FIELDS)
+    unknown_fields = [f for f in fields if f not in API_RECOMMENDATION_FIELDS]
+    if unknown_fields:
+        return _compact_json_response({
+            'success': False,
+            'error': f"不支援的欄位: {', '.join(unknown_fields)}",
+            'allowed_fields': list(API_RECOMMENDATION_FIELDS),
+        }, status=400)
+
+    payload = _build_recommendation_payload(result)
+    data = {field: payload[field] for field in fields}
+    return _compact_json_response({'success': True, 'api_version': API_VERSION, 'data': data})
+
+# ======================================================
+# API: 產品價格紀錄 (v1)
+# ======================================================
+PRICE_CHANGES_DEFAULT_HOURS = 24
+PRICE_CHANGES_MAX_LIMIT = 1000
+
+def _parse_since(request, default_hours: int = None):
+    """讀取 ?since=（ISO 8601，無時區時視為目前時區）；格式錯誤時回傳 False"""
+    raw = request.GET.get('since', '').strip()
+    if not raw:
+        return timezone.now() - timedelta(hours=default_hours) if default_hours else None
+    since = parse_datetime(raw)
+    if since is None:
+        return False
+    return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+@require_GET
+def api_product_prices_v1(request, product_id):
+    """以 JSON 回傳單一產品的價格序列 [[變動時間, 價格], ...]，可用 ?since= 限制起點"""
+    if not Product.objects.filter(pk=product_id).exists():
+        return _compact_json_response({'success': False, 'error': '找不到產品'}, status=404)
+    since = _parse_since(request)
+    if since is False:
+        return _compact_json_response({'success': False, 'error': 'since 必須是 ISO 8601 時間'}, status=400)
+    history = ProductPriceHistory.objects.all()
+    if since:
+        history = history.filter(changed_at__gt=since)
+    series = history.series([product_id])[product_id]
+    return _compact_json_response({
+        'success': True,
+        'api_version': API_VERSION,
+        'data': {'product_id': product_id, 'series': [[changed_at.isoformat(), float(price)] for changed_at, price in series]},
+    })
+
+@require_GET
+def api_price_changes_v1(request):
+    """以 JSON 回傳 ?since=（預設 24 小時前）之後的價格變動與受影響的風格，?limit= 限制筆數"""
+    since = _parse_since(request, PRICE_CHANGES_DEFAULT_HOURS)
+    if since is False:
+        return _compact_json_response({'success': False, 'error': 'since 必須是 ISO 8601 時間'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 100)), 1), PRICE_CHANGES_MAX_LIMIT)
+    except ValueError:
+        return _compact_json_response({'success': False, 'error': 'limit 必須是整數'}, status=400)
+    changes = ProductPriceHistory.objects.changes_since(since).values_list(
+        'product_id', 'product__name', 'product__style', 'previous_price', 'price', 'changed_at',
+    )[:limit]
+    return _compact_json_response({
+        'success': True,
+        'api_version': API_VERSION,
+        'data': {
+            'since': since.isoformat(),
+            'changed_styles': sorted(ProductPriceHistory.objects.changed_styles(since)),
+            'changes': [
+                {'product_id': product_id, 'name': name, 'style': style, 'previous_price': float(previous),
+                 'price': float(price), 'changed_at': changed_at.isoformat()}
+                for product_id, name, style, previous, price, changed_at in changes
+            ],
+        },
+    })
+
+# ======================================================
+# 商品縮圖代理
+# ======================================================
+@require_GET
+def product_thumbnail(request, product_id, size):
+    """回傳商品圖片縮圖（瀏覽器接受 WebP 時用 WebP，否則 JPEG），附長效快取標頭"""
+    cache = get_thumbnail_cache()
+    if size not in cache.sizes:
+        return HttpResponse(status=404)
+    image_url = Product.objects.filter(pk=product_id).values_list('image_url', flat=True).first()
+    if not image_url:
+        return HttpResponse(status=404)
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    try:
+        data, digest = cache.get(image_url, size, fmt)
+    except ThumbnailError as e:
+        # 無法產生縮圖時導向原圖，頁面不會出現破圖；導向本身不快取。非 http(s) 網址無法導向，回 404
+        logger.warning("產生縮圖失敗 product=%s: %s", product_id, e)
+        EVENT_COUNTERS.increment('thumbnail_error')
+        if urlsplit(image_url).scheme not in ('http', 'https'):
+            return HttpResponse(status=404)
+        response = redirect(image_url)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    etag = f'"{digest[:16]}-{size}-{fmt}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(data, content_type=THUMBNAIL_FORMATS[fmt])
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.THUMBNAIL_MAX_AGE)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+# ======================================================
+# 效能指標 (Prometheus)
+# ======================================================
+def _metrics_allowed(request) -> bool:
+    """來源 IP 在 METRICS_ALLOWED_IPS 內，或 Bearer token 與 METRICS_TOKEN 相符"""
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get('Authorization', '')
+    return bool(token) and auth.startswith('Bearer ') and hmac.compare_digest(auth[7:].encode(), token.encode())
+
+@require_GET
+def metrics(request):
+    """以 Prometheus 文字格式輸出各階段延遲直方圖與事件計數（僅限 _metrics_allowed 的請求）"""
+    if not _metrics_allowed(request):
+        return HttpResponse(status=403)
+    body = STAGE_METRICS.render_prometheus() + EVENT_COUNTERS.render_prometheus()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
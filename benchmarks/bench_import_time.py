@@ -0,0 +1,88 @@
+"""
+啟動時間 / 匯入成本回歸測試
+
+以 `python -X importtime` 匯入 Django 設定與 app.views，彙總最耗時的模組，
+並確認 google.generativeai、grpc、PIL 等重型套件不會在啟動時被載入。
+同時量測 `manage.py check` 的冷啟動時間。
+
+執行方式：
+    python benchmarks/bench_import_time.py [--top 15] [--max-ms 400]
+
+若出現重型匯入或總匯入時間超過 --max-ms，結束碼為 1。
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 這些模組應只在第一次呼叫 AI 服務時才載入
+HEAVY_MODULES = ('google.generativeai', 'grpc', 'google.protobuf', 'PIL')
+
+IMPORT_SNIPPET = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'set.settings'); "
+    "import django; django.setup(); import app.views, app.urls"
+)
+
+
+def collect_importtime() -> list:
+    """執行 -X importtime 並解析為 (模組, self_us, cumulative_us) 清單"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_SNIPPET],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '').split('|')]
+        rows.append((name, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def time_manage_check(runs: int = 3) -> float:
+    """回傳 manage.py check 的最短執行時間 (ms)"""
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'manage.py', 'check'], cwd=BASE_DIR, capture_output=True)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='啟動匯入成本回歸測試')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--max-ms', type=float, default=400.0, help='總匯入時間上限 (ms)')
+    args = parser.parse_args()
+
+    rows = collect_importtime()
+    total_ms = sum(r[1] for r in rows) / 1000
+
+    print(f"總匯入時間: {total_ms:.1f} ms ({len(rows)} 個模組)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    print(f"manage.py check: {time_manage_check():.1f} ms")
+
+    heavy = sorted({name for name, _, _ in rows if name.startswith(HEAVY_MODULES)})
+    failed = False
+    if heavy:
+        print(f"❌ 啟動時載入了重型模組: {', '.join(heavy[:10])}")
+        failed = True
+    if total_ms > args.max_ms:
+        print(f"❌ 總匯入時間 {total_ms:.1f} ms 超過上限 {args.max_ms:.1f} ms")
+        failed = True
+    if not failed:
+        print("✅ 匯入成本在預期範圍內")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+SQLite 設定在並行負載下的吞吐量比較
+
+以多個行程（模擬 gunicorn worker）x 執行緒對同一個資料庫重複執行「請求」：
+讀取 session 與一頁商品，並以 --write-ratio 的機率修改 session 後儲存（request.session.save()）。
+每個請求結束時呼叫 close_old_connections()，與 Django 處理 request_finished 相同，
+CONN_MAX_AGE=0 時每個請求都會重新連線。
+
+分別以 DB_PROFILE=default（rollback journal、每請求重連）與 DB_PROFILE=production（WAL、PRAGMA、持續連線）
+在各自複製的資料庫上執行，回報每秒請求數、延遲與 "database is locked" 錯誤數：
+
+    python benchmarks/bench_sqlite_concurrency.py --workers 4 --threads 4 --duration 10 --write-ratio 0.2
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+PROFILES = ('default', 'production')
+
+
+def _setup_django(profile: str, db_path: str):
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'set.settings'
+    os.environ['DB_PROFILE'] = profile
+    os.environ['DB_NAME'] = db_path
+    import django
+    django.setup()
+
+
+def prepare_database(path: Path, sessions: int, products: int):
+    """建立已 migrate 的資料庫，並寫入測試用 session 與商品"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='set.settings', DB_PROFILE='default', DB_NAME=str(path))
+    subprocess.run([sys.executable, str(BASE_DIR / 'manage.py'), 'migrate', '-v0'], env=env, check=True,
+                   cwd=BASE_DIR)
+    seed = (
+        "from django.contrib.sessions.backends.db import SessionStore\n"
+        "from app.models import Category, Product\n"
+        "category, _ = Category.objects.get_or_create(name='地板')\n"
+        f"Product.objects.bulk_create([Product(category=category, name=f'商品 {{i}}', model_number=f'B-{{i:06d}}', "
+        f"price=1000 + i, unit='坪', style='現代風', description='基準測試商品') for i in range({products})])\n"
+        f"keys = []\n"
+        f"for i in range({sessions}):\n"
+        f"    s = SessionStore(); s['cart'] = list(range(20)); s.create(); keys.append(s.session_key)\n"
+        f"open({str(path) + '.keys'!r}, 'w').write('\\n'.join(keys))\n"
+    )
+    subprocess.run([sys.executable, str(BASE_DIR / 'manage.py'), 'shell', '-c', seed], env=env, check=True,
+                   cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def worker(profile: str, db_path: str, threads: int, duration: float, write_ratio: float, seed: int, queue):
+    _setup_django(profile, db_path)
+    import threading
+    from django.db import OperationalError, close_old_connections
+    from django.contrib.sessions.backends.db import SessionStore
+    from app.models import Product
+
+    keys = Path(db_path + '.keys').read_text().split()
+    deadline = time.perf_counter() + duration
+
+    def run(thread_index: int, results: list):
+        rng = random.Random(seed * 1000 + thread_index)
+        latencies, errors, writes = [], 0, 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                session = SessionStore(session_key=rng.choice(keys))
+                cart = session.get('cart', [])
+                list(Product.objects.filter(is_active=True).order_by('price')[rng.randrange(0, 500):][:20])
+                if rng.random() < write_ratio:
+                    session['cart'] = cart[1:] + [rng.randrange(1000)]
+                    session.save()
+                    writes += 1
+                latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                errors += 1
+            finally:
+                close_old_connections()
+        results.append((latencies, errors, writes))
+
+    results = []
+    pool = [threading.Thread(target=run, args=(i, results)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put(results)
+
+
+def run_profile(profile: str, db_path: Path, args) -> dict:
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(profile, str(db_path), args.threads, args.duration, args.write_ratio, i, queue))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    latencies, errors, writes = [], 0, 0
+    for _ in processes:
+        for thread_latencies, thread_errors, thread_writes in queue.get():
+            latencies.extend(thread_latencies)
+            errors += thread_errors
+            writes += thread_writes
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return {
+        'rps': len(latencies) / args.duration,
+        'writes': writes / args.duration,
+        'errors': errors,
+        'p50': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 SQLite 預設與正式環境設定的並行吞吐量')
+    parser.add_argument('--workers', type=int, default=4, help='行程數')
+    parser.add_argument('--threads', type=int, default=4, help='每個行程的執行緒數')
+    parser.add_argument('--duration', type=float, default=10.0, help='每種設定的執行秒數')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='請求中儲存 session 的比例')
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = Path(tmp) / 'template.sqlite3'
+        print(f"建立測試資料庫（{args.sessions} 個 session、{args.products} 個商品）...")
+        prepare_database(template, args.sessions, args.products)
+        print(f"{args.workers} 行程 x {args.threads} 執行緒，每種設定 {args.duration:g} 秒，寫入比例 {args.write_ratio:.0%}")
+        results = {}
+        for profile in PROFILES:
+            db_path = Path(tmp) / f"{profile}.sqlite3"
+            shutil.copy(template, db_path)
+            shutil.copy(str(template) + '.keys', str(db_path) + '.keys')
+            # 複本一律從 rollback journal 開始，production 由連線的 init_command 切換成 WAL
+            sqlite3.connect(db_path).execute('PRAGMA journal_mode=DELETE').close()
+            results[profile] = result = run_profile(profile, db_path, args)
+            print(f"{profile:<12} {result['rps']:8.0f} req/s  寫入 {result['writes']:6.0f}/s  "
+                  f"p50 {result['p50']:6.2f} ms  p99 {result['p99']:7.2f} ms  locked 錯誤 {result['errors']}")
+        baseline = results['default']['rps']
+        if baseline:
+            print(f"production 吞吐量為 default 的 {results['production']['rps'] / baseline:.2f} 倍")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+推薦結果頁面渲染效能測試
+
+比較片段快取為冷（每次渲染前清空）與熱時，渲染 recommend_style.html（6 種風格 x 3 種方案）的時間。
+兩者都使用 debug=False 時 Django 預設的快取模板載入器（與正式環境相同），差異只來自 {% cache %} 片段快取。
+
+執行方式：
+    python benchmarks/bench_template_render.py [--iterations 200]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'set.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.template.backends.django import DjangoTemplates  # noqa: E402
+
+from app.views import _precompute_recommendation_totals, _build_recommend_context  # noqa: E402
+
+CATEGORIES = ['flooring', 'wallpaper_塗料', 'ceiling']
+PLANS = [("便宜方案", 0.6), ("中等方案", 1.0), ("奢華方案", 1.5)]
+
+
+def build_sample_result(style_count: int = 6) -> dict:
+    """產生 6 種風格 x 3 種方案的模擬推薦結果"""
+    recommendations = {}
+    for s in range(style_count):
+        style_name = f"style_{s + 1}"
+        plans = []
+        for plan_name, factor in PLANS:
+            items = {
+                category: {
+                    "name": f"{style_name} {category} 商品",
+                    "quantity": 1,
+                    "unit": "坪",
+                    "description": "模擬商品描述" * 5,
+                    "price_per_unit": int((1000 + s * 100 + c * 500) * factor),
+                    "product_id": s * 100 + c,
+                }
+                for c, category in enumerate(CATEGORIES)
+            }
+            plans.append({"plan": plan_name, "total_cost": 0, "items": items})
+        recommendations[style_name] = {"style_summary": f"{style_name} 風格", "plans": plans}
+
+    result = {
+        'id': 1,
+        'room_area': '10',
+        'dimensions': '4x3x2.8',
+        'total_budget': 300000.0,
+        'style_name': 'style_1',
+        'ai_recommendation': {'style_suggestions': [], 'estimated_dimensions': {}},
+        'status': 'completed',
+        'recommendations': recommendations,
+    }
+    _precompute_recommendation_totals(result)
+    return result
+
+
+def make_engine() -> DjangoTemplates:
+    # 未指定 loaders 且 debug=False 時，Django 以 cached.Loader 包裝 filesystem / app_directories
+    return DjangoTemplates({
+        'NAME': 'bench',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {'debug': False, 'context_processors': []},
+    })
+
+
+def run(engine: DjangoTemplates, context: dict, iterations: int, warm_fragments: bool) -> list:
+    timings = []
+    cache.clear()
+    for _ in range(iterations):
+        if not warm_fragments:
+            cache.clear()
+        start = time.perf_counter()
+        engine.get_template('recommend_style.html').render(context)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, timings: list):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<32} mean={statistics.mean(timings):7.3f} ms  p50={statistics.median(timings):7.3f} ms  p95={p95:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推薦結果頁面渲染效能測試')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    context = _build_recommend_context(build_sample_result())
+    engine = make_engine()
+    before = run(engine, context, args.iterations, warm_fragments=False)
+    after = run(engine, context, args.iterations, warm_fragments=True)
+
+    report('before (冷片段快取)', before)
+    report('after  (熱片段快取)', after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.2f}x")
+
+
+if __name__ == '__main__':
+    main()
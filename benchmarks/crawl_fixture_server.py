@@ -0,0 +1,131 @@
+"""
+crawl_products 的本地測試用供應商網站
+
+產生 --products 個商品頁（/products/<id>），內含 schema.org Product JSON-LD，
+支援 ETag / If-None-Match 與 Last-Modified / If-Modified-Since（回 304）。
+--change-rate 控制每輪（--epoch-sec 秒）價格變動的商品比例，--rate-spread 讓各商品的變動機率
+在 change_rate × 10^±spread 之間分布（測試 recrawl_products 的排程），--gone-rate 的商品回 404，
+--latency-ms 模擬供應商回應延遲。
+
+    python benchmarks/crawl_fixture_server.py --port 8765 --products 20000 --latency-ms 50 --write-urls /tmp/urls.txt
+    python manage.py crawl_products --urls /tmp/urls.txt --concurrency 128 --per-host 128
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from email.utils import formatdate, parsedate_to_datetime
+
+from aiohttp import web
+
+STYLES = ['現代風', '北歐風', '工業風', '日式風', '極簡風']
+CATEGORIES = ['地板', '天花板', '壁紙']
+
+
+def product_change_rate(product_id: int, change_rate: float, spread: float) -> float:
+    """每個商品固定的每輪變動機率"""
+    if not spread:
+        return change_rate
+    return min(1.0, change_rate * 10 ** random.Random(product_id * 15485863).uniform(-spread, spread))
+
+
+def product_state(product_id: int, epoch: int, change_rate: float) -> dict:
+    """商品內容只隨「最近一次變動的輪次」改變，同一輪次內內容固定"""
+    rng = random.Random(product_id)
+    changed_epoch = max((e for e in range(epoch + 1) if random.Random(product_id * 7919 + e).random() < change_rate),
+                        default=0)
+    return {
+        'id': product_id,
+        'name': f"測試商品 {product_id}",
+        'category': CATEGORIES[product_id % len(CATEGORIES)],
+        'style': STYLES[product_id % len(STYLES)],
+        'price': 500 + random.Random(product_id * 31 + changed_epoch).randint(0, 20000),
+        'sku': f"SKU-{product_id:06d}",
+        'brand': f"品牌{rng.randint(1, 50)}",
+        'changed_epoch': changed_epoch,
+    }
+
+
+def render_page(state: dict) -> str:
+    json_ld = {
+        '@context': 'https://schema.org',
+        '@type': 'Product',
+        'name': state['name'],
+        'sku': state['sku'],
+        'brand': {'@type': 'Brand', 'name': state['brand']},
+        'category': state['category'],
+        'style': state['style'],
+        'description': f"{state['style']}{state['category']}材料，測試用商品。",
+        'image': f"https://img.example.com/{state['id']}.jpg",
+        'offers': {'@type': 'Offer', 'price': str(state['price']), 'priceCurrency': 'TWD', 'unitText': '坪'},
+    }
+    return (
+        "<!doctype html><html><head><meta charset='utf-8'>"
+        f"<title>{state['name']}</title>"
+        f"<script type='application/ld+json'>{json.dumps(json_ld, ensure_ascii=False)}</script>"
+        "</head><body>" + "<p>商品說明</p>" * 50 + "</body></html>"
+    )
+
+
+def make_app(args) -> web.Application:
+    start = time.time()
+    stats = {'200': 0, '304': 0, '404': 0}
+
+    async def product(request):
+        if args.latency_ms:
+            await asyncio.sleep(args.latency_ms / 1000 * random.uniform(0.5, 1.5))
+        product_id = int(request.match_info['product_id'])
+        if product_id > args.products or random.Random(product_id * 104729).random() < args.gone_rate:
+            stats['404'] += 1
+            raise web.HTTPNotFound()
+        epoch = int((time.time() - start) // args.epoch_sec)
+        state = product_state(product_id, epoch, product_change_rate(product_id, args.change_rate, args.rate_spread))
+        etag = '"' + hashlib.md5(json.dumps(state, sort_keys=True).encode()).hexdigest() + '"'
+        modified_at = start + state['changed_epoch'] * args.epoch_sec
+        last_modified = formatdate(modified_at, usegmt=True)
+        if request.headers.get('If-None-Match') == etag:
+            stats['304'] += 1
+            return web.Response(status=304, headers={'ETag': etag, 'Last-Modified': last_modified})
+        since = request.headers.get('If-Modified-Since')
+        if since and 'If-None-Match' not in request.headers and parsedate_to_datetime(since).timestamp() >= int(modified_at):
+            stats['304'] += 1
+            return web.Response(status=304, headers={'ETag': etag, 'Last-Modified': last_modified})
+        stats['200'] += 1
+        return web.Response(text=render_page(state), content_type='text/html',
+                            headers={'ETag': etag, 'Last-Modified': last_modified})
+
+    async def stats_view(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_get('/products/{product_id:\\d+}', product)
+    app.router.add_get('/stats', stats_view)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='crawl_products 本地測試伺服器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--change-rate', type=float, default=0.1, help='每輪價格變動的商品比例')
+    parser.add_argument('--rate-spread', type=float, default=0.0, help='各商品變動機率的分散程度（10 的次方）')
+    parser.add_argument('--epoch-sec', type=float, default=60.0, help='每輪秒數')
+    parser.add_argument('--gone-rate', type=float, default=0.0, help='回 404 的商品比例')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--write-urls', help='將所有商品網址寫入此檔案後啟動')
+    args = parser.parse_args()
+
+    if args.write_urls:
+        with open(args.write_urls, 'w', encoding='utf-8') as f:
+            for product_id in range(1, args.products + 1):
+                f.write(f"http://{args.host}:{args.port}/products/{product_id}\n")
+    web.run_app(make_app(args), host=args.host, port=args.port, access_log=None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+/api/ai_recommend/ 端對端壓力測試
+
+以固定目標 RPS（open-loop）送出 multipart 請求，附上實際大小的 JPEG 圖片，
+回報吞吐量、p50/p95/p99 延遲與錯誤率。延遲從排定的送出時間起算，連線池已滿而延後送出的等待也計入
+（避免 coordinated omission 低估過載時的尾端延遲），並回報延後超過 LATE_START_MS 的請求數。
+搭配本地 Gemini 替身可避免消耗配額：
+
+    GEMINI_BACKEND=fake GEMINI_FAKE_LATENCY_MS=800 GEMINI_FAKE_ERROR_RATE=0.02 \\
+        GEMINI_RETRY_DELAY_SEC=0.5 gunicorn set.wsgi -w 4 --threads 8
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --rps 20 --duration 60
+
+--images 可指定真實照片資料夾；未指定時以 Pillow 產生 --image-size 大小的合成照片。
+"""
+import io
+import sys
+import math
+import json
+import time
+import random
+import argparse
+import threading
+import statistics
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# 實際送出比排定時間晚超過此毫秒數即計為延後送出
+LATE_START_MS = 10
+
+
+def load_images(folder: str, limit: int = 20) -> list:
+    """讀取資料夾中的 JPEG/PNG 圖片為 (檔名, bytes, mime)"""
+    images = []
+    for path in sorted(Path(folder).iterdir()):
+        suffix = path.suffix.lower()
+        if suffix in ('.jpg', '.jpeg', '.png'):
+            mime = 'image/png' if suffix == '.png' else 'image/jpeg'
+            images.append((path.name, path.read_bytes(), mime))
+        if len(images) >= limit:
+            break
+    if not images:
+        raise SystemExit(f"{folder} 中沒有可用的圖片")
+    return images
+
+
+def synthesize_images(size: str, count: int = 4) -> list:
+    """產生帶雜訊與漸層的合成照片，檔案大小接近手機照片"""
+    from PIL import Image
+
+    width, height = (int(v) for v in size.lower().split('x'))
+    images = []
+    for idx in range(count):
+        noise = Image.effect_noise((width, height), 40 + idx * 10).convert('RGB')
+        gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        img = Image.blend(noise, gradient, 0.5)
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=90)
+        images.append((f"room_{idx + 1}.jpg", buf.getvalue(), 'image/jpeg'))
+    return images
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """nearest-rank 百分位數：n=100 時 p99 為第 99 個值"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class LoadResult:
+    """執行緒安全的結果彙總"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.start_delays = []
+        self.statuses = Counter()
+        self.errors = 0
+
+    def record(self, latency: float, start_delay: float, status: str, ok: bool):
+        with self._lock:
+            self.latencies.append(latency)
+            self.start_delays.append(start_delay)
+            self.statuses[status] += 1
+            if not ok:
+                self.errors += 1
+
+
+def send_one(session: requests.Session, url: str, images: list, images_per_request: int, result: LoadResult, timeout: float,
+             scheduled: float):
+    """scheduled 為排定的送出時間（perf_counter）；延遲由此起算，包含在連線池中排隊的時間"""
+    files = [('image_files', img) for img in random.sample(images, min(images_per_request, len(images)))]
+    data = {
+        'room_area': random.choice(['', '8', '12.5']),
+        'dimensions': random.choice(['', '4x3x2.8']),
+        'total_budget': str(random.choice([150000, 300000, 600000])),
+        'style_name': random.choice(['現代風', '北歐風', '工業風']),
+    }
+    start_delay = max(0.0, time.perf_counter() - scheduled)
+    try:
+        resp = session.post(url, data=data, files=files, timeout=timeout)
+        ok = resp.status_code == 200 and resp.json().get('success') is True
+        status = str(resp.status_code)
+    except requests.RequestException as e:
+        ok, status = False, type(e).__name__
+    result.record(time.perf_counter() - scheduled, start_delay, status, ok)
+
+
+def run_load(base_url: str, rps: float, duration: float, images: list, images_per_request: int,
+             concurrency: int, timeout: float) -> dict:
+    url = base_url.rstrip('/') + '/api/ai_recommend/'
+    result = LoadResult()
+    local = threading.local()
+
+    def task(scheduled: float):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        send_one(local.session, url, images, images_per_request, result, timeout, scheduled)
+
+    interval = 1.0 / rps
+    total = int(rps * duration)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            # open-loop：依排程送出，不等待前一個請求完成
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(task, scheduled)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(result.latencies)
+    start_delays = sorted(result.start_delays)
+    completed = len(latencies)
+    return {
+        'target_rps': rps,
+        'duration_sec': round(elapsed, 2),
+        'requests': completed,
+        'throughput_rps': round(completed / elapsed, 2) if elapsed else 0,
+        'success_rps': round((completed - result.errors) / elapsed, 2) if elapsed else 0,
+        'error_rate': round(result.errors / completed, 4) if completed else 0,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 1) if latencies else 0,
+            'p50': round(percentile(latencies, 50) * 1000, 1),
+            'p95': round(percentile(latencies, 95) * 1000, 1),
+            'p99': round(percentile(latencies, 99) * 1000, 1),
+            'max': round(latencies[-1] * 1000, 1) if latencies else 0,
+        },
+        'late_starts': sum(d * 1000 > LATE_START_MS for d in start_delays),
+        'start_delay_ms': {
+            'p99': round(percentile(start_delays, 99) * 1000, 1),
+            'max': round(start_delays[-1] * 1000, 1) if start_delays else 0,
+        },
+        'status_counts': dict(result.statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/api/ai_recommend/ 壓力測試')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--rps', type=float, default=5.0, help='目標每秒請求數')
+    parser.add_argument('--duration', type=float, default=30.0, help='測試秒數')
+    parser.add_argument('--concurrency', type=int, default=64, help='最大同時連線數')
+    parser.add_argument('--images', help='真實照片資料夾（選填）')
+    parser.add_argument('--image-size', default='3024x4032', help='合成照片尺寸')
+    parser.add_argument('--images-per-request', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=180.0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    images = load_images(args.images) if args.images else synthesize_images(args.image_size)
+    report = run_load(args.url, args.rps, args.duration, images, args.images_per_request,
+                      args.concurrency, args.timeout)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        lat = report['latency_ms']
+        print(f"請求數: {report['requests']}  時間: {report['duration_sec']}s  目標 RPS: {report['target_rps']}")
+        print(f"吞吐量: {report['throughput_rps']} req/s  成功: {report['success_rps']} req/s  錯誤率: {report['error_rate']:.2%}")
+        print(f"延遲 (ms，自排定送出時間起算): mean={lat['mean']} p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+        delay = report['start_delay_ms']
+        print(f"延後送出 (>{LATE_START_MS} ms): {report['late_starts']} 筆  p99={delay['p99']} ms  max={delay['max']} ms")
+        print(f"狀態碼: {report['status_counts']}")
+    return 0 if report['requests'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
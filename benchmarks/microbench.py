@@ -0,0 +1,247 @@
+"""
+推薦流程熱點的微基準測試
+
+涵蓋：
+- image_payload      _uploaded_file_to_image_payload（多種尺寸 x JPEG/PNG/WEBP）
+- extract_json       _extract_json_from_text（真實輸出與病態輸出）
+- recommend_products 合成商品目錄，40 ~ 100k 筆（list 與 mmap 目錄快照）
+- recommend_context  recommend 頁面 context 組裝
+- session            推薦結果存入 / 讀出 SESSION_ENGINE 設定的 session
+
+執行方式：
+    python benchmarks/microbench.py --save-baseline         # 在部署機器上建立基準
+    python benchmarks/microbench.py                         # 與基準比較，變慢超過門檻則結束碼為 1
+    python benchmarks/microbench.py --filter extract_json --quick
+
+基準檔預設為 benchmarks/baseline.json（與機器相關，請在同一台機器上建立與比較）。
+"""
+import io
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import importlib
+import platform
+import statistics
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'set.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+
+from app.ai_service import AIRecommendationService, _uploaded_file_to_image_payload  # noqa: E402
+from app.catalog_snapshot import CatalogSnapshot, build_snapshot_bytes  # noqa: E402
+from app.fake_gemini import FakeGeminiModel  # noqa: E402
+from app.views import _build_recommend_context  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+CATEGORIES = ['flooring', 'ceiling', 'wallpaper_塗料']
+
+
+# ======================================================
+# 測試資料
+# ======================================================
+def make_image_file(size, fmt: str) -> SimpleUploadedFile:
+    from PIL import Image
+
+    noise = Image.effect_noise(size, 50).convert('RGB')
+    gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+    img = Image.blend(noise, gradient, 0.5)
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **({'quality': 90} if fmt in ('JPEG', 'WEBP') else {}))
+    mime = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}[fmt]
+    return SimpleUploadedFile(f"bench.{fmt.lower()}", buf.getvalue(), content_type=mime)
+
+
+def make_model_outputs() -> dict:
+    payload = {
+        "estimated_dimensions": {"area_ping": 8.5, "LxWxH": "4.2x3.3x2.8", "analysis_basis": "依據門框與地磚推估。" * 5},
+        "style_suggestions": [
+            {"style_name": f"風格{i}", "description": "以自然材質與柔和燈光營造舒適氛圍。" * 10} for i in range(6)
+        ],
+    }
+    text = json.dumps(payload, ensure_ascii=False, indent=2)
+    return {
+        'fenced': f"```json\n{text}\n```",
+        'prose_wrapped': f"好的，以下是分析結果：\n\n{text}\n\n希望對您有幫助！",
+        'trailing_commas': f"```json\n{text.replace(']', ',]').replace('}', ',}')}\n```",
+        'no_json': "抱歉，我無法從圖片判斷房間尺寸。" * 200,
+        # 病態輸出：大量未閉合的大括號與空白，舊的正規表示式會大量回溯
+        'pathological_braces': "{a" * 2000,
+        'pathological_whitespace': "{" + " " * 18 + "x",
+        # 100 KB 對抗性輸出
+        'adversarial_100kb_braces': "{a" * 50000,
+        'adversarial_100kb_whitespace': "{" + " \n" * 50000 + "x",
+        'adversarial_100kb_unclosed_string': '{"style_suggestions": "' + "x" * 100000,
+        'adversarial_100kb_deep_nesting': '{"a":' * 20000 + '1' + '}' * 20000,
+        'adversarial_100kb_escapes': '{"k": "' + '\\\\' * 50000 + '"}',
+        'adversarial_100kb_valid_after_noise': "{x} " * 25000 + text,
+    }
+
+
+def make_catalog(size: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    style_count = max(7, min(50, size // 20))
+    styles = [f"style_{i}" for i in range(style_count)]
+    return [
+        {
+            "id": i + 1,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "style": styles[(i // len(CATEGORIES)) % style_count],
+            "name": f"商品 {i + 1}",
+            "model": f"M-{i + 1:06d}",
+            "price_per_unit": rng.randint(500, 20000),
+            "unit": "坪",
+            "description": "合成商品描述。",
+        }
+        for i in range(size)
+    ]
+
+
+def make_result(service: AIRecommendationService) -> dict:
+    recommendations = service.recommend_products({'total_budget': '300000'}, {})
+    return {
+        'id': 1,
+        'room_area': '10',
+        'dimensions': '4x3x2.8',
+        'total_budget': 300000.0,
+        'style_name': '現代風',
+        'ai_recommendation': {'estimated_dimensions': {'area_ping': 10, 'analysis_basis': 'N/A'}, 'style_suggestions': []},
+        'status': 'completed',
+        'recommendations': recommendations,
+    }
+
+
+def seeded_recommend(service: AIRecommendationService, catalog: list):
+    # recommend_products 會隨機挑選風格，固定種子讓每次量測的工作量一致
+    random.seed(0)
+    return service.recommend_products({'total_budget': '300000'}, {}, catalog=catalog)
+
+
+# ======================================================
+# 測試案例
+# ======================================================
+def build_cases(quick: bool) -> list:
+    """回傳 (名稱, 可呼叫物件) 清單"""
+    service = AIRecommendationService(model=FakeGeminiModel(latency_ms=0, latency_dist='fixed'))
+    cases = []
+
+    sizes = [(640, 480), (1920, 1080)] if quick else [(640, 480), (1920, 1080), (4032, 3024)]
+    for size in sizes:
+        for fmt in ('JPEG', 'PNG', 'WEBP'):
+            upload = make_image_file(size, fmt)
+            cases.append((f"image_payload/{fmt.lower()}_{size[0]}x{size[1]}",
+                          lambda u=upload: _uploaded_file_to_image_payload(u)))
+
+    for name, text in make_model_outputs().items():
+        cases.append((f"extract_json/{name}", lambda t=text: service._extract_json_from_text(t)))
+
+    catalog_sizes = [40, 1000, 10000] if quick else [40, 1000, 10000, 100000]
+    for size in catalog_sizes:
+        catalog = make_catalog(size)
+        cases.append((f"recommend_products/{size}", lambda c=catalog: seeded_recommend(service, c)))
+        snapshot = CatalogSnapshot(build_snapshot_bytes(catalog))
+        cases.append((f"recommend_products/snapshot_{size}", lambda c=snapshot: seeded_recommend(service, c)))
+
+    result = make_result(service)
+    cases.append(("recommend_context/cold", lambda r=result: _build_recommend_context(copy.deepcopy(r))))
+
+    # 與 ai_recommend 相同：整個推薦結果存進 session 後由 recommend 頁讀出
+    session_store = importlib.import_module(settings.SESSION_ENGINE).SessionStore
+    session = session_store()
+    session['recommendation_result'] = result
+    session.save()
+    cases.append(("session/load", lambda k=session.session_key: session_store(k).get('recommendation_result')))
+
+    def save_session(k=session.session_key):
+        store = session_store(k)
+        store['recommendation_result'] = result
+        store.save()
+    cases.append(("session/save", save_session))
+    return cases
+
+
+# ======================================================
+# 量測與比較
+# ======================================================
+def measure(fn, repeats: int, min_sample_sec: float) -> dict:
+    """自動決定每輪呼叫次數，回傳單次呼叫的中位數/最小值 (ms)"""
+    start = time.perf_counter()
+    fn()
+    single = max(time.perf_counter() - start, 1e-7)
+    loops = max(1, int(min_sample_sec / single))
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops * 1000)
+    return {'median_ms': round(statistics.median(samples), 4), 'min_ms': round(min(samples), 4), 'loops': loops}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """以最小值比較（較不受雜訊影響），回傳變慢超過門檻的 (名稱, 基準, 目前, 倍數)"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or not base.get('min_ms'):
+            continue
+        ratio = current['min_ms'] / base['min_ms']
+        if ratio > threshold:
+            regressions.append((name, base['min_ms'], current['min_ms'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推薦流程微基準測試')
+    parser.add_argument('--filter', default='', help='只執行名稱包含此字串的案例')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='基準 JSON 路徑')
+    parser.add_argument('--save-baseline', action='store_true', help='將本次結果存為基準')
+    parser.add_argument('--threshold', type=float, default=1.5, help='變慢倍數門檻')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='縮小資料集，快速檢查')
+    args = parser.parse_args()
+
+    min_sample_sec = 0.05 if args.quick else 0.2
+    results = {}
+    for name, fn in build_cases(args.quick):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, args.repeats, min_sample_sec)
+        print(f"{name:<50} median={results[name]['median_ms']:10.4f} ms  min={results[name]['min_ms']:10.4f} ms")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        existing = json.loads(baseline_path.read_text()) if baseline_path.exists() else {'results': {}}
+        existing['results'].update(results)
+        existing['meta'] = {'python': platform.python_version(), 'machine': platform.machine(),
+                            'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        baseline_path.write_text(json.dumps(existing, ensure_ascii=False, indent=2, sort_keys=True))
+        print(f"✅ 基準已儲存至 {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"⚠️ 找不到基準檔 {baseline_path}，請先以 --save-baseline 建立")
+        return 0
+
+    regressions = compare(results, json.loads(baseline_path.read_text()), args.threshold)
+    for name, base_ms, current_ms, ratio in regressions:
+        print(f"❌ {name}: {base_ms:.4f} ms -> {current_ms:.4f} ms ({ratio:.2f}x)")
+    if regressions:
+        return 1
+    print(f"✅ 無超過 {args.threshold:.2f}x 的效能退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
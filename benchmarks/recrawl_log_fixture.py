@@ -0,0 +1,47 @@
+"""
+產生 recrawl_products --dry-run 用的長期爬取觀測紀錄
+
+以 crawl_fixture_server 相同的變動模型（--change-rate、--rate-spread）模擬每輪完整爬取一次，
+不需啟動伺服器即可產生數百輪的紀錄。
+
+    python benchmarks/recrawl_log_fixture.py --products 2000 --epochs 180 --rate-spread 1 --output /tmp/crawl_log.jsonl
+    python manage.py recrawl_products --dry-run /tmp/crawl_log.jsonl --budget 200 --interval-hours 24
+"""
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from crawl_fixture_server import product_change_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='產生模擬的爬取觀測紀錄（JSONL）')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--epochs', type=int, default=90, help='完整爬取的輪數')
+    parser.add_argument('--epoch-hours', type=float, default=24.0, help='每輪間隔（小時）')
+    parser.add_argument('--change-rate', type=float, default=0.1, help='每輪價格變動的商品比例')
+    parser.add_argument('--rate-spread', type=float, default=1.0, help='各商品變動機率的分散程度（10 的次方）')
+    parser.add_argument('--host', default='127.0.0.1:8765')
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rates = {pid: product_change_rate(pid, args.change_rate, args.rate_spread) for pid in range(1, args.products + 1)}
+    changes = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for epoch in range(args.epochs):
+            ts = (start + timedelta(hours=epoch * args.epoch_hours)).isoformat()
+            for pid, rate in rates.items():
+                # 與 crawl_fixture_server.product_state 相同的變動判定
+                changed = epoch > 0 and random.Random(pid * 7919 + epoch).random() < rate
+                changes += changed
+                f.write(json.dumps({'url': f"http://{args.host}/products/{pid}", 'ts': ts,
+                                    'status': 'fetched', 'changed': changed}) + '\n')
+    print(f"{args.products} 個商品 × {args.epochs} 輪，變動 {changes} 次 → {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
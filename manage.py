@@ -2,13 +2,6 @@
 """Django's command-line utility for administrative tasks."""
 import os
 import sys
-import ssl
-import certifi
-
-# SSL 設定
-os.environ["GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"] = certifi.where()
-ssl._create_default_https_context = ssl._create_unverified_context
-print("✅ SSL 憑證初始化完成")
 
 def main():
     """Run administrative tasks."""
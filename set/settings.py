@@ -3,23 +3,45 @@ Django settings for set project.
 Generated by 'django-admin startproject' using Django 5.0.
 """
 import os
-import ssl
-import certifi
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
 # ======================================================
-# 🌟 環境變數與 SSL 設定
+# 🌟 環境變數設定
 # ======================================================
 load_dotenv()  # 載入與 app 資料夾同層的 .env 檔案
 
 # Google Gemini API 金鑰
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
-# 設定 SSL 憑證（確保 Google API 可正確使用 HTTPS）
-os.environ["GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"] = certifi.where()
-ssl._create_default_https_context = ssl._create_unverified_context
-print("✅ Django 啟動時載入 SSL 憑證設定")
+# Gemini 後端：google（正式 API）或 fake（本地替身，見 app/fake_gemini.py）
+GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'google').lower()
+# 解析失敗或 API 錯誤後的重試等待秒數
+GEMINI_RETRY_DELAY_SEC = float(os.getenv('GEMINI_RETRY_DELAY_SEC', '10'))
+# 模型分級路由：純文字或表單完整的請求用 fast，需要以圖片估算尺寸時用 pro；
+# fast 輸出未通過驗證時改用 pro 重試。各清單依序取第一個可用的模型
+GEMINI_FAST_MODELS = [m.strip() for m in os.getenv('GEMINI_FAST_MODELS', 'gemini-flash-latest,gemini-2.5-flash').split(',') if m.strip()]
+GEMINI_PRO_MODELS = [m.strip() for m in os.getenv('GEMINI_PRO_MODELS', 'gemini-2.5-pro-preview-03-25,gemini-2.5-pro').split(',') if m.strip()]
+# 表單完整（坪數、尺寸、預算、風格，無照片）時改用本地分析；設為 true 則仍呼叫 Gemini 補充風格建議
+GEMINI_ENRICH_COMPLETE_FORMS = os.getenv('GEMINI_ENRICH_COMPLETE_FORMS', 'False').lower() == 'true'
+# 用戶端限流（見 app/rate_limit.py）：依配額設定每分鐘請求數與 token 數，任一為 0 則不限流。
+# sqlite 後端讓同一台機器上的所有 worker 行程共用額度；memory 僅限單一行程
+GEMINI_RPM = float(os.getenv('GEMINI_RPM', '150'))
+GEMINI_TPM = float(os.getenv('GEMINI_TPM', '2000000'))
+GEMINI_RATE_LIMIT_BACKEND = os.getenv('GEMINI_RATE_LIMIT_BACKEND', 'sqlite').lower()
+GEMINI_RATE_LIMIT_PATH = os.getenv('GEMINI_RATE_LIMIT_PATH', os.path.join(tempfile.gettempdir(), 'gemini_ratelimit.sqlite3'))
+# 每個請求的輸入 token 上限；超過時先縮小圖片，再捨棄多餘圖片（見 app/token_budget.py）
+GEMINI_INPUT_TOKEN_BUDGET = int(os.getenv('GEMINI_INPUT_TOKEN_BUDGET', '4000'))
+# 各模型每百萬 token 價格（美元）：(輸入, 輸出)，用於估算每個請求的成本
+GEMINI_PRICING_PER_MILLION = {
+    'gemini-2.5-pro': (1.25, 10.00),
+    'gemini-2.5-pro-preview-03-25': (1.25, 10.00),
+    'gemini-flash-latest': (0.30, 2.50),
+    'gemini-2.5-flash': (0.30, 2.50),
+}
+
+# SSL 憑證設定已移至 app.ai_service._load_genai()，僅在首次呼叫 Gemini 時執行
 
 # ======================================================
 # 🌟 專案基本設定
@@ -53,6 +75,8 @@ INSTALLED_APPS = [
 # 🌟 MIDDLEWARE
 # ======================================================
 MIDDLEWARE = [
+    'app.middleware.RequestIdMiddleware',     # 最外層：所有日誌都帶 request_id
+    'app.middleware.ServerTimingMiddleware',  # 放在最外層以涵蓋整個請求
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,144 +107,32 @@ TEMPLATES = [
     },
 ]
 
-WSGI_APPLICATION = 'set.wsgi.application'
-
-# ======================================================
-# 🌟 資料庫設定
-# ======================================================
-DATABASES = {
+# 推薦結果頁面的模板片段快取 ({% cache %})
+CACHES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.sqlite3'),
-        'NAME': BASE_DIR / os.getenv('DB_NAME', 'db.sqlite3'),
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+    },
+    # session 內容（見 app/session_backend.py）；file 由所有 worker 共用，locmem 為行程內 LRU，只適用單一行程部署
+    'sessions': {
+        'BACKEND': 'app.session_backend.SessionFileCache',
+        'LOCATION': BASE_DIR / 'cache' / 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '100000')), 'CULL_INTERVAL': 60},
+    } if os.getenv('SESSION_CACHE_BACKEND', 'file') == 'file' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '10000'))},
+    },
 }
 
-# ======================================================
-# 🌟 密碼驗證
-# ======================================================
-AUTH_PASSWORD_VALIDATORS = [
-    {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
-    {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
-    {'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator'},
-    {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
-]
-
-# ======================================================
-# 🌟 國際化與時區
-# ======================================================
-LANGUAGE_CODE = 'zh-hant'
-TIME_ZONE = 'Asia/Taipei'
-USE_I18N = True
-USE_TZ = True
-
-# ======================================================
-# 🌟 靜態檔設定
-# ======================================================
-STATIC_URL = '/static/'
-STATICFILES_DIRS = [BASE_DIR / "static"]
-
-# ======================================================
-# 🌟 預設主鍵
-# ======================================================
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-
-# ======================================================
-# 🌟 自訂變數
-# ======================================================
-GOOGLE_API_KEY = GEMINI_API_KEY  # 統一命名方便 views 使用
-
-
-
-# Static files (CSS, JavaScript, Images)
-STATIC_URL = '/static/'
-
-# ✅ 加這行：Render 部署需要一個明確的 STATIC_ROOT
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-
-"""
-Django settings for set project.
-Generated by 'django-admin startproject' using Django 5.0.
-"""
-import os
-import ssl
-import certifi
-from pathlib import Path
-from dotenv import load_dotenv
-
-# ======================================================
-# 🌟 環境變數與 SSL 設定
-# ======================================================
-load_dotenv()  # 載入與 app 資料夾同層的 .env 檔案
-
-# Google Gemini API 金鑰
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-
-# 設定 SSL 憑證（確保 Google API 可正確使用 HTTPS）
-os.environ["GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"] = certifi.where()
-ssl._create_default_https_context = ssl._create_unverified_context
-print("✅ Django 啟動時載入 SSL 憑證設定")
-
-# ======================================================
-# 🌟 專案基本設定
-# ======================================================
-BASE_DIR = Path(__file__).resolve().parent.parent
-
-SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-default-secret-key')
-DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
-ALLOWED_HOSTS = [h.strip() for h in os.getenv('ALLOWED_HOSTS', '127.0.0.1,localhost').split(',')]
-
-# ======================================================
-# 🌟 INSTALLED_APPS
-# ======================================================
-INSTALLED_APPS = [
-    # Django 內建 apps
-    'django.contrib.admin',
-    'django.contrib.auth',
-    'django.contrib.contenttypes',
-    'django.contrib.sessions',
-    'django.contrib.messages',
-    'django.contrib.staticfiles',
-
-    # ✅ 加入 humanize
-    'django.contrib.humanize',
-
-    # 你的自訂 app
-    'app',
-]
-
-# ======================================================
-# 🌟 MIDDLEWARE
-# ======================================================
-MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-]
-
-ROOT_URLCONF = 'set.urls'
-
-# ======================================================
-# 🌟 TEMPLATES
-# ======================================================
-TEMPLATES = [
-    {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [BASE_DIR / 'templates'],  # 模板資料夾
-        'APP_DIRS': True,
-        'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-            ],
-        },
-    },
-]
+# session 存在上面的 'sessions' 快取；SESSION_WRITE_THROUGH=True 時同時寫入 django_session，
+# 快取被淘汰後仍可由資料庫補回（寫入會多一次資料庫交易）
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'app.session_backend')
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_WRITE_THROUGH = os.getenv('SESSION_WRITE_THROUGH', 'False').lower() == 'true'
+# 序列化後超過此大小（bytes）的 session 以 zlib 壓縮後存入快取
+SESSION_COMPRESS_MIN_BYTES = int(os.getenv('SESSION_COMPRESS_MIN_BYTES', '1024'))
+SESSION_COMPRESS_LEVEL = int(os.getenv('SESSION_COMPRESS_LEVEL', '1'))
 
 WSGI_APPLICATION = 'set.wsgi.application'
 
@@ -234,6 +146,31 @@ DATABASES = {
     }
 }
 
+# SQLite 正式環境設定（DB_PROFILE=production，DEBUG=False 時預設）：
+# - WAL：讀取不會被寫入（例如 request.session.save()）擋住，synchronous=NORMAL 在 WAL 下不會損毀資料庫
+# - transaction_mode=IMMEDIATE：交易一開始就取得寫入鎖，等待交給 busy timeout，
+#   避免 DEFERRED 交易從讀升級成寫時直接回 "database is locked"
+# - mmap_size / cache_size：讀取走記憶體映射與較大的 page cache
+# - CONN_MAX_AGE：同一個 worker 執行緒重複使用連線，不必每個請求重新連線並重跑上面的 PRAGMA
+DB_PROFILE = os.getenv('DB_PROFILE', 'default' if DEBUG else 'production')
+if DB_PROFILE == 'production' and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': float(os.getenv('DB_BUSY_TIMEOUT_SEC', '20')),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join([
+                'PRAGMA journal_mode=WAL',
+                'PRAGMA synchronous=NORMAL',
+                f"PRAGMA mmap_size={int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+                # 負值單位為 KiB
+                f"PRAGMA cache_size=-{int(os.getenv('DB_CACHE_SIZE_KB', str(64 * 1024)))}",
+                'PRAGMA temp_store=MEMORY',
+            ]),
+        },
+    })
+
 # ======================================================
 # 🌟 密碼驗證
 # ======================================================
@@ -260,7 +197,49 @@ STATICFILES_DIRS = [BASE_DIR / "app/static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"        # Render 部署必須
 
 # WhiteNoise 支援
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+# collectstatic 產生內容雜湊檔名（css/index.css → css/index.<hash>.css）及預先壓縮的 .gz / .br（需 Brotli），
+# WhiteNoise 依 Accept-Encoding 直接送壓縮檔，雜湊檔名以 immutable 長期快取；模板需以 {% static %} 引用
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+# ======================================================
+# 🌟 日誌設定（QueueHandler 非阻塞輸出 JSON）
+# ======================================================
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'app.structured_logging.RequestIdFilter'},
+        # 大型除錯輸出（完整渲染 context 等）只抽樣保留
+        'dump_sampling': {
+            '()': 'app.structured_logging.SamplingFilter',
+            'rate': float(os.getenv('LOG_DUMP_SAMPLE_RATE', '0.01')),
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'app.structured_logging.BufferedQueueHandler',
+            'maxsize': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+            'filters': ['request_id'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': LOG_LEVEL},
+    'loggers': {
+        'django': {'level': os.getenv('LOG_LEVEL_DJANGO', 'INFO').upper(), 'propagate': True},
+        'app.views': {'level': os.getenv('LOG_LEVEL_VIEWS', LOG_LEVEL).upper(), 'propagate': True},
+        'app.ai_service': {'level': os.getenv('LOG_LEVEL_AI_SERVICE', LOG_LEVEL).upper(), 'propagate': True},
+        'app.dump': {
+            'level': os.getenv('LOG_LEVEL_DUMP', 'DEBUG').upper(),
+            'filters': ['dump_sampling'],
+            'propagate': True,
+        },
+    },
+}
+
 # ======================================================
 # 🌟 預設主鍵
 # ======================================================
@@ -271,3 +250,41 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ======================================================
 GOOGLE_API_KEY = GEMINI_API_KEY  # 統一命名方便 views 使用
 
+# /metrics（Prometheus）需帶 Authorization: Bearer <METRICS_TOKEN>，兩者皆未設定時一律拒絕。
+# METRICS_ALLOWED_IPS（逗號分隔）以 REMOTE_ADDR 判斷，預設為空：同一台主機上的反向代理（nginx → gunicorn）
+# 轉送的請求都來自 127.0.0.1，只有應用直接對外、沒有本機代理時才適合把 127.0.0.1 加入
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# CompressedJSONField（app/fields.py）：壓縮格式、等級、不壓縮的大小上限與共用字典目錄（manage.py train_json_dictionary）
+# zstd 需安裝 zstandard，且所有讀取資料的環境都必須安裝
+JSON_COMPRESSION_CODEC = os.getenv('JSON_COMPRESSION_CODEC', 'zlib')
+JSON_COMPRESSION_LEVEL = int(os.getenv('JSON_COMPRESSION_LEVEL', '6'))
+JSON_COMPRESSION_MIN_BYTES = int(os.getenv('JSON_COMPRESSION_MIN_BYTES', '64'))
+JSON_DICTIONARY_DIR = Path(os.getenv('JSON_DICTIONARY_DIR', BASE_DIR / 'app' / 'json_dictionaries'))
+
+# RecommendationRequest 保存天數與封存檔目錄（manage.py archive_recommendations）
+RECOMMENDATION_RETENTION_DAYS = float(os.getenv('RECOMMENDATION_RETENTION_DAYS', '180'))
+RECOMMENDATION_ARCHIVE_DIR = Path(os.getenv('RECOMMENDATION_ARCHIVE_DIR', BASE_DIR / 'archive'))
+
+# 跨 worker 共用的商品目錄快照（見 app/catalog_snapshot.py），以 manage.py build_catalog_snapshot 重建；
+# 檔案不存在或 Product 儲存 / 刪除後由請求自動重建（AUTO_BUILD），worker 每 CATALOG_SNAPSHOT_CHECK_SEC 秒檢查是否有新版本
+CATALOG_SNAPSHOT_ENABLED = os.getenv('CATALOG_SNAPSHOT_ENABLED', 'True').lower() == 'true'
+CATALOG_SNAPSHOT_PATH = Path(os.getenv('CATALOG_SNAPSHOT_PATH', BASE_DIR / 'cache' / 'catalog.snapshot'))
+CATALOG_SNAPSHOT_INCLUDE_PRODUCTS = os.getenv('CATALOG_SNAPSHOT_INCLUDE_PRODUCTS', 'True').lower() == 'true'
+CATALOG_SNAPSHOT_AUTO_BUILD = os.getenv('CATALOG_SNAPSHOT_AUTO_BUILD', 'True').lower() == 'true'
+CATALOG_SNAPSHOT_CHECK_SEC = float(os.getenv('CATALOG_SNAPSHOT_CHECK_SEC', '5'))
+
+# 商品縮圖代理 /media/thumb/<product_id>/<size>/（見 app/thumbnails.py）
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv('THUMBNAIL_SIZES', '128,256,512').split(','))
+THUMBNAIL_CACHE_DIR = Path(os.getenv('THUMBNAIL_CACHE_DIR', BASE_DIR / 'cache' / 'thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# 同一網址多久後重新下載來源圖片（秒）
+THUMBNAIL_SOURCE_TTL = float(os.getenv('THUMBNAIL_SOURCE_TTL', str(7 * 86400)))
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv('THUMBNAIL_FETCH_TIMEOUT', '10'))
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.getenv('THUMBNAIL_MAX_SOURCE_BYTES', str(15 * 1024 * 1024)))
+# 允許下載解析到私有 / loopback 位址的來源圖片（僅供本機測試，正式環境必須為 False）
+THUMBNAIL_ALLOW_PRIVATE_SOURCES = os.getenv('THUMBNAIL_ALLOW_PRIVATE_SOURCES', 'False').lower() == 'true'
+# 瀏覽器快取秒數；連結帶 ?v=<圖片網址雜湊>（Product.thumbnail_url），商品換圖後網址會改變
+THUMBNAIL_MAX_AGE = int(os.getenv('THUMBNAIL_MAX_AGE', str(365 * 86400)))
+